@@ -1,3 +1,6 @@
+import glob
+import os
+
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -19,9 +22,15 @@ correlation = pd.read_csv(
     parse_dates=["date"]
 )
 
-news = pd.read_csv(
-    "data/processed/news_worker_1.csv",
-    parse_dates=["date"]
+# Un CSV por proceso de trabajo (news_worker_<host>_<pid>.csv)
+news = pd.concat(
+    [
+        pd.read_csv(path, parse_dates=["date"]).assign(
+            worker=os.path.basename(path)[len("news_worker_"):-len(".csv")]
+        )
+        for path in sorted(glob.glob("data/processed/news_worker_*.csv"))
+    ],
+    ignore_index=True
 )
 
 colcap = pd.read_csv(
@@ -107,15 +116,7 @@ st.pyplot(fig3)
 # =====================================================
 st.header("4. Capacidad del sistema")
 
-worker_data = {
-    "worker_1": len(news)
-}
-
-workers_df = pd.DataFrame.from_dict(
-    worker_data,
-    orient="index",
-    columns=["Noticias procesadas"]
-)
+workers_df = news["worker"].value_counts().sort_index().to_frame("Noticias procesadas")
 
 fig4, ax = plt.subplots(figsize=(6, 4))
 workers_df.plot(kind="bar", ax=ax, legend=False)
@@ -1,15 +1,51 @@
 # analysis.py
 
+import os
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import logging
 
+from incremental import CSV_CHUNKSIZE, GROUP_KEYS, STR_COLUMNS, daily_groups, merge_groups
+from correlation_engine import (CORR_MIN_PERIODS, align_series, group_correlations, lag_correlations,
+                                log_lag_summary, rolling_correlations)
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 DATA_RAW = Path("/data/raw")
 DATA_PROCESSED = Path("/data/processed")
 DATA_RESULTS = Path("/data/results")
 
+# Dataset Parquet de los workers (OUTPUT_FORMAT=parquet), particionado crawl=/day=
+NEWS_DATASET = DATA_PROCESSED / "news"
+# Filtros opcionales: crawls separados por coma y rango de días YYYY-MM-DD (inclusive)
+NEWS_CRAWLS = [c for c in os.environ.get("NEWS_CRAWLS", "").split(",") if c]
+NEWS_DATE_FROM = os.environ.get("NEWS_DATE_FROM") or None
+NEWS_DATE_TO = os.environ.get("NEWS_DATE_TO") or None
+
+# Conteos de palabras clave por categoría que agregan los workers a cada noticia
+KEYWORD_COLUMNS = ["kw_mercados", "kw_divisas", "kw_fiscal", "kw_energia"]
+
+# Agregados diarios parciales que publican los workers, uno por archivo de origen (agg_<origen>.json)
+AGGREGATES_DIR = DATA_PROCESSED / "aggregates"
+
+# De dónde salen las noticias por día:
+# - "aggregates":  sidecars de los workers, sin leer ninguna noticia;
+# - "incremental": solo las filas nuevas de cada archivo de los workers desde la
+#                  corrida anterior (ver incremental.py);
+# - "full":        relee todo el Parquet y los CSV;
+# - "auto":        aggregates si hay sidecars y, si no, incremental.
+NEWS_LOAD_MODE = os.environ.get("NEWS_LOAD_MODE", "auto")
+INCREMENTAL_STATE = DATA_RESULTS / ".incremental" / "state.json"
+
+# Correlación por dominio × sección (correlation_by_group.csv); los grupos con menos
+# de GROUP_MIN_NEWS noticias no entran al ranking
+GROUPED_CORRELATION = os.environ.get("GROUPED_CORRELATION", "1") == "1"
+GROUP_MIN_NEWS = int(os.environ.get("GROUP_MIN_NEWS", "20"))
+
+# Procesos para leer los CSV de workers en paralelo (uno por archivo); 0 = automático
+NEWS_LOAD_WORKERS = int(os.environ.get("NEWS_LOAD_WORKERS", "0"))
+
 DATA_RESULTS.mkdir(parents=True, exist_ok=True)
 
 # --------------------------------------------------
@@ -33,106 +69,201 @@ def load_colcap(path="/data/raw/colcap.csv"):
 # 2. Cargar noticias procesadas
 # --------------------------------------------------
 
-def load_news():
-    """Load news from all worker CSV files and combine them."""
+def _news_dataset_scan(columns, crawls, date_from, date_to):
+    """Dataset Parquet, columnas existentes y filtro (crawl, día y no duplicados) para leerlo."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    partitioning = ds.partitioning(pa.schema([("crawl", pa.string()), ("day", pa.string())]), flavor="hive")
+    dataset = ds.dataset(str(NEWS_DATASET), format="parquet", partitioning=partitioning)
+
+    condition = None
+    for expression in (
+        ds.field("crawl").isin(crawls) if crawls else None,
+        ds.field("day") >= date_from if date_from else None,
+        ds.field("day") <= date_to if date_to else None,
+    ):
+        if expression is not None:
+            condition = expression if condition is None else condition & expression
+
+    # Los casi duplicados marcados por el worker (DEDUP_MODE=flag) no cuentan
+    not_duplicate = ds.field("duplicate_of").is_null()
+    condition = not_duplicate if condition is None else condition & not_duplicate
+    return dataset, columns + ["crawl"], condition
+
+
+def load_aggregate_groups():
+    """
+    Combina los agregados parciales de los workers en grupos día × crawl ×
+    dominio × sección (noticias y menciones por categoría), sin leer ninguna
+    noticia. Hay un sidecar por archivo de origen (reprocesarlo lo reemplaza),
+    así que cada archivo se cuenta una sola vez. Retorna None si no hay sidecars.
+    """
+    import glob
+    import json
+
+    sidecars = glob.glob(str(AGGREGATES_DIR / "agg_*.json"))
+    if not sidecars:
+        return None
+
+    groups = []
+    for sidecar in sidecars:
+        try:
+            with open(sidecar, "r", encoding="utf-8") as f:
+                groups.extend(json.load(f)["groups"])
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Error leyendo {sidecar}: {e}")
+
+    rows = [[row["day"], row["crawl"], row["domain"], row["section"], row["count"]]
+            + [row[c] for c in KEYWORD_COLUMNS]
+            for row in groups]
+    logging.info(f"Agregados: {len(sidecars)} archivos de origen ({len(rows)} grupos)")
+    return groups_frame(rows)
+
+
+def load_incremental_groups():
+    """
+    Grupos día × crawl × dominio × sección a partir del estado incremental,
+    leyendo solo lo que los workers agregaron desde la corrida anterior (ver
+    incremental.py).
+    """
+    from incremental import update_daily_state
+
+    groups, stats = update_daily_state(DATA_PROCESSED, NEWS_DATASET, INCREMENTAL_STATE, KEYWORD_COLUMNS)
+    logging.info(f"Incremental: {stats['new']} archivos nuevos, {stats['appended']} con filas nuevas, "
+                 f"{stats['reset']} releídos, {stats['removed']} eliminados, {stats['unchanged']} sin cambios "
+                 f"({stats['bytes'] / 1024 / 1024:.1f} MB leídos)")
+    return groups_frame(groups)
+
+
+def groups_frame(groups):
+    """Grupos [día, crawl, dominio, sección, noticias, kw_*...] como DataFrame, con los filtros NEWS_*."""
+    df = pd.DataFrame(groups, columns=GROUP_KEYS + ["news_count"] + KEYWORD_COLUMNS)
+    if NEWS_CRAWLS:
+        df = df[df["crawl"].isin(NEWS_CRAWLS)]
+    if NEWS_DATE_FROM:
+        df = df[df["day"] >= NEWS_DATE_FROM]
+    if NEWS_DATE_TO:
+        df = df[df["day"] <= NEWS_DATE_TO]
+    return df
+
+
+def daily_frame(groups_df):
+    """Grupos -> noticias por día (news_count y menciones por categoría)."""
+    if groups_df.empty:
+        return pd.DataFrame(columns=["date", "news_count"] + KEYWORD_COLUMNS)
+
+    daily_news = groups_df.groupby("day")[["news_count"] + KEYWORD_COLUMNS].sum().reset_index()
+    daily_news["date"] = pd.to_datetime(daily_news["day"], format="%Y-%m-%d")
+    return daily_news[["date", "news_count"] + KEYWORD_COLUMNS]
+
+
+def _csv_daily_groups(csv_file):
+    """
+    Lee un CSV de worker por bloques de CSV_CHUNKSIZE filas y reduce cada
+    bloque a grupos por día antes de leer el siguiente. Retorna (grupos, noticias).
+    """
+    rows, articles = [], 0
     try:
-        logging.info(f"Buscando archivos de noticias en {DATA_PROCESSED}")
-        
-        # Find all worker CSV files
-        import glob
-        csv_files = glob.glob(str(DATA_PROCESSED / "news_worker_*.csv"))
-        
-        if not csv_files:
-            logging.warning("No se encontraron archivos de noticias de workers.")
-            return pd.DataFrame(columns=["date", "crawl", "text"])
-        
-        logging.info(f"Encontrados {len(csv_files)} archivos de workers")
-        
-        # Load and combine all CSV files
-        dfs = []
-        for csv_file in csv_files:
-            try:
-                # Optimization: Only load necessary columns to avoid OOM
-                df = pd.read_csv(
-                    csv_file, 
-                    usecols=lambda c: c in ["date", "crawl"],
-                    on_bad_lines='skip'
-                )
-                dfs.append(df)
-                logging.info(f"Cargadas {len(df)} noticias de {csv_file} (Optimizada memoria)")
-            except Exception as e:
-                logging.warning(f"Error leyendo {csv_file}: {e}")
-                continue
-        
-        if not dfs:
-            logging.warning("No se pudieron cargar datos de ningún archivo.")
-            return pd.DataFrame(columns=["date", "crawl", "text"])
-        
-        # Combine all dataframes
-        df = pd.concat(dfs, ignore_index=True)
-        logging.info(f"Total de noticias combinadas: {len(df)}")
-        
-        # Convertir fecha
-        df["date"] = pd.to_datetime(df["date"]).dt.tz_localize(None)
-        
-        # Mostrar distribución por crawl si existe la columna
-        if "crawl" in df.columns:
-            crawl_counts = df["crawl"].value_counts()
-            logging.info("Distribución de noticias por crawl:")
-            for crawl, count in crawl_counts.items():
-                logging.info(f"  {crawl}: {count} noticias")
-        
-        return df
+        usecols = ["date", "crawl", "domain", "section", "duplicate"] + KEYWORD_COLUMNS
+        for chunk in pd.read_csv(csv_file, usecols=lambda c: c in usecols, dtype=STR_COLUMNS,
+                                 on_bad_lines="skip", chunksize=CSV_CHUNKSIZE):
+            articles += len(chunk)
+            rows = merge_groups(rows, daily_groups(chunk, None, KEYWORD_COLUMNS))
     except Exception as e:
-        logging.error(f"Error cargando noticias: {e}")
-        return pd.DataFrame(columns=["date", "crawl", "text"])
+        logging.warning(f"Error leyendo {csv_file}: {e}")
+    return rows, articles
 
 
-# --------------------------------------------------
-# 3. Agregar noticias por día
-# --------------------------------------------------
+def load_news_groups():
+    """
+    Grupos día × crawl × dominio × sección leyendo todo (Parquet y CSV) sin
+    armar un DataFrame por noticia: el Parquet se recorre por lotes y los CSV
+    por bloques, en paralelo entre archivos. La memoria depende de la cantidad
+    de grupos, no de noticias.
+    """
+    import glob
+
+    groups, articles = [], 0
+    if NEWS_DATASET.exists():
+        try:
+            dataset, columns, condition = _news_dataset_scan(["date", "domain", "section"] + KEYWORD_COLUMNS,
+                                                             NEWS_CRAWLS, NEWS_DATE_FROM, NEWS_DATE_TO)
+            # Sin archivos el esquema solo trae crawl/day y el filtro no se puede resolver
+            batches = dataset.to_batches(columns=columns, filter=condition) if dataset.files else []
+            for batch in batches:
+                if batch.num_rows == 0:
+                    continue
+                df = batch.to_pandas()
+                df["date"] = df["date"].dt.strftime("%Y-%m-%d")
+                articles += len(df)
+                groups = merge_groups(groups, daily_groups(df, None, KEYWORD_COLUMNS))
+        except ImportError:
+            logging.warning(f"pyarrow no está instalado; se omite {NEWS_DATASET}")
+
+    csv_files = sorted(glob.glob(str(DATA_PROCESSED / "news_worker_*.csv")))
+    if csv_files:
+        workers = NEWS_LOAD_WORKERS or min(len(csv_files), os.cpu_count() or 1, 4)
+        logging.info(f"Leyendo {len(csv_files)} archivos de workers con {workers} procesos")
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_csv_daily_groups, csv_files))
+        else:
+            results = [_csv_daily_groups(csv_file) for csv_file in csv_files]
+        for rows, count in results:
+            articles += count
+            groups = merge_groups(groups, rows)
+
+    logging.info(f"Total de noticias leídas: {articles} ({len(groups)} grupos día × crawl × dominio × sección)")
+    return groups_frame(groups)
 
-def aggregate_news(df_news):
-    if df_news.empty:
-        return pd.DataFrame(columns=["date", "news_count"])
-        
-    # Agrupar por fecha (día)
-    df_news["day"] = df_news["date"].dt.date
-    
-    daily_news = (
-        df_news
-        .groupby("day")
-        .size()
-        .reset_index(name="news_count")
-    )
-    daily_news["date"] = pd.to_datetime(daily_news["day"])
-    return daily_news[["date", "news_count"]]
+
+def load_groups(mode=NEWS_LOAD_MODE):
+    """Grupos día × crawl × dominio × sección según NEWS_LOAD_MODE."""
+    logging.info(f"Carga de noticias en modo {mode}")
+    if mode in ("auto", "aggregates"):
+        groups_df = load_aggregate_groups()
+        if groups_df is not None:
+            return groups_df
+        if mode == "aggregates":
+            logging.warning(f"Sin sidecars en {AGGREGATES_DIR}; se leen todas las noticias")
+            return load_news_groups()
+    if mode in ("auto", "incremental"):
+        return load_incremental_groups()
+    if mode != "full":
+        logging.warning(f"NEWS_LOAD_MODE desconocido: {mode} (usar auto, aggregates, incremental o full); "
+                        f"se leen todas las noticias")
+    return load_news_groups()
 
 
 # --------------------------------------------------
-# 4. Calcular correlación
+# 3. Calcular correlación
 # --------------------------------------------------
 
-def compute_correlation(colcap_df, news_df):
+def demo_date_offset(colcap_df, news_df):
+    """
+    MODO DEMO: si las noticias casi no coinciden en fechas con COLCAP, retorna el
+    desplazamiento que alinea su último día con el de COLCAP; si no, None.
+    """
     if colcap_df.empty or news_df.empty:
-        logging.warning("Dataframes vacíos, no se puede calcular correlación")
-        return pd.DataFrame(), 0.0
+        return None
 
     # Validar fechas antes de unir
     common_dates = set(colcap_df["date"]).intersection(set(news_df["date"]))
-    
-    if len(common_dates) < 2:
-        logging.warning(f"Poca coincidencia de fechas ({len(common_dates)} días).")
-        logging.warning(f"Rango Noticias: {news_df['date'].min()} a {news_df['date'].max()}")
-        logging.warning(f"Rango COLCAP: {colcap_df['date'].min()} a {colcap_df['date'].max()}")
-        
-        # MODO DEMO: Alinear fechas automáticamente
-        logging.warning("ACTIVANDO MODO DEMO: Ajustando fechas de noticias para coincidir con COLCAP...")
-        
-        offset = colcap_df["date"].max() - news_df["date"].max()
-        news_df["date"] = news_df["date"] + offset
-        
-        logging.info(f"Fechas de noticias desplazadas por {offset} para coincidir.")
+    if len(common_dates) >= 2:
+        return None
+
+    logging.warning(f"Poca coincidencia de fechas ({len(common_dates)} días).")
+    logging.warning(f"Rango Noticias: {news_df['date'].min()} a {news_df['date'].max()}")
+    logging.warning(f"Rango COLCAP: {colcap_df['date'].min()} a {colcap_df['date'].max()}")
+    logging.warning("ACTIVANDO MODO DEMO: Ajustando fechas de noticias para coincidir con COLCAP...")
+    return colcap_df["date"].max() - news_df["date"].max()
+
+
+def compute_correlation(colcap_df, news_df):
+    if colcap_df.empty or news_df.empty:
+        logging.warning("Dataframes vacíos, no se puede calcular correlación")
+        return pd.DataFrame(), 0.0
 
     # Unir por fecha
     merged = pd.merge(colcap_df, news_df, on="date", how="inner")
@@ -160,15 +291,55 @@ def compute_correlation(colcap_df, news_df):
     
     return merged, corr
 
+def write_lag_analysis(colcap_df, daily_news):
+    """Matriz de correlación por rezago y correlaciones móviles, junto a correlation.csv."""
+    signal_columns = ["news_count"] + [c for c in KEYWORD_COLUMNS if c in daily_news.columns]
+    aligned = align_series(colcap_df, daily_news, signal_columns)
+    if len(aligned) < CORR_MIN_PERIODS:
+        logging.warning(f"Solo {len(aligned)} días hábiles con noticias; se omiten rezagos y ventanas móviles")
+        return
+
+    lags_df = lag_correlations(aligned, signal_columns)
+    lags_path = DATA_RESULTS / "correlation_lags.csv"
+    lags_df.to_csv(lags_path, index=False)
+    log_lag_summary(lags_df, signal_columns)
+
+    rolling_path = DATA_RESULTS / "correlation_rolling.csv"
+    rolling_correlations(aligned, signal_columns).to_csv(rolling_path, index=False)
+    logging.info(f"Correlaciones por rezago en {lags_path} y móviles en {rolling_path}")
+
+
+def write_group_correlations(colcap_df, groups_df):
+    """Ranking de correlación por dominio × sección (una sola pasada para todos los grupos)."""
+    ranking = group_correlations(colcap_df, groups_df, min_news=GROUP_MIN_NEWS)
+    if ranking.empty:
+        logging.warning("Sin grupos dominio × sección con datos suficientes para correlación")
+        return
+    output_path = DATA_RESULTS / "correlation_by_group.csv"
+    ranking.to_csv(output_path, index=False)
+    logging.info(f"Correlación por dominio × sección ({len(ranking)} grupos) guardada en {output_path}")
+    for row in ranking.head(5).itertuples(index=False):
+        logging.info(f"  #{row.rank} {row.domain or '?'} /{row.section}: r(retorno)={row.corr_return:.4f} "
+                     f"r(close)={row.corr_close:.4f} ({row.news_count} noticias)")
+
+
 # --------------------------------------------------
 # MAIN
 # --------------------------------------------------
 
 if __name__ == "__main__":
     colcap_df = load_colcap()
-    news_df = load_news()
 
-    daily_news = aggregate_news(news_df)
+    groups_df = load_groups()
+    daily_news = daily_frame(groups_df)
+
+    # El desplazamiento del modo demo se aplica una vez, a la serie diaria y a los grupos
+    offset = demo_date_offset(colcap_df, daily_news)
+    if offset is not None:
+        daily_news["date"] = daily_news["date"] + offset
+        groups_df = groups_df.assign(
+            day=(pd.to_datetime(groups_df["day"], format="%Y-%m-%d") + offset).dt.strftime("%Y-%m-%d"))
+        logging.info(f"Fechas de noticias desplazadas por {offset} para coincidir.")
 
     merged, corr = compute_correlation(colcap_df, daily_news)
 
@@ -177,5 +348,11 @@ if __name__ == "__main__":
         merged.to_csv(output_path, index=False)
         logging.info(f"Resultados guardados en {output_path}")
         print(f"Correlación COLCAP vs Cantidad Noticias: {corr:.4f}")
+        for column in KEYWORD_COLUMNS:
+            if column in merged.columns and len(merged) >= 2:
+                print(f"Correlación COLCAP vs Menciones {column[3:]}: {merged['close'].corr(merged[column]):.4f}")
+        write_lag_analysis(colcap_df, daily_news)
+        if GROUPED_CORRELATION:
+            write_group_correlations(colcap_df, groups_df)
     else:
         logging.warning("No se generaron resultados de correlación.")
@@ -0,0 +1,196 @@
+"""
+Correlaciones con rezago y por ventana móvil entre noticias y COLCAP.
+
+Las series se alinean por día hábil (los días del COLCAP) dentro del rango con
+noticias; un día hábil sin noticias cuenta como 0. Contra cada señal de
+noticias (news_count y kw_*) se comparan dos objetivos: el nivel (close) y el
+retorno logarítmico diario (return).
+
+- Rezagos: corr(señal[t], objetivo[t + k]) para k en [CORR_LAG_MIN,
+  CORR_LAG_MAX]. k > 0 significa que las noticias anticipan al mercado. Todos
+  los rezagos y señales se calculan juntos con índices desplazados, sin iterar.
+- Ventanas móviles: Pearson en ventanas de CORR_WINDOWS días hábiles, con sumas
+  acumuladas (Σx, Σy, Σx², Σy², Σxy): cada ventana cuesta O(1) sin importar
+  su tamaño.
+Los NaN (p. ej. el primer retorno) se excluyen par a par.
+"""
+import logging
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+CORR_LAG_MIN = int(os.environ.get("CORR_LAG_MIN", "-10"))
+CORR_LAG_MAX = int(os.environ.get("CORR_LAG_MAX", "10"))
+CORR_WINDOWS = [int(w) for w in os.environ.get("CORR_WINDOWS", "20,60").split(",") if w]
+# Mínimo de pares válidos para reportar una correlación
+CORR_MIN_PERIODS = int(os.environ.get("CORR_MIN_PERIODS", "5"))
+
+TARGETS = ["close", "return"]
+
+
+def _trading_days(colcap_df, date_min, date_max):
+    """close y retorno logarítmico de cada día hábil del COLCAP entre date_min y date_max."""
+    prices = colcap_df.groupby("date")["close"].last().sort_index()
+    prices = prices[(prices.index >= date_min) & (prices.index <= date_max)]
+
+    targets = pd.DataFrame({"close": prices.astype(float)})
+    close = targets["close"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_close = np.where(close > 0, np.log(close), np.nan)
+    targets["return"] = np.concatenate([[np.nan], np.diff(log_close)])
+    return targets
+
+
+def align_series(colcap_df, daily_news, signal_columns):
+    """Días hábiles del COLCAP dentro del rango con noticias, con las señales (0 si no hubo noticias)."""
+    if colcap_df.empty or daily_news.empty:
+        return pd.DataFrame(columns=["date"] + TARGETS + signal_columns)
+    news = daily_news.groupby("date")[signal_columns].sum()
+    aligned = _trading_days(colcap_df, news.index.min(), news.index.max())
+    aligned = aligned.join(news, how="left").fillna({c: 0 for c in signal_columns})
+    return aligned.reset_index().rename(columns={"index": "date"})
+
+
+def _pearson(x, y, min_periods):
+    """Pearson sobre el último eje excluyendo NaN par a par; admite broadcasting."""
+    valid = ~(np.isnan(x) | np.isnan(y))
+    n = valid.sum(axis=-1)
+    x0 = np.where(valid, x, 0.0)
+    y0 = np.where(valid, y, 0.0)
+    sx, sy = x0.sum(axis=-1), y0.sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = (x0 * y0).sum(axis=-1) - sx * sy / n
+        var_x = (x0 * x0).sum(axis=-1) - sx * sx / n
+        var_y = (y0 * y0).sum(axis=-1) - sy * sy / n
+        r = cov / np.sqrt(var_x * var_y)
+    return np.where((n >= min_periods) & (var_x > 0) & (var_y > 0), r, np.nan)
+
+
+def _centered(values):
+    """Resta la media para que las sumas de cuadrados no pierdan precisión."""
+    values = np.asarray(values, dtype=float)
+    with warnings.catch_warnings():
+        # Filas sin ningún valor (p. ej. una serie vacía) quedan en NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return values - np.nanmean(values, axis=-1, keepdims=True)
+
+
+def lag_correlations(aligned, signal_columns, lag_min=CORR_LAG_MIN, lag_max=CORR_LAG_MAX,
+                     min_periods=CORR_MIN_PERIODS):
+    """Matriz rezago × (señal, objetivo) con corr(señal[t], objetivo[t + rezago])."""
+    lags = np.arange(lag_min, lag_max + 1)
+    n = len(aligned)
+    signals = _centered(aligned[signal_columns].to_numpy(dtype=float).T)  # (S, n)
+
+    # Índice desplazado de cada rezago: (L, n); fuera de rango -> NaN
+    shifted_index = np.arange(n)[None, :] + lags[:, None]
+    in_range = (shifted_index >= 0) & (shifted_index < n)
+    shifted_index = np.clip(shifted_index, 0, max(n - 1, 0))
+
+    result = {"lag": lags}
+    for target in TARGETS:
+        values = _centered(aligned[target].to_numpy(dtype=float))
+        shifted = np.where(in_range, values[shifted_index], np.nan) if n else np.empty((len(lags), 0))
+        matrix = _pearson(signals[:, None, :], shifted[None, :, :], min_periods)  # (S, L)
+        for column, row in zip(signal_columns, matrix):
+            result[f"{column}_vs_{target}"] = row
+    return pd.DataFrame(result)
+
+
+def rolling_correlations(aligned, signal_columns, windows=CORR_WINDOWS, min_periods=CORR_MIN_PERIODS):
+    """
+    Correlación móvil de cada (señal, objetivo) para cada ventana, en una sola
+    pasada de sumas acumuladas por ventana. Columna <señal>_vs_<objetivo>_w<ventana>.
+    """
+    result = pd.DataFrame({"date": aligned["date"]})
+    n = len(aligned)
+    if n == 0:
+        return result
+
+    signals = _centered(aligned[signal_columns].to_numpy(dtype=float).T)
+    targets = _centered(np.vstack([aligned[t].to_numpy(dtype=float) for t in TARGETS]))
+    # Todas las combinaciones (señal, objetivo) apiladas: (P, n)
+    x = np.repeat(signals, len(TARGETS), axis=0)
+    y = np.tile(targets, (len(signal_columns), 1))
+    names = [f"{s}_vs_{t}" for s in signal_columns for t in TARGETS]
+
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x0, y0 = np.where(valid, x, 0.0), np.where(valid, y, 0.0)
+    sums = np.stack([valid.astype(float), x0, y0, x0 * x0, y0 * y0, x0 * y0])  # (6, P, n)
+    cumulative = np.concatenate([np.zeros(sums.shape[:2] + (1,)), np.cumsum(sums, axis=-1)], axis=-1)
+
+    for window in windows:
+        if window > n:
+            logging.warning(f"Ventana de {window} días mayor que la serie ({n} días); se omite")
+            continue
+        # Suma de cada ventana que termina en t = acumulado[t+1] - acumulado[t+1-window]
+        w = cumulative[..., window:] - cumulative[..., :-window]  # (6, P, n - window + 1)
+        count, sx, sy, sxx, syy, sxy = w
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = count * sxy - sx * sy
+            var_x = count * sxx - sx * sx
+            var_y = count * syy - sy * sy
+            r = cov / np.sqrt(var_x * var_y)
+        # Varianza ~0 relativa a Σx² (ventana con señal constante, salvo redondeo) -> NaN
+        ok = (count >= max(min_periods, 2)) & (var_x > 1e-10 * count * sxx) & (var_y > 1e-10 * count * syy)
+        r = np.clip(np.where(ok, r, np.nan), -1.0, 1.0)
+        padded = np.full((len(names), n), np.nan)
+        padded[:, window - 1:] = r
+        for name, row in zip(names, padded):
+            result[f"{name}_w{window}"] = row
+    return result
+
+
+def group_correlations(colcap_df, groups_df, min_news=1, min_periods=CORR_MIN_PERIODS):
+    """
+    Correlación de las noticias diarias de cada dominio × sección contra close
+    y retorno. Un solo pivot arma la matriz grupos × días hábiles y todas las
+    correlaciones salen de una operación vectorizada. Ranking por |corr_return|
+    (los NaN al final; a igual correlación, más noticias primero).
+    """
+    columns = ["rank", "domain", "section", "news_count", "days_with_news", "trading_days",
+               "corr_close", "corr_return"]
+    if colcap_df.empty or groups_df.empty:
+        return pd.DataFrame(columns=columns)
+
+    counts = groups_df.pivot_table(index="day", columns=["domain", "section"], values="news_count",
+                                   aggfunc="sum", fill_value=0)
+    counts.index = pd.to_datetime(counts.index)
+    totals = counts.sum()
+    counts = counts.loc[:, totals >= min_news]
+    if counts.shape[1] == 0:
+        return pd.DataFrame(columns=columns)
+
+    targets = _trading_days(colcap_df, counts.index.min(), counts.index.max())
+    counts = counts.reindex(targets.index, fill_value=0)
+    matrix = _centered(counts.to_numpy(dtype=float).T)  # (G, n)
+
+    result = pd.DataFrame({
+        "domain": counts.columns.get_level_values("domain"),
+        "section": counts.columns.get_level_values("section"),
+        "news_count": totals[counts.columns].to_numpy(dtype=int),
+        "days_with_news": (counts.to_numpy() > 0).sum(axis=0),
+        "trading_days": len(targets),
+    })
+    for target in TARGETS:
+        values = _centered(targets[target].to_numpy(dtype=float))
+        result[f"corr_{target}"] = _pearson(matrix, values[None, :], min_periods)
+
+    result = (result.assign(_strength=result["corr_return"].abs())
+              .sort_values(["_strength", "news_count"], ascending=False, na_position="last")
+              .drop(columns="_strength")
+              .reset_index(drop=True))
+    result.insert(0, "rank", np.arange(1, len(result) + 1))
+    return result[columns]
+
+
+def log_lag_summary(lags_df, signal_columns):
+    """Rezago de mayor |correlación| de cada señal contra el retorno."""
+    for column in signal_columns:
+        series = lags_df.set_index("lag")[f"{column}_vs_return"].dropna()
+        if series.empty:
+            continue
+        best = series.abs().idxmax()
+        logging.info(f"{column} vs retorno: mayor |r| = {series[best]:.4f} con rezago {best:+d} días hábiles")
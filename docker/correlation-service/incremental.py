@@ -0,0 +1,235 @@
+"""
+Agregación diaria incremental de las noticias procesadas.
+
+El estado vive en /data/results/.incremental/state.json y guarda, por cada
+archivo de salida de los workers:
+- offset: hasta qué byte ya se leyó (watermark) e inode, para detectar si el
+  archivo se reemplazó o se truncó;
+- header: columnas del CSV (los workers rotan de archivo si cambian);
+- groups: [día, crawl, dominio, sección, noticias, kw_*...] ya agregados de lo leído.
+
+En cada corrida solo se leen los bytes nuevos de los news_worker_*.csv (y los
+.parquet nuevos o reemplazados), se suman al estado y se descartan los
+archivos que ya no existen. El tiempo depende de lo que cambió, no del total.
+
+Un worker puede estar escribiendo el CSV mientras se lee: se consume hasta el
+último salto de línea que cierra un registro y el resto queda para la próxima
+corrida. Lo nuevo se lee por bloques de CSV_READ_BLOCK bytes (el registro
+incompleto al final de un bloque pasa al siguiente), así que la memoria no
+depende del tamaño del CSV aunque se relea entero. Como el texto de una noticia puede tener saltos de línea entre
+comillas, un salto de línea es fin de registro solo si la cantidad de comillas
+desde el offset es par (el escape "" suma dos y no cambia la paridad).
+"""
+import io
+import json
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+
+STATE_VERSION = 1
+# Claves de cada grupo
+GROUP_KEYS = ["day", "crawl", "domain", "section"]
+# Columnas de texto de los CSV de workers (se leen sin inferir tipos)
+STR_COLUMNS = {"date": str, "crawl": str, "domain": str, "section": str}
+# Filas de CSV por bloque: cada bloque se reduce a grupos por día antes de leer el siguiente
+CSV_CHUNKSIZE = int(os.environ.get("NEWS_CSV_CHUNKSIZE", "20000"))
+# Bytes de CSV leídos de una vez al avanzar el watermark
+CSV_READ_BLOCK = int(os.environ.get("NEWS_CSV_READ_BLOCK", str(16 * 1024 * 1024)))
+
+
+def load_state(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") == STATE_VERSION:
+            return state
+        logging.warning(f"Estado incremental con otra versión en {path}; se recalcula desde cero")
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logging.warning(f"Estado incremental ilegible en {path} ({e}); se recalcula desde cero")
+    return {"version": STATE_VERSION, "files": {}}
+
+
+def save_state(path, state):
+    """Escritura atómica (temp+rename): una corrida interrumpida deja el estado anterior."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def complete_records_end(chunk):
+    """
+    Posición después del último salto de línea que cierra un registro CSV en
+    `chunk` (que empieza en un límite de registro); 0 si no hay ninguno.
+    """
+    quotes_after = 0
+    end = len(chunk)
+    total_quotes = chunk.count(b'"')
+    while True:
+        newline = chunk.rfind(b"\n", 0, end)
+        if newline < 0:
+            return 0
+        quotes_after += chunk.count(b'"', newline, end)
+        if (total_quotes - quotes_after) % 2 == 0:
+            return newline + 1
+        end = newline
+
+
+def daily_groups(df, crawl, keyword_columns):
+    """
+    Filas [día, crawl, dominio, sección, noticias, kw_*...] de un DataFrame con
+    date (ISO) y crawl (o el `crawl` dado), y opcionalmente domain y section.
+    """
+    if df.empty:
+        return []
+    if "duplicate" in df.columns:
+        # Los casi duplicados marcados por el worker (DEDUP_MODE=flag) no cuentan
+        df = df[df["duplicate"] != 1]
+    df = df.assign(day=df["date"].astype(str).str[:10])
+    df = df[df["day"].str.match(r"\d{4}-\d{2}-\d{2}$")]
+    df = df.assign(crawl=crawl) if crawl is not None else df.assign(crawl=df["crawl"].fillna("unknown"))
+    # Los CSV de la versión original (date,crawl,text) no traen dominio, sección ni kw_*
+    df = df.assign(**{c: df[c].fillna("") if c in df.columns else "" for c in ["domain", "section"]})
+    for column in keyword_columns:
+        if column not in df.columns:
+            df = df.assign(**{column: 0})
+    grouped = df.groupby(GROUP_KEYS).agg(
+        news_count=("day", "size"), **{c: (c, "sum") for c in keyword_columns}
+    ).reset_index()
+    # Enteros de Python para que el estado se pueda guardar como JSON
+    keys = len(GROUP_KEYS)
+    return [list(row[:keys]) + [int(v) for v in row[keys:]]
+            for row in grouped[GROUP_KEYS + ["news_count"] + keyword_columns].itertuples(index=False)]
+
+
+def merge_groups(existing, new_rows):
+    keys = len(GROUP_KEYS)
+    merged = {tuple(row[:keys]): list(row) for row in existing}
+    for row in new_rows:
+        key = tuple(row[:keys])
+        if key in merged:
+            merged[key][keys:] = [a + b for a, b in zip(merged[key][keys:], row[keys:])]
+        else:
+            merged[key] = list(row)
+    return list(merged.values())
+
+
+def _read_csv_delta(path, offset, header, keyword_columns):
+    """
+    Lee por bloques los registros completos desde el watermark. Retorna
+    (grupos, nuevo offset, encabezado); no toca el estado, así que un error a
+    mitad de lectura no deja el watermark más allá de filas sin contar.
+    """
+    rows = []
+    with open(path, "rb") as f:
+        if header is None:
+            header_line = f.readline()
+            if not header_line.endswith(b"\n"):
+                return [], offset, None  # el worker todavía no terminó de escribir el encabezado
+            header = header_line.decode("utf-8").rstrip("\r\n").split(",")
+            offset = f.tell()
+        usecols = [c for c in header
+                   if c in ["date", "crawl", "domain", "section", "duplicate"] + keyword_columns]
+        f.seek(offset)
+        pending = b""
+        while True:
+            block = f.read(CSV_READ_BLOCK)
+            if not block:
+                break
+            # `pending` empieza en un límite de registro: lo anterior ya se consumió
+            pending += block
+            end = complete_records_end(pending)
+            if end == 0:
+                continue
+            for df in pd.read_csv(io.BytesIO(pending[:end]), header=None, names=header, usecols=usecols,
+                                  dtype=STR_COLUMNS, on_bad_lines="skip", chunksize=CSV_CHUNKSIZE):
+                rows = merge_groups(rows, daily_groups(df, None, keyword_columns))
+            offset += end
+            pending = pending[end:]
+    return rows, offset, header
+
+
+def _read_parquet_file(path, keyword_columns):
+    """Los .parquet se escriben completos (temp+rename): se leen una sola vez."""
+    import pyarrow.parquet as pq
+
+    schema_names = pq.read_schema(path).names
+    columns = [c for c in ["date", "domain", "section", "duplicate_of"] + keyword_columns if c in schema_names]
+    df = pq.read_table(path, columns=columns).to_pandas()
+    if "duplicate_of" in df.columns:
+        df = df[df["duplicate_of"].isna()].drop(columns="duplicate_of")
+    df["date"] = df["date"].dt.strftime("%Y-%m-%d")
+    # crawl sale de la ruta news/crawl=<id>/day=<día>/
+    crawl = next((part[len("crawl="):] for part in Path(path).parts if part.startswith("crawl=")), "unknown")
+    return daily_groups(df, crawl, keyword_columns)
+
+
+def _output_files(processed_dir, dataset_dir):
+    files = {str(p.relative_to(processed_dir)): ("csv", p) for p in processed_dir.glob("news_worker_*.csv")}
+    if dataset_dir.exists():
+        for p in dataset_dir.rglob("*.parquet"):
+            files[str(p.relative_to(processed_dir))] = ("parquet", p)
+    return files
+
+
+def update_daily_state(processed_dir, dataset_dir, state_path, keyword_columns):
+    """
+    Actualiza el estado con lo nuevo desde la última corrida y retorna
+    (grupos [día, crawl, dominio, sección, noticias, kw_*...] de todos los archivos, estadísticas).
+    """
+    state = load_state(state_path)
+    files = state["files"]
+    stats = {"new": 0, "appended": 0, "reset": 0, "removed": 0, "unchanged": 0, "bytes": 0}
+    parquet_missing = False
+
+    current = _output_files(processed_dir, dataset_dir)
+    for name in list(files):
+        if name not in current:
+            del files[name]
+            stats["removed"] += 1
+
+    for name, (kind, path) in sorted(current.items()):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        entry = files.get(name)
+        if entry is not None and (entry["inode"] != st.st_ino or st.st_size < entry["offset"]):
+            # Reemplazado (p. ej. un parquet reescrito al reprocesar) o truncado: se relee entero
+            entry = None
+            stats["reset"] += 1
+        elif entry is None:
+            stats["new"] += 1
+        if entry is not None and st.st_size == entry["offset"]:
+            stats["unchanged"] += 1
+            continue
+        if entry is not None:
+            stats["appended"] += 1
+        if entry is None:
+            entry = {"kind": kind, "inode": st.st_ino, "offset": 0, "header": None, "groups": []}
+
+        # Offset, encabezado y grupos se actualizan juntos y solo si la lectura terminó bien
+        try:
+            if kind == "csv":
+                rows, offset, header = _read_csv_delta(path, entry["offset"], entry["header"], keyword_columns)
+            else:
+                rows, offset, header = _read_parquet_file(path, keyword_columns), st.st_size, None
+        except ImportError:
+            parquet_missing = True
+            continue
+        except Exception as e:
+            logging.warning(f"Error leyendo {path}: {e}")
+            continue
+        stats["bytes"] += offset - entry["offset"]
+        files[name] = dict(entry, offset=offset, header=header, groups=merge_groups(entry["groups"], rows))
+
+    if parquet_missing:
+        logging.warning(f"pyarrow no está instalado; se omiten los .parquet de {dataset_dir}")
+    save_state(state_path, state)
+    groups = [row for entry in files.values() for row in entry["groups"]]
+    return groups, stats
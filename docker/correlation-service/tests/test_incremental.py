@@ -0,0 +1,77 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import incremental  # noqa: E402
+from incremental import update_daily_state  # noqa: E402
+
+KEYWORD_COLUMNS = ["kw_mercados", "kw_divisas", "kw_fiscal", "kw_energia"]
+HEADER = "date,crawl,domain,section,text,relevance," + ",".join(KEYWORD_COLUMNS) + "\n"
+
+
+def _write_csv(path, days):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(HEADER)
+        for i, day in enumerate(days):
+            f.write(f'{day}T10:00:00Z,CC-MAIN-2024-10,eltiempo.com,economia,"noticia {i}",1,1,0,0,0\n')
+
+
+def _total(groups):
+    return sum(row[4] for row in groups)
+
+
+def test_failed_block_is_read_again_next_run(tmp_path, monkeypatch):
+    processed = tmp_path / "processed"
+    processed.mkdir()
+    state_path = tmp_path / "state.json"
+    path = processed / "news_worker_a_1.csv"
+    _write_csv(path, ["2024-03-01"] * 5)
+    groups, _ = update_daily_state(processed, processed / "news", state_path, KEYWORD_COLUMNS)
+    assert _total(groups) == 5
+
+    with open(path, "a", encoding="utf-8") as f:
+        for i in range(40):
+            f.write(f'2024-03-02T10:00:00Z,CC-MAIN-2024-10,eltiempo.com,economia,"nueva {i}",1,0,1,0,0\n')
+
+    # Bloques pequeños: lo agregado se lee en varios y el segundo falla
+    monkeypatch.setattr(incremental, "CSV_READ_BLOCK", 256)
+    read_csv = incremental.pd.read_csv
+    calls = {"n": 0}
+
+    def failing_read_csv(*args, **kwargs):
+        calls["n"] += 1
+        if calls["n"] == 2:
+            raise ValueError("bloque ilegible")
+        return read_csv(*args, **kwargs)
+
+    monkeypatch.setattr(incremental.pd, "read_csv", failing_read_csv)
+    groups, _ = update_daily_state(processed, processed / "news", state_path, KEYWORD_COLUMNS)
+    assert calls["n"] == 2
+    assert _total(groups) == 5
+
+    monkeypatch.setattr(incremental.pd, "read_csv", read_csv)
+    groups, stats = update_daily_state(processed, processed / "news", state_path, KEYWORD_COLUMNS)
+    assert _total(groups) == 45
+    assert stats["appended"] == 1
+
+
+@pytest.mark.parametrize("block", [97, 256, 1 << 20])
+def test_appended_rows_are_counted_once(tmp_path, monkeypatch, block):
+    processed = tmp_path / "processed"
+    processed.mkdir()
+    state_path = tmp_path / "state.json"
+    path = processed / "news_worker_a_1.csv"
+    monkeypatch.setattr(incremental, "CSV_READ_BLOCK", block)
+
+    _write_csv(path, ["2024-03-01"] * 10)
+    groups, _ = update_daily_state(processed, processed / "news", state_path, KEYWORD_COLUMNS)
+    assert _total(groups) == 10
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('2024-03-02T10:00:00Z,CC-MAIN-2024-10,eltiempo.com,economia,"línea\ncon salto",1,0,1,0,0\n')
+    groups, stats = update_daily_state(processed, processed / "news", state_path, KEYWORD_COLUMNS)
+    assert _total(groups) == 11
+    assert stats["appended"] == 1
@@ -0,0 +1,82 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+
+class _OpenBundle:
+    def __init__(self, final_path):
+        self.final_path = final_path
+        self.tmp_path = final_path.with_name(f".{final_path.name}.part")
+        self.file = open(self.tmp_path, 'wb')
+        self.entries = []
+        self.size = 0
+
+
+class BundleWriter:
+    """
+    Empaqueta los segmentos de un crawl en archivos WARC gzip multi-miembro.
+
+    Cada registro descargado con Range ya es un miembro gzip independiente, así
+    que basta con concatenarlos. Junto a cada bundle se publica un índice
+    `<bundle>.idx` (JSON lines con segment/offset/length) para que el worker
+    pueda leer cada miembro por separado.
+
+    El índice se publica antes que el bundle y ambos mediante temp+rename, de
+    modo que un worker nunca ve un bundle sin su índice ni a medio escribir.
+    """
+
+    def __init__(self, directory, max_records, max_bytes, on_sealed=None):
+        self.directory = directory
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        # on_sealed(crawl_id, bundle_name, segment_names) se llama tras publicar cada bundle
+        self.on_sealed = on_sealed
+        self.bundles_written = 0
+        self._lock = threading.Lock()
+        self._open = {}
+        self._seq = 0
+        self._run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+
+    def add(self, output_path, crawl_id, data):
+        """Agrega un segmento al bundle abierto de su crawl (misma firma que publish_segment)."""
+        sealed = None
+        with self._lock:
+            bundle = self._open.get(crawl_id)
+            if bundle is None:
+                self._seq += 1
+                name = f"{crawl_id}_bundle_{self._run_id}_{self._seq:04d}.warc.gz"
+                bundle = self._open[crawl_id] = _OpenBundle(self.directory / name)
+
+            bundle.file.write(data)
+            bundle.entries.append({"segment": output_path.name, "offset": bundle.size, "length": len(data)})
+            bundle.size += len(data)
+
+            if len(bundle.entries) >= self.max_records or bundle.size >= self.max_bytes:
+                sealed = (crawl_id,) + self._seal(self._open.pop(crawl_id))
+
+        if sealed and self.on_sealed:
+            self.on_sealed(*sealed)
+
+    def _seal(self, bundle):
+        bundle.file.close()
+
+        index_path = bundle.final_path.with_name(bundle.final_path.name + ".idx")
+        index_tmp = index_path.with_name(f".{index_path.name}.part")
+        with open(index_tmp, 'w', encoding='utf-8') as f:
+            for entry in bundle.entries:
+                f.write(json.dumps(entry) + "\n")
+        os.replace(index_tmp, index_path)
+        os.replace(bundle.tmp_path, bundle.final_path)
+
+        self.bundles_written += 1
+        return bundle.final_path.name, [entry["segment"] for entry in bundle.entries]
+
+    def close(self):
+        """Publica todos los bundles que quedaron abiertos."""
+        with self._lock:
+            sealed = [(crawl_id, self._seal(bundle)) for crawl_id, bundle in self._open.items()]
+            self._open = {}
+        if self.on_sealed:
+            for crawl_id, result in sealed:
+                self.on_sealed(crawl_id, *result)
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+
+class CdxCache:
+    """
+    Caché persistente (SQLite) de resultados de consultas al Common Crawl Index.
+
+    La clave es (crawl_id, dominio, parámetros de la consulta). Cada entrada
+    tiene su propia expiración (TTL) y, cuando el tamaño total supera
+    `max_bytes`, se eliminan primero las entradas usadas hace más tiempo.
+    Los crawls publicados son inmutables, así que un TTL largo es seguro.
+    """
+
+    def __init__(self, path, ttl_seconds, max_bytes):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cdx_cache (
+                key TEXT PRIMARY KEY,
+                crawl_id TEXT NOT NULL,
+                domain TEXT NOT NULL,
+                params TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(crawl_id, domain, params):
+        raw = json.dumps([crawl_id, domain, params], sort_keys=True)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, crawl_id, domain, params):
+        """Retorna la lista de registros cacheada o None si no existe o expiró."""
+        key = self.make_key(crawl_id, domain, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, expires_at FROM cdx_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or (row[1] is not None and row[1] < now):
+                if row is not None:
+                    self._conn.execute("DELETE FROM cdx_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.stats["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE cdx_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def put(self, crawl_id, domain, params, records):
+        key = self.make_key(crawl_id, domain, params)
+        payload = json.dumps(records).encode("utf-8")
+        now = time.time()
+        expires_at = now + self.ttl_seconds if self.ttl_seconds > 0 else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cdx_cache "
+                "(key, crawl_id, domain, params, payload, size, created_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, crawl_id, domain, json.dumps(params, sort_keys=True), payload,
+                 len(payload), now, expires_at, now),
+            )
+            self.stats["stored"] += 1
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        """Elimina entradas expiradas y, si hace falta, las menos usadas (LRU) hasta cumplir max_bytes."""
+        self._conn.execute("DELETE FROM cdx_cache WHERE expires_at IS NOT NULL AND expires_at < ?", (now,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cdx_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM cdx_cache ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM cdx_cache WHERE key = ?", (key,))
+            total -= size
+            self.stats["evicted"] += 1
+
+        logging.info(f"Caché CDX: {self.stats['evicted']} entradas desalojadas por tamaño")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,39 @@
+import json
+
+# Campos del índice que realmente usa la ingesta (reduce el tamaño de cada línea)
+CDX_FIELDS = "url,urlkey,timestamp,filename,offset,length,digest,status,mime"
+
+# Tamaño del bloque de lectura del stream de respuesta
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+# Líneas por bloque del índice ZipNum de Common Crawl (una página son `pageSize` bloques)
+INDEX_LINES_PER_BLOCK = 3000
+
+
+def parse_num_pages(response):
+    """
+    Interpreta la respuesta de `showNumPages=true`: (páginas, bloques por
+    página, bloques en total). El servidor pywb retorna {"pages": N,
+    "pageSize": ..., "blocks": ...} según el rango de URLs, sin aplicar
+    `filter`; algunas versiones retornan solo el entero y entonces los
+    bloques quedan en None.
+    """
+    payload = response.json()
+    if isinstance(payload, dict):
+        return int(payload.get("pages", 0)), payload.get("pageSize"), payload.get("blocks")
+    return int(payload), None, None
+
+
+def iter_json_lines(response):
+    """
+    Decodifica incrementalmente las líneas JSON de una respuesta en streaming.
+    Solo mantiene en memoria el bloque actual, no la respuesta completa.
+    """
+    for line in response.iter_lines(chunk_size=STREAM_CHUNK_SIZE):
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            continue
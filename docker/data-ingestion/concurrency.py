@@ -0,0 +1,144 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+# Respuestas que indican que el servidor está saturado
+CONGESTION_STATUSES = {429, 503, 504}
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """
+    Espera antes del reintento `attempt` (1, 2, ...) con backoff exponencial y
+    jitter completo, para que los hilos que fallaron a la vez no reintenten
+    todos en el mismo instante.
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class AdaptiveLimiter:
+    """
+    Controlador de concurrencia AIMD (additive increase / multiplicative decrease).
+
+    La ventana (peticiones simultáneas permitidas) crece en ~1 por cada ventana
+    de peticiones exitosas con latencia por debajo del objetivo, y se reduce a
+    la mitad ante 429/503/504 o timeouts. Solo se reduce una vez por ronda
+    (aprox. una latencia media) para que una ráfaga de errores simultáneos no
+    colapse la ventana al mínimo.
+    """
+
+    def __init__(self, name, initial, min_limit=1, max_limit=32,
+                 increase=1.0, decrease=0.5, latency_target=None):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+
+        self._cond = threading.Condition()
+        self._window = float(max(min_limit, min(initial, max_limit)))
+        self._in_flight = 0
+        self._latency_ewma = None
+        self._last_decrease = 0.0
+        self._started_at = time.monotonic()
+        self._completed = 0
+        self._errors = 0
+        self._congestion_events = 0
+        self._bytes = 0
+        # observer(latency, outcome) se llama al terminar cada petición (p. ej. métricas)
+        self._observers = []
+
+    def add_observer(self, observer):
+        self._observers.append(observer)
+
+    @property
+    def window(self):
+        with self._cond:
+            return self._window
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= int(self._window):
+                self._cond.wait()
+            self._in_flight += 1
+        return time.monotonic()
+
+    def release(self, started, ok=True, congestion=False, nbytes=0, outcome=None):
+        now = time.monotonic()
+        latency = now - started
+        with self._cond:
+            self._in_flight -= 1
+            self._completed += 1
+            self._bytes += nbytes
+            if self._latency_ewma is None:
+                self._latency_ewma = latency
+            else:
+                self._latency_ewma = 0.8 * self._latency_ewma + 0.2 * latency
+
+            if congestion:
+                self._errors += 1
+                if now - self._last_decrease >= (self._latency_ewma or 1.0):
+                    self._window = max(self.min_limit, self._window * self.decrease)
+                    self._last_decrease = now
+                    self._congestion_events += 1
+            elif not ok:
+                self._errors += 1
+            elif self.latency_target is None or latency <= self.latency_target:
+                self._window = min(self.max_limit, self._window + self.increase / self._window)
+
+            self._cond.notify_all()
+
+        for observer in self._observers:
+            observer(latency, outcome or {"status": None, "bytes": nbytes})
+
+    @contextmanager
+    def slot(self, **context):
+        """
+        Ocupa un cupo durante una petición. El llamador anota en el dict
+        entregado el `status` HTTP y los `bytes` recibidos; los timeouts y
+        errores de conexión cuentan como congestión. `context` (crawl, domain...)
+        se pasa tal cual a los observers.
+        """
+        outcome = {"status": None, "bytes": 0, **context}
+        started = self.acquire()
+        try:
+            yield outcome
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            self.release(started, ok=False, congestion=True, outcome=outcome)
+            raise
+        except Exception:
+            self.release(started, ok=False, outcome=outcome)
+            raise
+        else:
+            status = outcome["status"]
+            self.release(
+                started,
+                ok=status is not None and status < 400,
+                congestion=status in CONGESTION_STATUSES,
+                nbytes=outcome["bytes"],
+                outcome=outcome,
+            )
+
+    def snapshot(self):
+        """Estado actual para logs y métricas."""
+        with self._cond:
+            elapsed = max(time.monotonic() - self._started_at, 1e-9)
+            return {
+                "window": self._window,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "errors": self._errors,
+                "congestion_events": self._congestion_events,
+                "requests_per_s": self._completed / elapsed,
+                "bytes_per_s": self._bytes / elapsed,
+                "latency_ewma_s": self._latency_ewma or 0.0,
+            }
+
+    def describe(self):
+        snap = self.snapshot()
+        return (f"{self.name}: ventana={snap['window']:.1f} en_curso={snap['in_flight']} "
+                f"{snap['requests_per_s']:.2f} req/s {snap['bytes_per_s'] / 1024:.0f} KB/s "
+                f"latencia={snap['latency_ewma_s']:.2f}s errores={snap['errors']}")
@@ -0,0 +1,196 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from concurrency import backoff_delay
+
+
+def create_session(pool_size):
+    """
+    Crea una sesión HTTP con conexiones keep-alive reutilizables.
+    Una sola sesión se comparte entre todos los hilos de descarga, de modo que
+    cada segmento reutiliza una conexión TCP+TLS ya abierta.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def publish_segment(output_path, data):
+    """
+    Publica un segmento de forma atómica: se escribe en un temporal oculto del
+    mismo directorio y luego se renombra. Los workers de procesamiento solo
+    listan `*.warc.gz`, así que nunca ven un segmento a medio escribir.
+    """
+    tmp_path = output_path.with_name(f".{output_path.name}.part")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, output_path)
+
+
+class RangeGroup:
+    """Rango de bytes contiguo de un archivo WARC que cubre uno o más registros CDX."""
+
+    def __init__(self, filename, domain=None):
+        self.filename = filename
+        self.domain = domain
+        self.start = None
+        self.end = None  # exclusivo
+        self.members = []  # (offset, length, output_path, crawl_id)
+
+    def add(self, offset, length, output_path, crawl_id):
+        if self.start is None:
+            self.start, self.end = offset, offset + length
+        else:
+            self.start = min(self.start, offset)
+            self.end = max(self.end, offset + length)
+        self.members.append((offset, length, output_path, crawl_id))
+
+
+def plan_range_groups(tasks, max_gap, max_span, domain=None):
+    """
+    Agrupa tareas (record, output_path, crawl_id) por archivo WARC y fusiona
+    registros adyacentes o cercanos (separados por <= max_gap bytes) en una sola
+    petición Range, sin que el rango resultante supere max_span bytes.
+    Retorna (grupos, inválidos) donde inválidos son tareas sin filename/length.
+    """
+    by_file = {}
+    invalid = []
+    for record, output_path, crawl_id in tasks:
+        filename = record.get('filename')
+        offset = int(record.get('offset', 0))
+        length = int(record.get('length', 0))
+        if not filename or length == 0:
+            invalid.append((record, output_path, crawl_id))
+            continue
+        by_file.setdefault(filename, []).append((offset, length, output_path, crawl_id))
+
+    groups = []
+    for filename, items in by_file.items():
+        items.sort(key=lambda item: item[0])
+        current = None
+        for offset, length, output_path, crawl_id in items:
+            if (current is not None
+                    and offset - current.end <= max_gap
+                    and max(current.end, offset + length) - current.start <= max_span):
+                current.add(offset, length, output_path, crawl_id)
+                continue
+            current = RangeGroup(filename, domain)
+            current.add(offset, length, output_path, crawl_id)
+            groups.append(current)
+
+    return groups, invalid
+
+
+class DownloadEngine:
+    """
+    Descarga grupos de segmentos WARC con una sesión HTTP compartida.
+    Cada grupo se pide con un único Range ampliado y la respuesta se corta
+    de nuevo en un archivo por registro. Las peticiones pasan por el
+    AdaptiveLimiter y los fallos transitorios (5xx, timeouts) se reintentan
+    con backoff y jitter.
+    """
+
+    def __init__(self, base_url, pool_size, limiter, max_retries=3, timeout=120, sink=None):
+        self.base_url = base_url
+        # sink(output_path, crawl_id, data): destino de cada segmento (archivo suelto o bundle)
+        self.sink = sink or (lambda output_path, crawl_id, data: publish_segment(output_path, data))
+        self.timeout = timeout
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.session = create_session(pool_size)
+        self._lock = threading.Lock()
+        self.stats = {"bytes_over_wire": 0, "requests": 0, "requests_saved": 0, "retries": 0}
+
+    def _record_request(self, nbytes, members):
+        with self._lock:
+            self.stats["bytes_over_wire"] += nbytes
+            self.stats["requests"] += 1
+            self.stats["requests_saved"] += max(members - 1, 0)
+
+    def _fetch_range(self, url, start, end, crawl_id, domain=None):
+        """
+        Pide bytes [start, end) con reintentos. Retorna (status_code, body);
+        body es None si la respuesta no fue 200/206.
+        """
+        for attempt in range(self.max_retries):
+            if attempt > 0:
+                with self._lock:
+                    self.stats["retries"] += 1
+                wait_time = backoff_delay(attempt)
+                logging.info(f"[{crawl_id}] Reintento {attempt + 1}/{self.max_retries} de {url} (esperando {wait_time:.1f}s)...")
+                metrics.RETRIES.inc(crawl=crawl_id, domain=domain or "", kind="warc")
+                time.sleep(wait_time)
+
+            headers = {'Range': f'bytes={start}-{end - 1}'}
+            try:
+                with self.limiter.slot(crawl=crawl_id, domain=domain or "") as outcome:
+                    response = self.session.get(url, headers=headers, timeout=self.timeout)
+                    outcome["status"] = response.status_code
+                    body = response.content if response.status_code in [200, 206] else None
+                    outcome["bytes"] = len(body) if body is not None else 0
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                logging.warning(f"[{crawl_id}] Error de red descargando {url}: {e}")
+                continue
+
+            if body is not None or response.status_code < 500 or attempt == self.max_retries - 1:
+                return response.status_code, body
+
+        return None, None
+
+    def download_group(self, group):
+        """
+        Descarga un RangeGroup. Retorna una lista de (success, filename, status),
+        un elemento por registro del grupo.
+        """
+        results = []
+        pending = []
+        for member in group.members:
+            output_path = member[2]
+            if output_path.exists():
+                results.append((True, output_path.name, "cached"))
+            else:
+                pending.append(member)
+
+        if not pending:
+            return results
+
+        start = min(offset for offset, _, _, _ in pending)
+        end = max(offset + length for offset, length, _, _ in pending)
+        crawl_id = pending[0][3]
+        url = f"{self.base_url}{group.filename}"
+
+        try:
+            status_code, body = self._fetch_range(url, start, end, crawl_id, group.domain)
+
+            if body is None:
+                status = f"http_{status_code}"
+                return results + [(False, m[2].name, status) for m in pending]
+
+            self._record_request(len(body), len(pending))
+            # Un 200 significa que el servidor ignoró el Range y envió el archivo completo
+            base = start if status_code == 206 else 0
+
+            for offset, length, output_path, member_crawl_id in pending:
+                segment = body[offset - base:offset - base + length]
+                if len(segment) != length:
+                    results.append((False, output_path.name, "short_read"))
+                    continue
+                self.sink(output_path, member_crawl_id, segment)
+                logging.debug(f"[{crawl_id}] Descargado: {output_path.name} ({length / 1024:.1f} KB)")
+                results.append((True, output_path.name, "downloaded"))
+
+        except Exception as e:
+            logging.error(f"[{crawl_id}] Error descargando rango de {group.filename}: {e}")
+            results.extend((False, m[2].name, str(e)) for m in pending)
+
+        return results
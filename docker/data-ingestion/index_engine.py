@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from concurrency import backoff_delay
+
+
+class IndexQueryEngine:
+    """
+    Motor asíncrono de consultas al Common Crawl Index.
+
+    Lanza todas las combinaciones crawl x dominio a la vez y limita la
+    concurrencia real con un semáforo por host. Cada intento HTTP se ejecuta
+    en un pool de hilos (la función `fetch` es bloqueante, basada en requests),
+    mientras que las esperas de backoff se hacen con asyncio.sleep para no
+    ocupar un hilo ni un cupo del semáforo. El semáforo es solo el tope: la
+    concurrencia efectiva la ajusta el AdaptiveLimiter que usa `fetch`.
+    """
+
+    def __init__(self, fetch, host, max_per_host=4, max_retries=3):
+        # fetch(crawl_id, domain, cursor) -> (records, retry)
+        self.fetch = fetch
+        self.host = host
+        self.max_per_host = max_per_host
+        self.max_retries = max_retries
+        self._semaphores = {}
+        self._executor = None
+
+    def _semaphore(self, host):
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        return self._semaphores[host]
+
+    async def query(self, crawl_id, domain):
+        """
+        Consulta un dominio con hasta `max_retries` intentos y backoff
+        exponencial con jitter ante fallos transitorios (503/504, timeouts).
+        """
+        loop = asyncio.get_running_loop()
+        # Progreso de la consulta que se conserva entre reintentos
+        cursor = {}
+
+        for attempt in range(self.max_retries):
+            if attempt > 0:
+                wait_time = backoff_delay(attempt)
+                logging.info(f"[{crawl_id}] Reintento {attempt + 1}/{self.max_retries} para {domain} (esperando {wait_time:.1f}s)...")
+                metrics.RETRIES.inc(crawl=crawl_id, domain=domain, kind="index")
+                await asyncio.sleep(wait_time)
+
+            async with self._semaphore(self.host):
+                records, retry = await loop.run_in_executor(self._executor, self.fetch, crawl_id, domain, cursor)
+
+            if not retry:
+                return crawl_id, domain, records
+
+        logging.warning(f"[{crawl_id}] Agotados reintentos para {domain}")
+        return crawl_id, domain, []
+
+    async def run(self, jobs, on_result):
+        """
+        Ejecuta todas las consultas (crawl_id, domain) en paralelo.
+        `on_result(crawl_id, domain, records)` se invoca en cuanto llega cada
+        resultado, para que la etapa de descarga arranque sin esperar al resto.
+        """
+        tasks = [asyncio.ensure_future(self.query(crawl_id, domain)) for crawl_id, domain in jobs]
+        for future in asyncio.as_completed(tasks):
+            crawl_id, domain, records = await future
+            on_result(crawl_id, domain, records)
+
+    def run_sync(self, jobs, on_result):
+        """Punto de entrada síncrono para ingest_from_index()."""
+        self._executor = ThreadPoolExecutor(max_workers=self.max_per_host)
+        try:
+            asyncio.run(self.run(jobs, on_result))
+        finally:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._semaphores = {}
@@ -1,17 +1,26 @@
 import os
+import re
 import logging
+import threading
 import requests
-import gzip
-import json
 from pathlib import Path
+from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from urllib.parse import quote
+from index_engine import IndexQueryEngine
+from download_engine import DownloadEngine, create_session, plan_range_groups
+from cdx_reader import CDX_FIELDS, INDEX_LINES_PER_BLOCK, iter_json_lines, parse_num_pages
+from cdx_cache import CdxCache
+from segment_manifest import SegmentManifest, segment_key
+from concurrency import CONGESTION_STATUSES, AdaptiveLimiter
+from bundle_writer import BundleWriter
+import metrics
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Constants
 DATA_RAW = Path("/data/raw")
+DATA_CACHE = Path("/data/cache")
 COMMON_CRAWL_BASE_URL = "https://data.commoncrawl.org/"
 CC_INDEX_SERVER = "https://index.commoncrawl.org"
 
@@ -65,18 +74,128 @@ SECCIONES_RELEVANTES = [
     "/legal/", "/juridica/",                         # Cambios regulatorios
 ]
 
+# Un único patrón precompilado (alternación) en lugar de ~30 búsquedas de subcadena por URL
+SECCIONES_PATTERN = re.compile("|".join(re.escape(s) for s in SECCIONES_RELEVANTES), re.IGNORECASE)
+
+# Filtro equivalente aplicado por el servidor de índice (pywb: `filter=<campo>:<regex>`, con re.match,
+# por eso el `.*` inicial). Así solo viajan por la red los registros de secciones relevantes.
+INDEX_SERVER_FILTER = os.environ.get("INDEX_SERVER_FILTER", "1") == "1"
+SECCIONES_SERVER_FILTER = "url:(?i).*(?:" + "|".join(re.escape(s) for s in SECCIONES_RELEVANTES) + ")"
+
 # Límites por crawl para balancear la carga
-MAX_RECORDS_PER_DOMAIN = 200  # Reducido para evitar timeouts
-MAX_PARALLEL_DOWNLOADS = 4
-MAX_RETRIES = 3  # Reintentos ante errores
+MAX_RECORDS_PER_DOMAIN = 200  # Cuota de registros *relevantes* por dominio y crawl
+MAX_PARALLEL_DOWNLOADS = 4  # Ventana inicial de descargas; el controlador AIMD la ajusta
+DOWNLOAD_MAX_CONCURRENCY = int(os.environ.get("DOWNLOAD_MAX_CONCURRENCY", "32"))
+DOWNLOAD_LATENCY_TARGET_S = float(os.environ.get("DOWNLOAD_LATENCY_TARGET_S", "10"))
+MAX_RETRIES = 3  # Reintentos ante errores (índice y descargas)
+# Registros del mismo WARC separados por menos de este hueco se piden en un único Range
+RANGE_MERGE_GAP_BYTES = int(os.environ.get("RANGE_MERGE_GAP_BYTES", str(64 * 1024)))
+RANGE_MAX_SPAN_BYTES = int(os.environ.get("RANGE_MAX_SPAN_BYTES", str(8 * 1024 * 1024)))
+# Formato de salida en /data/raw: "bundle" agrupa muchos registros de un crawl en un WARC
+# gzip multi-miembro con índice de offsets (.idx); "segment" escribe un archivo por registro.
+SEGMENT_LAYOUT = os.environ.get("SEGMENT_LAYOUT", "bundle")
+BUNDLE_MAX_RECORDS = int(os.environ.get("BUNDLE_MAX_RECORDS", "200"))
+BUNDLE_MAX_MB = float(os.environ.get("BUNDLE_MAX_MB", "64"))
+# Puerto del endpoint /metrics (Prometheus); 0 lo desactiva
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+# Consultas simultáneas al servidor de índice (todas las combinaciones crawl x dominio se lanzan a la vez).
+# Es el tope del controlador AIMD, que arranca en INDEX_INITIAL_CONCURRENCY.
+INDEX_MAX_CONCURRENCY_PER_HOST = int(os.environ.get("INDEX_MAX_CONCURRENCY_PER_HOST", "12"))
+INDEX_INITIAL_CONCURRENCY = int(os.environ.get("INDEX_INITIAL_CONCURRENCY", "4"))
+INDEX_LATENCY_TARGET_S = float(os.environ.get("INDEX_LATENCY_TARGET_S", "30"))
+# Páginas del índice a recorrer como máximo por dominio (cada página son ~15.000 líneas)
+INDEX_MAX_PAGES_PER_DOMAIN = int(os.environ.get("INDEX_MAX_PAGES_PER_DOMAIN", "20"))
+
+# Caché local de consultas al índice (los crawls publicados no cambian)
+CDX_CACHE_ENABLED = os.environ.get("CDX_CACHE_ENABLED", "1") == "1"
+CDX_CACHE_TTL_HOURS = float(os.environ.get("CDX_CACHE_TTL_HOURS", str(30 * 24)))  # 0 = sin expiración
+CDX_CACHE_MAX_MB = float(os.environ.get("CDX_CACHE_MAX_MB", "256"))
+
+# Sesión keep-alive compartida por todas las consultas al índice
+index_session = create_session(INDEX_MAX_CONCURRENCY_PER_HOST)
+# Se inicializa en ingest_from_index() para no tocar /data al importar el módulo
+index_cache = None
 
+# Selectividad del filtro por dominio: registros relevantes vs. líneas del índice en las
+# páginas recorridas. Con el filtro en el servidor esas líneas no viajan, así que se
+# estiman con los bloques de showNumPages ("estimated"); sin él son las recibidas.
+# "filtered"/"unfiltered": consultas (crawls) del dominio con y sin el filtro en el servidor
+filter_stats = defaultdict(lambda: {"index_lines": 0, "received": 0, "kept": 0, "bytes": 0, "estimated": False,
+                                    "filtered": 0, "unfiltered": 0})
+filter_stats_lock = threading.Lock()
 
-def query_cc_index(crawl_id, domain, max_records=200):
+# Controladores de concurrencia adaptativa, uno por servidor de Common Crawl
+index_limiter = AdaptiveLimiter(
+    "índice", initial=INDEX_INITIAL_CONCURRENCY,
+    max_limit=INDEX_MAX_CONCURRENCY_PER_HOST, latency_target=INDEX_LATENCY_TARGET_S,
+)
+download_limiter = AdaptiveLimiter(
+    "descargas", initial=MAX_PARALLEL_DOWNLOADS,
+    max_limit=DOWNLOAD_MAX_CONCURRENCY, latency_target=DOWNLOAD_LATENCY_TARGET_S,
+)
+metrics.register_limiter(index_limiter, metrics.INDEX_QUERY_SECONDS, kind="index")
+metrics.register_limiter(download_limiter, metrics.RANGE_DOWNLOAD_SECONDS, kind="warc")
+
+
+def _check_index_response(response, crawl_id, domain):
+    """Clasifica la respuesta del índice: "ok", "not_found" o "retry"."""
+    if response.status_code == 404:
+        logging.warning(f"[{crawl_id}] Índice no encontrado para {domain}")
+        metrics.INDEX_QUERIES.inc(crawl=crawl_id, domain=domain, outcome="not_found")
+        return "not_found"
+    
+    if response.status_code in CONGESTION_STATUSES:
+        logging.warning(f"[{crawl_id}] Servidor saturado (HTTP {response.status_code}) para {domain}, reintentando...")
+        metrics.INDEX_QUERIES.inc(crawl=crawl_id, domain=domain, outcome="retry")
+        return "retry"
+    
+    response.raise_for_status()
+    metrics.INDEX_QUERIES.inc(crawl=crawl_id, domain=domain, outcome="ok")
+    return "ok"
+
+
+def is_relevant_url(url):
+    """Filtra por secciones relevantes."""
+    return SECCIONES_PATTERN.search(url) is not None
+
+
+def _disable_server_filter(cursor, crawl_id, domain):
     """
-    Consulta el Common Crawl Index API para obtener registros de un dominio específico.
-    Incluye reintentos con backoff exponencial para manejar errores 504.
+    El servidor rechazó el filtro por regex (HTTP 400): el cursor vuelve al
+    inicio sin él y el filtrado queda solo del lado del cliente.
+    """
+    logging.warning(f"[{crawl_id}] El índice no aceptó el filtro por URL para {domain}, filtrando localmente")
+    cursor["server_filter"] = False
+    cursor["records"].clear()
+    cursor["page"] = 0
+    cursor["received"] = 0
+    cursor["bytes"] = 0
+    cursor.pop("num_pages", None)
+
+
+def fetch_index_records(crawl_id, domain, max_records=200, cursor=None):
     """
-    import time
+    Realiza un único intento de lectura paginada del Common Crawl Index API.
+    Recorre las páginas del índice (showNumPages/page) en streaming y se detiene
+    en cuanto se reúnen `max_records` registros relevantes.
+    
+    `cursor` es un dict que conserva la página siguiente y los registros ya
+    aceptados entre reintentos, de modo que un fallo en la página N no obliga
+    a releer las anteriores.
+    
+    Si el servidor rechaza el filtro por URL (HTTP 400), la consulta se repite
+    en el acto sin él, dentro del mismo intento.
+    
+    Retorna (registros, reintentar): reintentar=True indica un fallo transitorio
+    (504, timeout u otro error) que el llamador debe reintentar con backoff.
+    """
+    if cursor is None:
+        cursor = {}
+    records = cursor.setdefault("records", [])
+    cursor.setdefault("page", 0)
+    cursor.setdefault("received", 0)
+    cursor.setdefault("bytes", 0)
+    cursor.setdefault("server_filter", INDEX_SERVER_FILTER)
     
     index_url = f"{CC_INDEX_SERVER}/{crawl_id}-index"
     
@@ -86,99 +205,101 @@ def query_cc_index(crawl_id, domain, max_records=200):
     params = {
         "url": query_url,
         "output": "json",
-        "limit": max_records
+        "fl": CDX_FIELDS,
     }
+    if cursor["server_filter"]:
+        params["filter"] = SECCIONES_SERVER_FILTER
+    # Todo lo que afecta al resultado forma parte de la clave de caché
+    cache_params = {**params, "max_records": max_records, "max_pages": INDEX_MAX_PAGES_PER_DOMAIN}
     
-    for attempt in range(MAX_RETRIES):
-        try:
-            if attempt > 0:
-                wait_time = 2 ** attempt  # 2, 4, 8 segundos
-                logging.info(f"[{crawl_id}] Reintento {attempt + 1}/{MAX_RETRIES} para {domain} (esperando {wait_time}s)...")
-                time.sleep(wait_time)
-            
-            logging.info(f"[{crawl_id}] Consultando índice para {domain}...")
-            response = requests.get(index_url, params=params, timeout=90)
-            
-            if response.status_code == 404:
-                logging.warning(f"[{crawl_id}] Índice no encontrado para {domain}")
-                return []
-            
-            if response.status_code == 504:
-                logging.warning(f"[{crawl_id}] Timeout del servidor para {domain}, reintentando...")
-                continue
-            
-            response.raise_for_status()
-            
-            # El API retorna JSON lines (un JSON por línea)
-            records = []
-            for line in response.text.strip().split('\n'):
-                if line:
-                    try:
-                        record = json.loads(line)
-                        # Filtrar por secciones relevantes
-                        url = record.get('url', '')
-                        if any(seccion in url.lower() for seccion in SECCIONES_RELEVANTES):
-                            records.append(record)
-                    except json.JSONDecodeError:
-                        continue
-            
-            logging.info(f"[{crawl_id}] Encontrados {len(records)} registros relevantes para {domain}")
-            return records
-            
-        except requests.exceptions.Timeout:
-            logging.warning(f"[{crawl_id}] Timeout consultando {domain}")
-            continue
-        except Exception as e:
-            logging.error(f"[{crawl_id}] Error consultando índice para {domain}: {e}")
-            if attempt < MAX_RETRIES - 1:
-                continue
-            return []
-    
-    logging.warning(f"[{crawl_id}] Agotados reintentos para {domain}")
-    return []
-
-
-def download_warc_segment(args):
-    """
-    Descarga un segmento específico de un archivo WARC usando Range Request.
-    Esto es mucho más eficiente que descargar archivos completos.
-    """
-    record, output_path, crawl_id = args
-    
-    if output_path.exists():
-        return True, output_path.name, "cached"
+    if index_cache is not None and "num_pages" not in cursor:
+        cached = index_cache.get(crawl_id, domain, cache_params)
+        if cached is not None:
+            logging.info(f"[{crawl_id}] {len(cached)} registros relevantes para {domain} (caché)")
+            metrics.INDEX_QUERIES.inc(crawl=crawl_id, domain=domain, outcome="cache_hit")
+            metrics.INDEX_RECORDS.inc(len(cached), crawl=crawl_id, domain=domain)
+            return cached, False
     
     try:
-        filename = record.get('filename')
-        offset = int(record.get('offset', 0))
-        length = int(record.get('length', 0))
-        
-        if not filename or length == 0:
-            return False, "", "invalid_record"
+        if "num_pages" not in cursor:
+            logging.info(f"[{crawl_id}] Consultando índice para {domain}...")
+            with index_limiter.slot(crawl=crawl_id, domain=domain) as outcome:
+                response = index_session.get(index_url, params={**params, "showNumPages": "true"}, timeout=90)
+                outcome["status"] = response.status_code
+                outcome["bytes"] = len(response.content)
+            if response.status_code == 400 and cursor["server_filter"]:
+                # Se repite enseguida sin el filtro: no es un fallo transitorio ni gasta un intento
+                _disable_server_filter(cursor, crawl_id, domain)
+                return fetch_index_records(crawl_id, domain, max_records, cursor)
+            status = _check_index_response(response, crawl_id, domain)
+            if status != "ok":
+                return [], status == "retry"
+            cursor["num_pages"], cursor["page_size"], cursor["blocks"] = parse_num_pages(response)
         
-        url = f"{COMMON_CRAWL_BASE_URL}{filename}"
+        last_page = min(cursor["num_pages"], INDEX_MAX_PAGES_PER_DOMAIN)
+        filter_rejected = False
+        while cursor["page"] < last_page and len(records) < max_records:
+            # Los registros de la página se confirman solo si se leyó completa
+            # (o se alcanzó la cuota), así un reintento no los duplica
+            page_records = []
+            with index_limiter.slot(crawl=crawl_id, domain=domain) as outcome, \
+                 index_session.get(index_url, params={**params, "page": cursor["page"]},
+                                   timeout=90, stream=True) as response:
+                outcome["status"] = response.status_code
+                if response.status_code == 400 and cursor["server_filter"]:
+                    # Se sale del slot antes de repetir la consulta
+                    filter_rejected = True
+                    break
+                status = _check_index_response(response, crawl_id, domain)
+                if status == "not_found":
+                    break
+                if status == "retry":
+                    return [], True
+                
+                for record in iter_json_lines(response):
+                    cursor["received"] += 1
+                    if is_relevant_url(record.get('url', '')):
+                        page_records.append(record)
+                        if len(records) + len(page_records) >= max_records:
+                            break
+                outcome["bytes"] = response.raw.tell() if hasattr(response.raw, "tell") else 0
+                cursor["bytes"] += outcome["bytes"]
+            
+            records.extend(page_records)
+            cursor["page"] += 1
         
-        # Usar Range Request para descargar solo el segmento necesario
-        headers = {
-            'Range': f'bytes={offset}-{offset + length - 1}'
-        }
+        if filter_rejected:
+            _disable_server_filter(cursor, crawl_id, domain)
+            return fetch_index_records(crawl_id, domain, max_records, cursor)
         
-        response = requests.get(url, headers=headers, timeout=120)
+        logging.info(f"[{crawl_id}] Encontrados {len(records)} registros relevantes para {domain} "
+                     f"({cursor['received']} recibidos en {cursor['page']}/{cursor['num_pages']} páginas)")
+        index_lines, estimated = cursor["received"], False
+        if cursor["server_filter"] and cursor["page_size"] and cursor["blocks"]:
+            # La última página puede haberse cortado al llegar a la cuota: es una cota superior
+            index_lines = min(cursor["page"] * cursor["page_size"], cursor["blocks"]) * INDEX_LINES_PER_BLOCK
+            estimated = True
+        with filter_stats_lock:
+            domain_stats = filter_stats[domain]
+            domain_stats["index_lines"] += index_lines
+            domain_stats["received"] += cursor["received"]
+            domain_stats["kept"] += len(records)
+            domain_stats["bytes"] += cursor["bytes"]
+            domain_stats["estimated"] |= estimated
+            domain_stats["filtered" if cursor["server_filter"] else "unfiltered"] += 1
+        metrics.INDEX_RECORDS.inc(len(records), crawl=crawl_id, domain=domain)
+        if index_cache is not None:
+            index_cache.put(crawl_id, domain, cache_params, records)
+        return records, False
         
-        if response.status_code in [200, 206]:
-            # Guardar el segmento comprimido
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
-            
-            size_kb = len(response.content) / 1024
-            logging.debug(f"[{crawl_id}] Descargado: {output_path.name} ({size_kb:.1f} KB)")
-            return True, output_path.name, "downloaded"
-        else:
-            return False, output_path.name, f"http_{response.status_code}"
-            
+    except requests.exceptions.Timeout:
+        logging.warning(f"[{crawl_id}] Timeout consultando {domain}")
+        metrics.INDEX_QUERIES.inc(crawl=crawl_id, domain=domain, outcome="timeout")
+        return [], True
     except Exception as e:
-        logging.error(f"[{crawl_id}] Error descargando segmento: {e}")
-        return False, output_path.name, str(e)
+        logging.error(f"[{crawl_id}] Error consultando índice para {domain}: {e}")
+        metrics.INDEX_QUERIES.inc(crawl=crawl_id, domain=domain, outcome="error")
+        return [], True
 
 
 def ingest_from_index():
@@ -186,65 +307,136 @@ def ingest_from_index():
     Proceso principal de ingesta usando Common Crawl Index API.
     Busca contenido económico de noticias colombianas en múltiples crawls.
     """
+    global index_cache
     start_time = datetime.now()
     
     try:
         DATA_RAW.mkdir(parents=True, exist_ok=True)
         logging.info(f"Directorio {DATA_RAW} verificado")
         
-        stats = {"downloaded": 0, "cached": 0, "failed": 0, "total_records": 0}
-        all_download_tasks = []
+        if METRICS_PORT:
+            metrics.start_metrics_server(METRICS_PORT)
         
-        for crawl in CRAWLS_CONFIG:
-            crawl_id = crawl["id"]
-            period = crawl["period"]
-            
-            logging.info(f"{'='*60}")
-            logging.info(f"Procesando {crawl_id} ({period})")
-            logging.info(f"{'='*60}")
-            
-            crawl_records = []
+        if CDX_CACHE_ENABLED:
+            index_cache = CdxCache(
+                DATA_CACHE / "cdx_index.sqlite",
+                ttl_seconds=CDX_CACHE_TTL_HOURS * 3600,
+                max_bytes=int(CDX_CACHE_MAX_MB * 1024 * 1024),
+            )
+        
+        stats = {"downloaded": 0, "cached": 0, "duplicates": 0, "failed": 0, "total_records": 0}
+        records_by_crawl = defaultdict(int)
+        manifest = SegmentManifest(DATA_CACHE / "segments.manifest")
+        pending_digests = {}
+        segment_digests = {}
+        logging.info(f"Manifiesto de segmentos: {len(manifest)} digests ya descargados")
+        download_futures = []
+        segments_queued = 0
+        
+        logging.info(f"Crawls a consultar: {', '.join(c['id'] + ' (' + c['period'] + ')' for c in CRAWLS_CONFIG)}")
+        logging.info(f"Lanzando {len(CRAWLS_CONFIG) * len(DOMINIOS_NOTICIAS)} consultas al índice "
+                     f"(máx. {INDEX_MAX_CONCURRENCY_PER_HOST} simultáneas por host)")
+        
+        # El pool tiene hilos para la ventana máxima; el controlador AIMD decide cuántos descargan a la vez
+        executor = ThreadPoolExecutor(max_workers=DOWNLOAD_MAX_CONCURRENCY)
+        
+        bundle_writer = None
+        if SEGMENT_LAYOUT == "bundle":
+            def on_bundle_sealed(crawl_id, bundle_name, segment_names):
+                # Los digests se confirman solo cuando su bundle quedó publicado
+                for name in segment_names:
+                    manifest.commit(segment_digests[name], crawl_id, bundle_name)
+                logging.info(f"[{crawl_id}] Bundle publicado: {bundle_name} ({len(segment_names)} registros)")
             
-            # Consultar cada dominio de noticias
-            for domain in DOMINIOS_NOTICIAS:
-                records = query_cc_index(crawl_id, domain, MAX_RECORDS_PER_DOMAIN)
-                crawl_records.extend(records)
+            bundle_writer = BundleWriter(
+                DATA_RAW, BUNDLE_MAX_RECORDS, int(BUNDLE_MAX_MB * 1024 * 1024), on_sealed=on_bundle_sealed,
+            )
+        
+        downloader = DownloadEngine(
+            COMMON_CRAWL_BASE_URL, pool_size=DOWNLOAD_MAX_CONCURRENCY,
+            limiter=download_limiter, max_retries=MAX_RETRIES,
+            sink=bundle_writer.add if bundle_writer else None,
+        )
+        
+        def on_index_result(crawl_id, domain, records):
+            """Encola las descargas de un dominio en cuanto llega su respuesta del índice."""
+            nonlocal segments_queued
+            stats["total_records"] += len(records)
             
-            logging.info(f"[{crawl_id}] Total registros encontrados: {len(crawl_records)}")
-            stats["total_records"] += len(crawl_records)
+            records_by_crawl[crawl_id] += len(records)
             
-            # Preparar tareas de descarga
-            for i, record in enumerate(crawl_records):
-                # Crear nombre único basado en hash del URL
-                url_hash = hash(record.get('url', '')) % 100000
-                filename = f"{crawl_id}_news_{i:04d}_{url_hash}.warc.gz"
+            tasks = []
+            for record in records:
+                # Nombre direccionado por contenido: estable entre ejecuciones y crawls
+                digest = segment_key(record)
+                if not manifest.claim(digest):
+                    if manifest.status(digest) == "done":
+                        stats["cached"] += 1
+                        metrics.SEGMENTS.inc(crawl=crawl_id, domain=domain, status="cached")
+                    else:
+                        stats["duplicates"] += 1
+                        metrics.SEGMENTS.inc(crawl=crawl_id, domain=domain, status="duplicate")
+                    continue
+                filename = f"{crawl_id}_news_{digest}.warc.gz"
                 output_path = DATA_RAW / filename
-                all_download_tasks.append((record, output_path, crawl_id))
+                pending_digests[filename] = (digest, crawl_id, domain)
+                segment_digests[filename] = digest
+                tasks.append((record, output_path, crawl_id))
+            
+            # Agrupar registros cercanos del mismo WARC en una sola petición Range
+            groups, invalid = plan_range_groups(tasks, RANGE_MERGE_GAP_BYTES, RANGE_MAX_SPAN_BYTES, domain=domain)
+            stats["failed"] += len(invalid)
+            for _, output_path, _ in invalid:
+                manifest.release(pending_digests.pop(output_path.name)[0])
+                metrics.SEGMENTS.inc(crawl=crawl_id, domain=domain, status="failed")
+            segments_queued += len(tasks)
+            for group in groups:
+                download_futures.append(executor.submit(downloader.download_group, group))
         
-        logging.info(f"\nTotal de segmentos a descargar: {len(all_download_tasks)}")
+        engine = IndexQueryEngine(
+            lambda crawl_id, domain, cursor: fetch_index_records(crawl_id, domain, MAX_RECORDS_PER_DOMAIN, cursor),
+            host=CC_INDEX_SERVER,
+            max_per_host=INDEX_MAX_CONCURRENCY_PER_HOST,
+            max_retries=MAX_RETRIES,
+        )
+        jobs = [(crawl["id"], domain) for crawl in CRAWLS_CONFIG for domain in DOMINIOS_NOTICIAS]
         
-        # Ejecutar descargas en paralelo
-        if all_download_tasks:
-            with ThreadPoolExecutor(max_workers=MAX_PARALLEL_DOWNLOADS) as executor:
-                futures = {executor.submit(download_warc_segment, task): task 
-                          for task in all_download_tasks}
-                
-                completed = 0
-                for future in as_completed(futures):
+        try:
+            engine.run_sync(jobs, on_index_result)
+            
+            for crawl in CRAWLS_CONFIG:
+                logging.info(f"[{crawl['id']}] Total registros encontrados: {records_by_crawl[crawl['id']]}")
+            logging.info(f"Consultas al índice terminadas | {index_limiter.describe()}")
+            logging.info(f"\nTotal de segmentos a descargar: {segments_queued} "
+                         f"(en {len(download_futures)} peticiones Range)")
+            
+            # Las descargas ya están en curso; recoger resultados
+            completed = 0
+            for future in as_completed(download_futures):
+                for success, filename, status in future.result():
                     completed += 1
-                    success, filename, status = future.result()
+                    digest, crawl_id, domain = pending_digests.pop(filename)
                     
                     if success:
+                        if bundle_writer is None:
+                            manifest.commit(digest, crawl_id, filename)
                         if status == "cached":
                             stats["cached"] += 1
                         else:
                             stats["downloaded"] += 1
+                        metrics.SEGMENTS.inc(crawl=crawl_id, domain=domain, status=status)
                     else:
+                        manifest.release(digest)
                         stats["failed"] += 1
+                        metrics.SEGMENTS.inc(crawl=crawl_id, domain=domain, status="failed")
                     
                     # Progress log cada 50 archivos
                     if completed % 50 == 0:
-                        logging.info(f"Progreso: {completed}/{len(all_download_tasks)} segmentos")
+                        logging.info(f"Progreso: {completed}/{segments_queued} segmentos | {download_limiter.describe()}")
+        finally:
+            executor.shutdown(wait=True)
+            if bundle_writer is not None:
+                bundle_writer.close()
         
         # Calcular tamaño total
         total_size_mb = sum(f.stat().st_size for f in DATA_RAW.glob("*.warc.gz")) / (1024 * 1024)
@@ -256,11 +448,39 @@ def ingest_from_index():
         logging.info("=" * 60)
         logging.info(f"Crawls procesados: {len(CRAWLS_CONFIG)}")
         logging.info(f"Dominios consultados: {len(DOMINIOS_NOTICIAS)}")
+        if filter_stats:
+            logging.info("Selectividad del filtro de secciones por dominio:")
+            for domain, data in sorted(filter_stats.items(), key=lambda item: -item[1]["index_lines"]):
+                selectivity = data["kept"] / data["index_lines"] * 100 if data["index_lines"] else 0.0
+                # Tamaño del índice sin filtrar, con el tamaño medio de las líneas recibidas
+                line_bytes = data["bytes"] / data["received"] if data["received"] else 0.0
+                approx = "~" if data["estimated"] else ""
+                queries = data["filtered"] + data["unfiltered"]
+                server_filter = ("sí" if not data["unfiltered"] else "no" if not data["filtered"]
+                                 else f"en {data['filtered']}/{queries} crawls")
+                logging.info(f"  {domain}: {data['kept']}/{approx}{data['index_lines']} relevantes "
+                             f"({selectivity:.1f}%), {data['received']} líneas recibidas, "
+                             f"{data['bytes'] / 1024:.0f} KB de índice de {approx}"
+                             f"{data['index_lines'] * line_bytes / 1024:.0f} KB sin filtrar "
+                             f"(filtro en servidor: {server_filter})")
         logging.info(f"Registros encontrados en índice: {stats['total_records']}")
+        if index_cache is not None:
+            logging.info(f"Consultas al índice desde caché: {index_cache.stats['hits']} aciertos, "
+                         f"{index_cache.stats['misses']} fallos")
         logging.info(f"Segmentos descargados: {stats['downloaded']}")
         logging.info(f"Segmentos en caché: {stats['cached']}")
+        logging.info(f"Duplicados entre crawls (mismo digest): {stats['duplicates']}")
         logging.info(f"Segmentos fallidos: {stats['failed']}")
         logging.info(f"Tamaño total: {total_size_mb:.1f} MB")
+        if bundle_writer is not None:
+            logging.info(f"Bundles publicados: {bundle_writer.bundles_written} "
+                         f"(máx. {BUNDLE_MAX_RECORDS} registros / {BUNDLE_MAX_MB:.0f} MB)")
+        logging.info(f"Bytes transferidos: {downloader.stats['bytes_over_wire'] / (1024 * 1024):.1f} MB "
+                     f"en {downloader.stats['requests']} peticiones")
+        logging.info(f"Peticiones ahorradas por fusión de rangos: {downloader.stats['requests_saved']}")
+        logging.info(f"Reintentos de descarga: {downloader.stats['retries']}")
+        logging.info(f"Concurrencia final - {index_limiter.describe()}")
+        logging.info(f"Concurrencia final - {download_limiter.describe()}")
         logging.info(f"Tiempo total: {elapsed:.1f} segundos")
         logging.info("=" * 60)
         
@@ -285,4 +505,8 @@ if __name__ == "__main__":
     if flag_file.exists():
         flag_file.unlink()
     
+    # Eliminar temporales de segmentos que quedaron a medio publicar
+    for tmp_file in DATA_RAW.glob(".*.part"):
+        tmp_file.unlink()
+    
     ingest_from_index()
@@ -0,0 +1,205 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Gauge cuyo valor se obtiene al exportar, a partir de una función por combinación de labels."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set_function(self, function, **labels):
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._functions.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(function())}"
+                for key, function in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+# Registro global, en el orden en que se declaran las métricas
+REGISTRY = []
+
+
+def render_metrics():
+    """Todas las métricas en formato de texto de Prometheus."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Evitar una línea de log por cada scrape
+        pass
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Sirve /metrics desde un hilo daemon dentro del mismo proceso."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    logging.info(f"Métricas disponibles en http://{host}:{port}/metrics")
+    return server
+
+
+# --------------------------------------------------
+# Métricas de la ingesta
+# --------------------------------------------------
+
+INDEX_QUERIES = Counter(
+    "cc_index_queries_total", "Peticiones al índice por resultado (ok, not_found, retry, timeout, error, cache_hit).",
+    ["crawl", "domain", "outcome"],
+)
+INDEX_RECORDS = Counter(
+    "cc_index_records_found_total", "Registros relevantes encontrados en el índice.", ["crawl", "domain"],
+)
+SEGMENTS = Counter(
+    "cc_segments_total", "Segmentos por estado (downloaded, cached, duplicate, failed).",
+    ["crawl", "domain", "status"],
+)
+BYTES_TRANSFERRED = Counter(
+    "cc_bytes_transferred_total", "Bytes recibidos de Common Crawl (index o warc).", ["crawl", "domain", "kind"],
+)
+RETRIES = Counter(
+    "cc_retries_total", "Reintentos por tipo de petición (index o warc).", ["crawl", "domain", "kind"],
+)
+INDEX_QUERY_SECONDS = Histogram(
+    "cc_index_query_seconds", "Latencia de cada petición al índice.", ["domain"],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 90, 120),
+)
+RANGE_DOWNLOAD_SECONDS = Histogram(
+    "cc_range_download_seconds", "Latencia de cada descarga Range de WARC.", ["domain"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120),
+)
+CONCURRENCY_WINDOW = Gauge(
+    "cc_concurrency_window", "Ventana actual del controlador AIMD.", ["limiter"],
+)
+IN_FLIGHT = Gauge(
+    "cc_requests_in_flight", "Peticiones en curso por controlador.", ["limiter"],
+)
+THROUGHPUT_BYTES = Gauge(
+    "cc_throughput_bytes_per_second", "Throughput medio desde el inicio por controlador.", ["limiter"],
+)
+
+
+def register_limiter(limiter, latency_histogram, kind):
+    """
+    Expone la ventana, peticiones en curso y throughput de un AdaptiveLimiter,
+    y registra la latencia y los bytes de cada petición que pasa por él.
+    """
+    CONCURRENCY_WINDOW.set_function(lambda: limiter.snapshot()["window"], limiter=limiter.name)
+    IN_FLIGHT.set_function(lambda: limiter.snapshot()["in_flight"], limiter=limiter.name)
+    THROUGHPUT_BYTES.set_function(lambda: limiter.snapshot()["bytes_per_s"], limiter=limiter.name)
+
+    def observe(latency, outcome):
+        latency_histogram.observe(latency, domain=outcome.get("domain", ""))
+        if outcome.get("bytes"):
+            BYTES_TRANSFERRED.inc(outcome["bytes"], crawl=outcome.get("crawl", ""),
+                                  domain=outcome.get("domain", ""), kind=kind)
+
+    limiter.add_observer(observe)
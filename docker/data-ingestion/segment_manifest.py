@@ -0,0 +1,82 @@
+import hashlib
+import re
+import threading
+
+_DIGEST_RE = re.compile(r'^(?:sha1:)?([A-Z2-7]{32})$')
+
+
+def segment_key(record):
+    """
+    Clave estable de un registro CDX para nombrar su segmento.
+
+    Se usa el `digest` del payload (SHA-1 en base32) que publica Common Crawl:
+    el mismo artículo capturado en varios crawls tiene el mismo digest. Si el
+    registro no lo trae, se deriva un SHA-1 de urlkey/url + timestamp, que es
+    igual de estable entre ejecuciones (a diferencia de hash(), que usa sal
+    aleatoria por proceso).
+    """
+    match = _DIGEST_RE.match(record.get('digest', '') or '')
+    if match:
+        return match.group(1)
+    raw = f"{record.get('urlkey') or record.get('url', '')}|{record.get('timestamp', '')}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:32].upper()
+
+
+class SegmentManifest:
+    """
+    Registro persistente (append-only) de los digests ya descargados.
+
+    Cada línea es `digest<TAB>crawl_id<TAB>archivo`. Como los workers de
+    procesamiento borran los segmentos de /data/raw, el manifiesto es lo que
+    evita volver a descargarlos en la siguiente ejecución. Durante la ejecución
+    también lleva los digests en curso para que un payload repetido en varios
+    crawls se descargue una sola vez.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._done = set()
+        self._in_flight = set()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    digest = line.split('\t', 1)[0].strip()
+                    if digest:
+                        self._done.add(digest)
+
+    def __len__(self):
+        return len(self._done)
+
+    def status(self, digest):
+        """Retorna "done", "in_flight" o None."""
+        with self._lock:
+            if digest in self._done:
+                return "done"
+            if digest in self._in_flight:
+                return "in_flight"
+            return None
+
+    def claim(self, digest):
+        """Reserva un digest para descargarlo. False si ya está descargado o en curso."""
+        with self._lock:
+            if digest in self._done or digest in self._in_flight:
+                return False
+            self._in_flight.add(digest)
+            return True
+
+    def commit(self, digest, crawl_id, filename):
+        with self._lock:
+            self._in_flight.discard(digest)
+            if digest in self._done:
+                return
+            self._done.add(digest)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(f"{digest}\t{crawl_id}\t{filename}\n")
+
+    def release(self, digest):
+        """Libera un digest cuya descarga falló para que pueda reintentarse."""
+        with self._lock:
+            self._in_flight.discard(digest)
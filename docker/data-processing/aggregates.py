@@ -0,0 +1,56 @@
+"""
+Agregados diarios parciales calculados por cada proceso de trabajo.
+
+Por cada archivo procesado se cuentan las noticias guardadas por
+día × crawl × dominio × sección, junto con la relevancia y las menciones por categoría.
+Cuando main.py publica la salida de un archivo (con el lease vigente), publica
+también su agregado (temp+rename) en /data/processed/aggregates/agg_<origen>.json:
+un archivo pequeño por archivo de origen, así que cada commit escribe solo lo
+suyo y no reescribe los parciales de los archivos anteriores.
+
+Si un archivo se procesa dos veces (reintento o lease reclamado), la segunda
+publicación reemplaza a la primera y analysis.py no lo cuenta dos veces.
+"""
+import json
+import os
+import socket
+from collections import defaultdict
+
+from keywords import CATEGORY_COLUMNS
+
+AGGREGATES_DIR = "aggregates"
+METRIC_FIELDS = ["count", "relevance"] + CATEGORY_COLUMNS
+
+
+class FileAggregate:
+    """Agregado de un archivo; se publica con su salida solo si el archivo se procesó bien."""
+
+    def __init__(self, source_name):
+        self.source_name = source_name
+        self.groups = defaultdict(lambda: dict.fromkeys(METRIC_FIELDS, 0))
+
+    def add(self, day, crawl, domain, section, relevance, kw_counts):
+        group = self.groups[(day, crawl, domain, section)]
+        group["count"] += 1
+        group["relevance"] += relevance
+        for column in CATEGORY_COLUMNS:
+            group[column] += kw_counts[column]
+
+    def rows(self):
+        return [{"day": day, "crawl": crawl, "domain": domain, "section": section, **values}
+                for (day, crawl, domain, section), values in self.groups.items()]
+
+
+def sidecar_path(output_dir, source_name):
+    return os.path.join(output_dir, AGGREGATES_DIR, f"agg_{source_name}.json")
+
+
+def publish(output_dir, source_name, rows):
+    """Publica el agregado de un archivo de origen en su propio sidecar."""
+    path = sidecar_path(output_dir, source_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = os.path.join(os.path.dirname(path),
+                            f".{os.path.basename(path)}.{socket.gethostname()}_{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"source": source_name, "groups": rows}, f)
+    os.replace(tmp_path, path)
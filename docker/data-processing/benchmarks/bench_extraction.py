@@ -0,0 +1,92 @@
+"""
+Micro-benchmark de extracción HTML -> texto por backend.
+
+Uso:
+    python benchmarks/bench_extraction.py [archivo.warc.gz ...] [--repeat N]
+
+Toma el HTML de los registros `response` de los WARC indicados (segmentos o
+bundles); sin argumentos usa un documento de ejemplo. Reporta MB/s de cada
+backend disponible y cuánto texto produce cada uno.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction import available_backends, get_backend  # noqa: E402
+
+SAMPLE_HTML = """<!DOCTYPE html>
+<html lang="es"><head><meta charset="utf-8"><title>Economía &amp; mercados</title>
+<style>body { font-family: sans-serif; } .nav > li { display: inline; }</style>
+<script>window.dataLayer = []; if (a < b && c > d) { track("economia"); }</script>
+</head><body>
+<header><nav><ul><li><a href="/">Inicio</a></li><li><a href="/economia/">Economía</a></li></ul></nav></header>
+{articles}</body></html>
+"""
+
+SAMPLE_ARTICLE = """<article><header><h1>El d&oacute;lar cierra a la baja frente al peso</h1></header>
+<p>La divisa estadounidense cerr&oacute; la jornada en $3.950, una ca&iacute;da del 1,2&nbsp;% &#8212;
+seg&uacute;n datos del mercado&#x2026; El COLCAP subi&oacute; 0,8 % impulsado por acciones del sector energ&eacute;tico.</p>
+<!-- bloque publicitario -->
+<p>Analistas atribuyen el movimiento a la expectativa de recortes de tasas del Banco de la Rep&uacute;blica
+y a la recuperaci&oacute;n del precio del petr&oacute;leo Brent.</p></article>
+<aside>Lo más leído: <a href="#">Nota 1</a> <a href="#">Nota 2</a></aside>
+<footer><form><input name="email"><button>Suscribirse</button></form>© El Tiempo</footer>
+"""
+
+
+def load_documents(paths):
+    """HTML (str) de los registros response de los WARC dados."""
+    if not paths:
+        return [SAMPLE_HTML.replace("{articles}", SAMPLE_ARTICLE * 20) for _ in range(50)]
+
+    from worker import iter_warc_records
+
+    documents = []
+    for path in paths:
+        for record in iter_warc_records(path):
+            if record.rec_type != "response":
+                continue
+            content = record.content_stream().read()
+            if content:
+                documents.append(content.decode("utf-8", errors="ignore"))
+    return documents
+
+
+def bench(backend, documents, repeat):
+    total_bytes = sum(len(doc.encode("utf-8")) for doc in documents) * repeat
+    total_chars = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for doc in documents:
+            total_chars += len(backend.extract(doc))
+    elapsed = time.perf_counter() - start
+    return total_bytes / (1024 * 1024) / elapsed, elapsed, total_chars // repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("warc_files", nargs="*")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backend", action="append", help="limitar a estos backends (repetible)")
+    args = parser.parse_args()
+
+    documents = load_documents(args.warc_files)
+    if not documents:
+        print("No se encontraron registros response en los archivos indicados")
+        return 1
+
+    size_mb = sum(len(doc.encode("utf-8")) for doc in documents) / (1024 * 1024)
+    print(f"{len(documents)} documentos, {size_mb:.2f} MB de HTML, {args.repeat} repeticiones")
+    print(f"{'backend':<12} {'MB/s':>10} {'tiempo (s)':>12} {'chars salida':>14}")
+
+    for name in args.backend or available_backends():
+        mb_per_s, elapsed, chars = bench(get_backend(name), documents, args.repeat)
+        print(f"{name:<12} {mb_per_s:>10.1f} {elapsed:>12.3f} {chars:>14}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""
+Benchmark del camino caliente del procesamiento sobre un corpus sintético.
+
+Uso:
+    python benchmarks/bench_pipeline.py [--files N] [--records N] [--workers 1,2,4]
+        [--stage extract|iter_news|process|scaling] [opciones de synthetic_warc.py]
+
+Genera segmentos con synthetic_warc.py en un directorio temporal y mide:
+- extract:   extract_text_from_html sobre el HTML ya descomprimido;
+- iter_news: lectura del WARC (gzip + parseo) + extracción + palabras clave;
+- process:   process_warc_file completo, incluida la escritura y publicación (OUTPUT_FORMAT);
+- scaling:   el ciclo de main() reservando archivos de un /data temporal con
+             1, 2, 4... procesos de trabajo.
+
+Cada etapa corre en un proceso nuevo, así que el pico de RSS reportado es el de
+esa etapa (en scaling, el mayor entre el proceso principal y sus hijos). El
+rendimiento en MB/s se calcula sobre el contenido sin comprimir (HTML o texto).
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_warc import add_corpus_arguments, corpus_options, generate_corpus  # noqa: E402
+
+STAGES = ["extract", "iter_news", "process", "scaling"]
+
+
+def _peak_rss_mb(include_children=False):
+    # ru_maxrss está en KB en Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if include_children:
+        peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 1024
+
+
+def _quiet(verbose):
+    """Silencia los print() de worker.py y los logs INFO de main.py."""
+    if verbose:
+        return
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    logging.disable(logging.INFO)
+
+
+def _use_dedup_index(work_dir):
+    import dedup
+    dedup.DEDUP_INDEX_PATH = Path(work_dir) / ".dedup" / "index.sqlite"
+
+
+def stage_extract(paths, work_dir):
+    from extraction import detect_charset
+    from worker import extract_text_from_html, iter_warc_records
+
+    documents = []
+    for path in paths:
+        for record in iter_warc_records(path):
+            if record.rec_type == "response":
+                content = record.content_stream().read()
+                charset = detect_charset(record.http_headers.get_header("Content-Type"), content[:4096])
+                documents.append(content.decode(charset, errors="replace"))
+    if not documents:
+        return 0, 0, 0.0
+
+    start = time.perf_counter()
+    for doc in documents:
+        extract_text_from_html(doc)
+    elapsed = time.perf_counter() - start
+    return len(documents), sum(len(doc.encode("utf-8")) for doc in documents), elapsed
+
+
+def stage_iter_news(paths, work_dir):
+    from worker import iter_news
+
+    records = 0
+    start = time.perf_counter()
+    for path in paths:
+        for _ in iter_news(path):
+            records += 1
+    return records, None, time.perf_counter() - start
+
+
+def stage_process(paths, work_dir):
+    from worker import commit_output, process_warc_file
+
+    _use_dedup_index(work_dir)
+    output_dir = os.path.join(work_dir, "processed")
+    os.makedirs(output_dir, exist_ok=True)
+    records = 0
+    start = time.perf_counter()
+    for path in paths:
+        result = process_warc_file(path, output_dir)
+        commit_output(result, output_dir)
+        records += result["processed"]
+    return records, None, time.perf_counter() - start
+
+
+def stage_scaling(paths, work_dir, workers):
+    import main
+
+    data = Path(work_dir) / "data"
+    main.DATA_RAW = data / "raw"
+    main.DATA_PROCESSING = data / "processing"
+    main.DATA_PROCESSED = data / "processed"
+    main.DATA_LEASES = main.DATA_PROCESSING / ".leases"
+    main.DATA_RETRY = main.DATA_PROCESSING / ".retry"
+    main.DATA_DEAD_LETTER = main.DATA_PROCESSING / "dead-letter"
+    main.PROCESSING_WORKERS = str(workers)
+    main.DATA_RAW.mkdir(parents=True)
+    _use_dedup_index(main.DATA_PROCESSED)
+
+    for path in paths:
+        shutil.copy(path, main.DATA_RAW)
+    (main.DATA_RAW / ".ingestion_complete").touch()
+
+    start = time.perf_counter()
+    main.main()
+    elapsed = time.perf_counter() - start
+    leftover = main.list_raw_files() + [p.name for p in main.DATA_PROCESSING.glob("*.warc.gz")]
+    if leftover:
+        raise RuntimeError(f"quedaron archivos sin procesar: {leftover}")
+    return None, None, elapsed
+
+
+def _run_stage(queue, name, paths, work_dir, verbose, args):
+    _quiet(verbose)
+    try:
+        func = globals()[f"stage_{name}"]
+        records, nbytes, elapsed = func(paths, work_dir, *args)
+        queue.put((records, nbytes, elapsed, _peak_rss_mb(include_children=name == "scaling"), None))
+    except Exception as e:
+        queue.put((0, 0, 0.0, _peak_rss_mb(), f"{type(e).__name__}: {e}"))
+
+
+def run_stage(name, paths, work_dir, verbose=False, args=()):
+    """Corre una etapa en un proceso aparte y retorna (registros, bytes, segundos, RSS MB, error)."""
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_stage, args=(queue, name, paths, work_dir, verbose, args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def report(label, records, nbytes, elapsed, rss_mb, error):
+    if error:
+        print(f"{label:<18} ERROR {error}")
+        return
+    records_s = records / elapsed if elapsed else 0.0
+    mb_s = nbytes / (1024 * 1024) / elapsed if elapsed else 0.0
+    print(f"{label:<18} {records:>9} {records_s:>12.1f} {mb_s:>8.2f} {elapsed:>10.2f} {rss_mb:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=8)
+    add_corpus_arguments(parser)
+    parser.add_argument("--workers", default="1,2,4", help="cantidades de procesos para scaling")
+    parser.add_argument("--stage", action="append", choices=STAGES, help="limitar a estas etapas (repetible)")
+    parser.add_argument("--keep", action="store_true", help="no borrar el directorio temporal")
+    parser.add_argument("--verbose", action="store_true", help="mostrar la salida de worker.py y main.py")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    try:
+        corpus_dir = os.path.join(work_dir, "corpus")
+        paths, content_bytes = generate_corpus(corpus_dir, args.files, args.records, seed=args.seed,
+                                               **corpus_options(args))
+        total_records = args.files * args.records
+        compressed = sum(os.path.getsize(p) for p in paths)
+        print(f"Corpus: {args.files} segmentos × {args.records} registros {args.kind} ({args.charset}, "
+              f"boilerplate {args.boilerplate:.0%}), {content_bytes / (1024 * 1024):.1f} MB de contenido, "
+              f"{compressed / (1024 * 1024):.1f} MB comprimidos")
+        print(f"{'etapa':<18} {'registros':>9} {'registros/s':>12} {'MB/s':>8} {'tiempo (s)':>10} {'pico RSS MB':>12}")
+
+        for stage in args.stage or STAGES:
+            if stage == "extract" and args.kind != "response":
+                print(f"{'extract':<18} (solo aplica a --kind response)")
+                continue
+            if stage != "scaling":
+                stage_dir = tempfile.mkdtemp(prefix=f"{stage}_", dir=work_dir)
+                records, nbytes, elapsed, rss_mb, error = run_stage(stage, paths, stage_dir, args.verbose)
+                report(stage, records or total_records, nbytes or content_bytes, elapsed, rss_mb, error)
+                continue
+
+            baseline = None
+            for workers in [int(n) for n in args.workers.split(",")]:
+                stage_dir = tempfile.mkdtemp(prefix=f"scaling_{workers}_", dir=work_dir)
+                _, _, elapsed, rss_mb, error = run_stage(stage, paths, stage_dir, args.verbose, (workers,))
+                report(f"scaling x{workers}", total_records, content_bytes, elapsed, rss_mb, error)
+                if not error:
+                    baseline = baseline or elapsed
+                    print(f"{'':<18} speedup {baseline / elapsed:.2f}x, eficiencia {baseline / elapsed / workers:.0%}")
+    finally:
+        if args.keep:
+            print(f"Archivos en {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+Generador de segmentos `.warc.gz` sintéticos para los benchmarks.
+
+Uso:
+    python benchmarks/synthetic_warc.py DIRECTORIO [--files N] [--records N]
+        [--kind response|conversion] [--article-kb KB] [--charset utf-8]
+        [--boilerplate 0.4] [--seed 0]
+
+Produce noticias económicas en español con el mismo formato que publica la
+ingesta (CC-MAIN-<crawl>_news_<n>.warc.gz, un miembro gzip por registro):
+- `response`: respuesta HTTP con HTML, codificado y declarado en `--charset`
+  (cabecera Content-Type y <meta charset>), con scripts, estilos, menús y pie;
+- `conversion`: registro WET de texto plano, como los WET de Common Crawl.
+
+`--boilerplate` es la fracción aproximada del HTML que no es el artículo
+(scripts, estilos, nav, aside, footer). Cada artículo se arma con frases
+aleatorias, así que la deduplicación no descarta registros entre sí.
+"""
+import argparse
+import io
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+from warcio.statusandheaders import StatusAndHeaders
+from warcio.warcwriter import WARCWriter
+
+DOMAINS = ["eltiempo.com", "portafolio.co", "larepublica.co", "semana.com", "elespectador.com"]
+SECTIONS = ["economia", "finanzas", "negocios", "mercados"]
+
+SUBJECTS = [
+    "El dólar", "La tasa de cambio", "El COLCAP", "Ecopetrol", "El Banco de la República",
+    "El Ministerio de Hacienda", "La DIAN", "El precio del petróleo Brent", "La inflación",
+    "El déficit fiscal", "Las exportaciones de café", "El desempleo", "La reforma tributaria",
+    "Los bonos TES", "El peso colombiano", "La gasolina", "El gas natural", "El PIB",
+]
+VERBS = [
+    "cerró la jornada con", "registró", "anticipa", "reportó", "se ubicó en", "proyecta",
+    "acumula", "mostró", "descartó", "confirmó",
+]
+OBJECTS = [
+    "una caída del {pct} %", "un alza del {pct} %", "un recaudo de {n} billones de pesos",
+    "un nivel de ${n}.{m:03d}", "una variación anual de {pct} %", "presiones sobre los precios",
+    "nuevas inversiones en el sector minero", "un recorte de tasas de {pct} puntos",
+    "un aumento de la deuda pública", "menores importaciones de combustibles",
+]
+CLAUSES = [
+    "según analistas consultados", "de acuerdo con cifras oficiales", "pese a la volatilidad de los mercados",
+    "en medio de la incertidumbre global", "tras la decisión de la Reserva Federal",
+    "por cuenta del comportamiento del crudo", "mientras los inversionistas esperan el presupuesto",
+    "en una semana marcada por la devaluación", "con un fuerte volumen de negociación",
+]
+
+NAV = ('<header><nav><ul><li><a href="/">Inicio</a></li><li><a href="/economia/">Economía</a></li>'
+       '<li><a href="/deportes/">Deportes</a></li><li><a href="/opinion/">Opinión</a></li></ul></nav></header>\n')
+SCRIPT = ('<script>window.dataLayer = window.dataLayer || []; function gtag(){dataLayer.push(arguments);}'
+          ' if (a < b && c > d) { gtag("event", "nota_vista", {"seccion": "economia"}); }</script>\n')
+STYLE = "<style>body { font-family: Georgia, serif; } .nav > li { display: inline; margin: 0 8px; }</style>\n"
+ASIDE = '<aside><h3>Lo más leído</h3><ul><li><a href="#">{headline}</a></li></ul></aside>\n'
+FOOTER = ('<footer><form><input name="email" placeholder="Correo"><button>Suscribirse</button></form>'
+          '<p>© Casa Editorial. Prohibida su reproducción total o parcial.</p></footer>\n')
+
+
+def _sentence(rng):
+    obj = rng.choice(OBJECTS).format(pct=f"{rng.uniform(0.1, 9.9):.1f}".replace(".", ","),
+                                     n=rng.randint(1, 40), m=rng.randint(0, 999))
+    return f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {obj}, {rng.choice(CLAUSES)}."
+
+
+def article_paragraphs(rng, target_bytes):
+    """Párrafos de texto hasta sumar aproximadamente target_bytes."""
+    paragraphs, size = [], 0
+    while size < target_bytes:
+        paragraph = " ".join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+        paragraphs.append(paragraph)
+        size += len(paragraph.encode("utf-8"))
+    return paragraphs
+
+
+def build_html(rng, article_bytes, boilerplate_ratio, charset):
+    headline = _sentence(rng)
+    paragraphs = article_paragraphs(rng, article_bytes)
+    body = "".join(f"<p>{p}</p>\n" for p in paragraphs)
+
+    # Relleno de boilerplate hasta la fracción pedida del documento
+    article_size = len(body)
+    target = int(article_size * boilerplate_ratio / max(1e-6, 1 - boilerplate_ratio)) if boilerplate_ratio > 0 else 0
+    chunks = [SCRIPT, STYLE, NAV, ASIDE.format(headline=_sentence(rng)), FOOTER]
+    boilerplate, size, i = [], 0, 0
+    while size < target:
+        chunk = chunks[i % len(chunks)]
+        boilerplate.append(chunk)
+        size += len(chunk)
+        i += 1
+    head = [c for c in boilerplate if c.startswith(("<script", "<style"))]
+    top = [c for c in boilerplate if c.startswith("<header")]
+    bottom = [c for c in boilerplate if c.startswith(("<aside", "<footer"))]
+
+    return (f'<!DOCTYPE html>\n<html lang="es"><head><meta charset="{charset}">'
+            f"<title>{headline}</title>\n{''.join(head)}</head><body>\n{''.join(top)}"
+            f"<article><h1>{headline}</h1>\n{body}</article>\n{''.join(bottom)}</body></html>\n"), paragraphs
+
+
+def write_segment(path, records, kind="response", article_kb=6.0, charset="utf-8",
+                  boilerplate_ratio=0.4, seed=0, start_date=None):
+    """
+    Escribe un segmento con `records` registros y retorna los bytes de
+    contenido (HTML o texto, sin comprimir) que contiene.
+    """
+    rng = random.Random(seed)
+    start_date = start_date or datetime(2024, 3, 1, tzinfo=timezone.utc)
+    content_bytes = 0
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as output:
+        writer = WARCWriter(output, gzip=True)
+        for i in range(records):
+            domain = rng.choice(DOMAINS)
+            url = f"https://www.{domain}/{rng.choice(SECTIONS)}/nota-{seed}-{i}"
+            warc_date = (start_date + timedelta(days=rng.randint(0, 29), seconds=rng.randint(0, 86399)))
+            warc_headers = {"WARC-Date": warc_date.strftime("%Y-%m-%dT%H:%M:%SZ")}
+
+            if kind == "conversion":
+                _, paragraphs = build_html(rng, article_kb * 1024, 0, charset)
+                payload = "\n".join(paragraphs).encode("utf-8")
+                record = writer.create_warc_record(url, "conversion", payload=io.BytesIO(payload),
+                                                   warc_content_type="text/plain", warc_headers_dict=warc_headers)
+            else:
+                html, _ = build_html(rng, article_kb * 1024, boilerplate_ratio, charset)
+                payload = html.encode(charset, errors="xmlcharrefreplace")
+                http_headers = StatusAndHeaders("200 OK", [
+                    ("Content-Type", f"text/html; charset={charset}"),
+                    ("Content-Length", str(len(payload))),
+                ], protocol="HTTP/1.1")
+                record = writer.create_warc_record(url, "response", payload=io.BytesIO(payload),
+                                                   http_headers=http_headers, warc_headers_dict=warc_headers)
+            writer.write_record(record)
+            content_bytes += len(payload)
+    os.replace(tmp_path, path)
+    return content_bytes
+
+
+def generate_corpus(directory, files, records, crawl_id="CC-MAIN-2024-10", seed=0, **options):
+    """Escribe `files` segmentos en `directory`. Retorna (rutas, bytes de contenido)."""
+    os.makedirs(directory, exist_ok=True)
+    paths, content_bytes = [], 0
+    for n in range(files):
+        path = os.path.join(directory, f"{crawl_id}_news_{seed:04d}_{n:05d}.warc.gz")
+        content_bytes += write_segment(path, records, seed=seed * 100003 + n, **options)
+        paths.append(path)
+    return paths, content_bytes
+
+
+def add_corpus_arguments(parser):
+    parser.add_argument("--records", type=int, default=200, help="registros por segmento")
+    parser.add_argument("--kind", choices=["response", "conversion"], default="response")
+    parser.add_argument("--article-kb", type=float, default=6.0, help="tamaño del texto de cada artículo")
+    parser.add_argument("--charset", default="utf-8", help="p. ej. utf-8, windows-1252, iso-8859-1")
+    parser.add_argument("--boilerplate", type=float, default=0.4, help="fracción del HTML que no es artículo")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def corpus_options(args):
+    return {"kind": args.kind, "article_kb": args.article_kb, "charset": args.charset,
+            "boilerplate_ratio": args.boilerplate}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--files", type=int, default=4)
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+
+    paths, content_bytes = generate_corpus(args.directory, args.files, args.records, seed=args.seed,
+                                           **corpus_options(args))
+    compressed = sum(os.path.getsize(p) for p in paths)
+    print(f"{len(paths)} segmentos en {args.directory}: {args.files * args.records} registros, "
+          f"{content_bytes / (1024 * 1024):.1f} MB de contenido ({compressed / (1024 * 1024):.1f} MB comprimidos)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Detección de artículos casi duplicados con SimHash + LSH.
+
+Cada texto se resume en una firma SimHash de 64 bits a partir de sus 3-gramas
+de palabras. Dos copias del mismo artículo (sindicado en otro medio o vuelto a
+capturar en otro crawl) difieren en pocos bits. La firma se divide en 4 bandas
+de 16 bits: si dos firmas están a distancia de Hamming <= 3, al menos una
+banda coincide exactamente (principio del palomar), así que basta buscar
+candidatos por banda en un índice SQLite y verificar la distancia.
+
+El índice vive en un archivo SQLite compartido por todos los procesos del pod
+(y por los pods, si el volumen soporta locks POSIX). Cada lote se resuelve en
+una transacción BEGIN IMMEDIATE: dos procesos no pueden quedarse ambos con la
+misma noticia.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+
+# drop: no escribir duplicados; flag: escribirlos marcados; off: sin deduplicación
+DEDUP_MODE = os.environ.get("DEDUP_MODE", "drop")
+DEDUP_INDEX_PATH = Path(os.environ.get("DEDUP_INDEX_PATH", "/data/processed/.dedup/index.sqlite"))
+# Con 4 bandas la búsqueda es exhaustiva hasta distancia 3; con valores mayores
+# solo se encuentran los candidatos que comparten alguna banda
+DEDUP_MAX_DISTANCE = int(os.environ.get("DEDUP_MAX_DISTANCE", "3"))
+DEDUP_BATCH_SIZE = 200
+
+SHINGLE_SIZE = 3
+BANDS = 4
+BAND_BITS = 64 // BANDS
+_BAND_MASK = (1 << BAND_BITS) - 1
+_MASK64 = (1 << 64) - 1
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def simhash(text):
+    """Firma SimHash de 64 bits (entero sin signo) de los 3-gramas de palabras del texto."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles],
+        dtype=np.uint64,
+    )
+    # Bit i de la firma = mayoría del bit i entre los hashes de los shingles
+    bits = np.unpackbits(hashes.view(np.uint8), bitorder="little").reshape(-1, 64)
+    majority = bits.sum(axis=0) * 2 > len(shingles)
+    return int(np.packbits(majority, bitorder="little").view(np.uint64)[0])
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _to_signed(value):
+    # SQLite guarda enteros con signo de 64 bits
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class DedupIndex:
+    def __init__(self, path, max_distance=3):
+        self.path = path
+        self.max_distance = max_distance
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), timeout=60, isolation_level=None)
+        # El índice es reconstruible: no hace falta fsync en cada lote
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS signatures (
+                id INTEGER PRIMARY KEY,
+                simhash INTEGER NOT NULL,
+                doc TEXT NOT NULL UNIQUE,
+                crawl TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS bands (
+                band INTEGER NOT NULL,
+                value INTEGER NOT NULL,
+                signature_id INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bands_lookup ON bands (band, value)")
+
+    def _find(self, signature):
+        """doc del primer candidato a distancia <= max_distance, o None."""
+        for band in range(BANDS):
+            value = (signature >> (band * BAND_BITS)) & _BAND_MASK
+            for stored, doc in self._conn.execute(
+                "SELECT s.simhash, s.doc FROM bands b JOIN signatures s ON s.id = b.signature_id "
+                "WHERE b.band = ? AND b.value = ?", (band, value)
+            ):
+                if hamming(signature, stored & _MASK64) <= self.max_distance:
+                    return doc
+        return None
+
+    def resolve(self, items):
+        """
+        items: lista de (doc, crawl, signature). `doc` identifica el registro
+        (crawl|url|fecha), de modo que reprocesar un archivo no lo marca como
+        duplicado de sí mismo. Retorna, por item, el doc del original o None si
+        es nuevo (en cuyo caso queda registrado).
+        """
+        results = []
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for doc, crawl, signature in items:
+                if self._conn.execute("SELECT 1 FROM signatures WHERE doc = ?", (doc,)).fetchone():
+                    results.append(None)
+                    continue
+                original = self._find(signature)
+                results.append(original)
+                if original is not None:
+                    continue
+                cursor = self._conn.execute(
+                    "INSERT INTO signatures (simhash, doc, crawl) VALUES (?, ?, ?)",
+                    (_to_signed(signature), doc, crawl),
+                )
+                self._conn.executemany(
+                    "INSERT INTO bands (band, value, signature_id) VALUES (?, ?, ?)",
+                    [(band, (signature >> (band * BAND_BITS)) & _BAND_MASK, cursor.lastrowid)
+                     for band in range(BANDS)],
+                )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return results
+
+    def close(self):
+        self._conn.close()
+
+
+_index = None
+_index_pid = None
+
+
+def get_index():
+    """Índice del proceso actual (una conexión por proceso: no se comparten tras fork)."""
+    global _index, _index_pid
+    if _index is None or _index_pid != os.getpid():
+        _index = DedupIndex(DEDUP_INDEX_PATH, DEDUP_MAX_DISTANCE)
+        _index_pid = os.getpid()
+    return _index
+
+
+def mark_duplicates(items, crawl_id, counts, stats=None):
+    """
+    Recibe tuplas (date, url, text, ...) y genera las mismas tuplas con
+    duplicate_of al final (None para los originales). Resuelve contra el índice
+    en lotes de DEDUP_BATCH_SIZE para no abrir una transacción por registro.
+    Los None (registros descartados antes) pasan tal cual. Cuenta los
+    duplicados en counts["duplicates"] y, con `stats`, el tiempo de la etapa dedup.
+    """
+    if DEDUP_MODE == "off":
+        for item in items:
+            yield item if item is None else item + (None,)
+        return
+
+    index = get_index()
+    batch = []
+
+    def flush():
+        start = time.perf_counter()
+        resolved = index.resolve([(f"{crawl_id}|{item[1]}|{item[0]}", crawl_id, simhash(item[2]))
+                                  for item in batch])
+        if stats is not None:
+            stats.add("dedup", time.perf_counter() - start, sum(len(item[2]) for item in batch))
+        for item, original in zip(batch, resolved):
+            if original is not None:
+                counts["duplicates"] += 1
+            yield item + (original,)
+        batch.clear()
+
+    for item in items:
+        if item is None:
+            yield None
+            continue
+        batch.append(item)
+        if len(batch) >= DEDUP_BATCH_SIZE:
+            yield from flush()
+    if batch:
+        yield from flush()
@@ -0,0 +1,234 @@
+"""
+Motor de extracción de texto desde HTML.
+
+Backends disponibles (se elige con EXTRACTION_BACKEND=auto|selectolax|lxml|python):
+- selectolax (lexbor/modest): parser en C, el más rápido si está instalado;
+- lxml: parser libxml2;
+- python: una sola pasada con un patrón precompilado, sin dependencias.
+
+Todos descartan script/style, el boilerplate de navegación (nav, footer,
+aside) y los controles de formulario (button, select, textarea), decodifican todas las entidades HTML y normalizan
+espacios, de modo que la salida es comparable entre backends.
+"""
+import codecs
+import html
+import os
+import re
+
+# Elementos cuyo contenido no es texto visible
+RAW_TEXT_TAGS = ("script", "style", "noscript", "template", "svg", "iframe")
+# Bloques de navegación/boilerplate. <header> no se incluye: dentro de <article>
+# suele contener el titular.
+BOILERPLATE_TAGS = ("nav", "footer", "aside")
+# Controles de formulario. <form> se conserva con su contenido: en sitios ASP.NET
+# envuelve toda la página, artículo incluido. <input> es vacío y no aporta texto.
+FORM_CONTROL_TAGS = ("button", "select", "textarea")
+DROP_TAGS = RAW_TEXT_TAGS + BOILERPLATE_TAGS + FORM_CONTROL_TAGS
+
+EXTRACTION_BACKEND = os.environ.get("EXTRACTION_BACKEND", "auto")
+
+# Bytes máximos (ya descomprimidos) que se leen de cada registro; el resto se descarta
+MAX_RECORD_BYTES = int(os.environ.get("MAX_RECORD_MB", "5")) * 1024 * 1024
+READ_CHUNK_BYTES = 64 * 1024
+# Cuántos bytes iniciales se inspeccionan buscando <meta charset>
+CHARSET_SNIFF_BYTES = 4096
+
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+_CHARSET_RE = re.compile(rb"""charset\s*=\s*["']?\s*([A-Za-z0-9_:.-]+)""", re.IGNORECASE)
+_META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_:.-]+)""", re.IGNORECASE)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# Una sola pasada: a partir de cada '<' se consume el elemento descartado
+# completo (hasta su cierre), un comentario o una etiqueta suelta.
+_MARKUP_RE = re.compile(
+    r"<(?:(%s)\b[^>]*>.*?</\1\s*>|!--.*?-->|[!/?A-Za-z][^>]*>)" % "|".join(DROP_TAGS),
+    re.DOTALL | re.IGNORECASE,
+)
+
+
+def normalize_text(text):
+    """Decodifica entidades y colapsa espacios."""
+    return _WHITESPACE_RE.sub(" ", html.unescape(text)).strip()
+
+
+def _python_extract(html_content):
+    """
+    Backend sin dependencias. Un único patrón precompilado reemplaza por un
+    espacio cada etiqueta, comentario o elemento descartado (con su contenido);
+    luego se decodifican todas las entidades y se normalizan espacios.
+    """
+    return normalize_text(_MARKUP_RE.sub(" ", html_content))
+
+
+class Extractor:
+    """
+    Interfaz feed()/close() común a todos los backends. No parsea por partes:
+    feed() solo acumula el texto ya decodificado (acotado por MAX_RECORD_BYTES
+    en extract_from_stream) y close() parsea el registro completo una vez.
+    """
+
+    def __init__(self, extract):
+        self._extract = extract
+        self._chunks = []
+
+    def feed(self, chunk):
+        self._chunks.append(chunk)
+
+    def close(self):
+        text = self._extract("".join(self._chunks))
+        self._chunks = []
+        return text
+
+
+class Backend:
+    def __init__(self, name, extract):
+        self.name = name
+        self.extract = extract
+
+    def extractor(self):
+        """Nuevo extractor (feed/close)."""
+        return Extractor(self.extract)
+
+
+def _load_selectolax():
+    try:
+        from selectolax.lexbor import LexborHTMLParser as HTMLParser
+    except ImportError:
+        from selectolax.parser import HTMLParser
+
+    def extract(html_content):
+        tree = HTMLParser(html_content)
+        tree.strip_tags(list(DROP_TAGS))
+        if tree.root is None:
+            return ""
+        return normalize_text(tree.root.text(separator=" "))
+
+    return Backend("selectolax", extract)
+
+
+def _load_lxml():
+    import lxml.html
+    from lxml import etree
+
+    def extract(html_content):
+        if not html_content.strip():
+            return ""
+        try:
+            tree = lxml.html.document_fromstring(html_content)
+        except (etree.ParserError, ValueError):
+            # Documento vacío o con declaración de encoding: usar el backend sin dependencias
+            return _python_extract(html_content)
+        etree.strip_elements(tree, *DROP_TAGS, etree.Comment, with_tail=False)
+        return normalize_text(" ".join(tree.itertext()))
+
+    return Backend("lxml", extract)
+
+
+_LOADERS = {
+    "selectolax": _load_selectolax,
+    "lxml": _load_lxml,
+    "python": lambda: Backend("python", _python_extract),
+}
+
+_backends = {}
+
+
+def available_backends():
+    """Nombres de los backends que se pueden cargar en este entorno."""
+    names = []
+    for name in _LOADERS:
+        try:
+            get_backend(name)
+            names.append(name)
+        except ImportError:
+            continue
+    return names
+
+
+def get_backend(name=None):
+    """
+    Retorna el backend pedido (o EXTRACTION_BACKEND). Con "auto" se usa el
+    más rápido disponible: selectolax, luego lxml, luego python.
+    """
+    name = name or EXTRACTION_BACKEND
+    if name == "auto":
+        for candidate in ("selectolax", "lxml", "python"):
+            try:
+                return get_backend(candidate)
+            except ImportError:
+                continue
+    if name not in _backends:
+        _backends[name] = _LOADERS[name]()
+    return _backends[name]
+
+
+def extract_text(html_content, backend=None):
+    return get_backend(backend).extract(html_content)
+
+
+def is_html_content_type(content_type):
+    """Sin Content-Type se asume HTML; con él, solo text/html y XHTML."""
+    if not content_type:
+        return True
+    return content_type.split(";", 1)[0].strip().lower() in HTML_CONTENT_TYPES
+
+
+def _normalize_charset(label):
+    try:
+        name = codecs.lookup(label.decode("ascii", "ignore")).name
+    except LookupError:
+        return None
+    # Como en los navegadores: las páginas "latin-1" suelen ser windows-1252
+    return "cp1252" if name in ("latin-1", "iso8859-1", "ascii") else name
+
+
+def detect_charset(content_type, head):
+    """
+    Charset declarado en el header Content-Type o, si no, en un <meta> de los
+    primeros bytes. Sin declaración: utf-8 si el inicio es UTF-8 válido, si no
+    windows-1252 (lo habitual en los sitios colombianos en Latin-1).
+    """
+    if content_type:
+        match = _CHARSET_RE.search(content_type.encode("latin-1", "ignore"))
+        if match and _normalize_charset(match.group(1)):
+            return _normalize_charset(match.group(1))
+
+    match = _META_CHARSET_RE.search(head[:CHARSET_SNIFF_BYTES])
+    if match and _normalize_charset(match.group(1)):
+        return _normalize_charset(match.group(1))
+
+    try:
+        # Un carácter multibyte puede quedar cortado al final del bloque
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+
+def extract_from_stream(stream, content_type=None, max_bytes=None, backend=None):
+    """
+    Lee un cuerpo HTML por bloques de READ_CHUNK_BYTES hasta max_bytes y lo
+    decodifica de forma incremental con el charset detectado; el extractor
+    acumula el texto y lo parsea entero al cerrar. Retorna (texto, truncado);
+    la memoria usada por registro queda acotada por max_bytes sin importar el
+    tamaño de la página.
+    """
+    max_bytes = MAX_RECORD_BYTES if max_bytes is None else max_bytes
+    extractor = get_backend(backend).extractor()
+
+    head = stream.read(min(READ_CHUNK_BYTES, max_bytes))
+    decoder = codecs.getincrementaldecoder(detect_charset(content_type, head))(errors="replace")
+
+    remaining = max_bytes - len(head)
+    chunk = head
+    while chunk:
+        extractor.feed(decoder.decode(chunk))
+        if remaining <= 0:
+            break
+        chunk = stream.read(min(READ_CHUNK_BYTES, remaining))
+        remaining -= len(chunk)
+
+    truncated = remaining <= 0 and bool(stream.read(1))
+    extractor.feed(decoder.decode(b"", final=True))
+    return extractor.close(), truncated
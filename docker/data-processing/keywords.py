@@ -0,0 +1,141 @@
+"""
+Conteo de palabras clave económicas por categoría en una sola pasada.
+
+El texto se pasa a minúsculas y se le quitan las tildes (str.translate), de
+modo que "Petróleo", "petroleo" y "PETRÓLEO" cuentan igual. Todas las palabras
+clave se buscan a la vez: con pyahocorasick (autómata Aho-Corasick) si está
+instalado, o con una única expresión regular precompilada. En ambos casos solo
+cuentan coincidencias de palabra completa y se resuelven igual: de izquierda a
+derecha, la palabra clave más larga que empieza en cada posición, sin solapes.
+"""
+import os
+import re
+
+try:
+    import ahocorasick
+except ImportError:  # opcional: sin él se usa la expresión regular
+    ahocorasick = None
+
+# Categorías que se exportan como columnas kw_<categoria>
+KEYWORD_CATEGORIES = {
+    "mercados": [
+        "bolsa", "bolsa de valores", "colcap", "accion", "acciones", "mercado", "mercados",
+        "bursatil", "inversion", "inversiones", "inversionista", "inversionistas",
+        "bonos", "tes", "valorizacion", "dividendos",
+    ],
+    "divisas": [
+        "dolar", "dolares", "divisa", "divisas", "tasa de cambio", "trm", "peso colombiano",
+        "devaluacion", "revaluacion", "euro",
+    ],
+    "fiscal": [
+        "impuesto", "impuestos", "tributaria", "reforma tributaria", "dian", "iva",
+        "deficit", "deficit fiscal", "presupuesto", "deuda publica", "gasto publico",
+        "hacienda", "regla fiscal",
+    ],
+    "energia": [
+        "petroleo", "crudo", "brent", "wti", "barril", "barriles", "ecopetrol",
+        "gas", "gasolina", "combustible", "combustibles", "energia", "mineria",
+    ],
+}
+# Términos económicos generales: suman a la relevancia pero no tienen columna propia
+KEYWORDS_GENERAL = [
+    "economia", "inflacion", "precio", "precios", "banco", "finanzas", "pib",
+    "crecimiento", "exportacion", "exportaciones", "importacion", "importaciones",
+    "empleo", "desempleo", "gobierno", "ministerio", "reforma",
+]
+
+CATEGORY_COLUMNS = [f"kw_{category}" for category in KEYWORD_CATEGORIES]
+
+# Mínimo de coincidencias para conservar un registro; 0 desactiva el filtro
+RELEVANCE_FILTER = int(os.environ.get("RELEVANCE_FILTER", "0"))
+
+_FOLD_TABLE = str.maketrans("áéíóúüñàèìòù", "aeiouunaeiou")
+# Mismo criterio de carácter de palabra que \b en la expresión regular
+_is_word_char = re.compile(r"\w").match
+
+
+def fold(text):
+    """Minúsculas y sin tildes."""
+    return text.lower().translate(_FOLD_TABLE)
+
+
+def _keyword_map():
+    mapping = {}
+    for category, words in KEYWORD_CATEGORIES.items():
+        for word in words:
+            mapping[fold(word)] = category
+    for word in KEYWORDS_GENERAL:
+        mapping.setdefault(fold(word), None)
+    return mapping
+
+
+_KEYWORDS = _keyword_map()
+
+
+class KeywordMatcher:
+    def __init__(self, keywords, backend="auto"):
+        """backend: "auto" (pyahocorasick si está instalado), "ahocorasick" o "regex"."""
+        self.keywords = keywords
+        self.backend = backend if backend != "auto" else ("ahocorasick" if ahocorasick is not None else "regex")
+        if self.backend == "ahocorasick":
+            self._automaton = ahocorasick.Automaton()
+            for word, category in keywords.items():
+                self._automaton.add_word(word, (len(word), category))
+            self._automaton.make_automaton()
+        else:
+            # Alternativas más largas primero para que "reforma tributaria" gane a "reforma"
+            alternatives = sorted(keywords, key=len, reverse=True)
+            self._pattern = re.compile(r"\b(?:%s)\b" % "|".join(map(re.escape, alternatives)))
+
+    def iter_matches(self, folded):
+        """Categoría (o None para términos generales) de cada coincidencia."""
+        if self.backend == "regex":
+            for match in self._pattern.finditer(folded):
+                yield self.keywords[match.group(0)]
+            return
+
+        # Todas las coincidencias de palabra completa, la más larga por posición de
+        # inicio: si "reforma tributaria" no cierra palabra ("reforma tributarias")
+        # queda "reforma", igual que al probar las alternativas de la regex
+        longest = {}
+        for end, (length, category) in self._automaton.iter(folded):
+            start = end - length + 1
+            if start > 0 and _is_word_char(folded[start - 1]):
+                continue
+            if end + 1 < len(folded) and _is_word_char(folded[end + 1]):
+                continue
+            if length > longest.get(start, (0, None))[0]:
+                longest[start] = (length, category)
+
+        # Sin solapes: tras una coincidencia se sigue desde su final
+        position = 0
+        for start in sorted(longest):
+            if start < position:
+                continue
+            length, category = longest[start]
+            position = start + length
+            yield category
+
+
+_matcher = None
+
+
+def get_matcher():
+    global _matcher
+    if _matcher is None:
+        _matcher = KeywordMatcher(_KEYWORDS)
+    return _matcher
+
+
+def keyword_counts(text):
+    """
+    Retorna (relevance, {kw_<categoria>: n}): relevance es el total de
+    coincidencias, incluidos los términos generales.
+    """
+    counts = dict.fromkeys(CATEGORY_COLUMNS, 0)
+    relevance = 0
+    for category in get_matcher().iter_matches(fold(text)):
+        relevance += 1
+        if category is not None:
+            counts[f"kw_{category}"] += 1
+    return relevance, counts
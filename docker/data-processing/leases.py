@@ -0,0 +1,221 @@
+"""
+Reserva de archivos con leases y cola de reintentos.
+
+Un archivo reservado (movido a /data/processing) tiene un lease en
+/data/processing/.leases/<archivo>.lease con su dueño (host:pid) y su
+vencimiento. El proceso dueño lo renueva desde un hilo de heartbeat; si el pod
+muere, el lease vence y cualquier worker vivo devuelve el archivo a /data/raw
+para que se procese de nuevo.
+
+Los archivos que fallan pasan a /data/processing/.retry con su número de
+intentos y la hora del próximo intento (backoff exponencial); al agotar los
+intentos terminan en /data/processing/dead-letter.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+
+def index_path(path):
+    """Índice de offsets que acompaña a un bundle (mismo criterio que worker.bundle_index_path)."""
+    return path.with_name(path.name + ".idx")
+
+
+def move_with_index(src, dst):
+    """
+    Mueve un archivo junto con su `.idx`, si lo tiene. El índice se mueve
+    primero, igual que la ingesta lo publica antes que el bundle. Retorna False
+    si el archivo ya no estaba (otro worker lo movió).
+    """
+    moved_index = False
+    try:
+        os.rename(index_path(src), index_path(dst))
+        moved_index = True
+    except FileNotFoundError:
+        pass
+    try:
+        os.rename(src, dst)
+    except FileNotFoundError:
+        if moved_index:
+            os.rename(index_path(dst), index_path(src))
+        return False
+    return True
+
+
+def _write_json(path, data):
+    """Escritura atómica (temp+rename), igual que los segmentos."""
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class LeaseManager:
+    def __init__(self, directory, ttl_seconds, owner=None):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self._held = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, name):
+        return self.directory / f"{name}.lease"
+
+    def _write(self, name):
+        now = time.time()
+        _write_json(self._path(name), {"owner": self.owner, "renewed_at": now, "expires_at": now + self.ttl_seconds})
+
+    def acquire(self, name):
+        with self._lock:
+            self._write(name)
+            self._held.add(name)
+
+    def release(self, name):
+        with self._lock:
+            self._held.discard(name)
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+
+    def holds(self, name):
+        """True si el lease sigue siendo de este proceso (nadie lo reclamó por vencido)."""
+        lease = _read_json(self._path(name))
+        return lease is not None and lease.get("owner") == self.owner
+
+    def renew(self):
+        with self._lock:
+            for name in list(self._held):
+                if self.holds(name):
+                    self._write(name)
+                else:
+                    logging.warning(f"Lease perdido: {name} fue reclamado por otro worker")
+                    self._held.discard(name)
+
+    def start_heartbeat(self):
+        def beat():
+            while not self._stop.wait(self.ttl_seconds / 3):
+                try:
+                    self.renew()
+                except OSError as e:
+                    logging.warning(f"Error renovando leases: {e}")
+
+        self._thread = threading.Thread(target=beat, name="lease-heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def scan(self):
+        """Retorna (vencidos, activos de otros dueños) como listas de nombres de archivo."""
+        now = time.time()
+        expired, foreign = [], []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".lease") or entry.name.startswith("."):
+                continue
+            name = entry.name[:-len(".lease")]
+            lease = _read_json(self.directory / entry.name)
+            if lease is None:
+                continue
+            if lease["expires_at"] < now:
+                expired.append(name)
+            elif lease["owner"] != self.owner:
+                foreign.append(name)
+        return expired, foreign
+
+    def steal(self, name):
+        """
+        Se queda con un lease vencido. El rename del archivo de lease es
+        atómico, así que si varios workers lo intentan a la vez solo uno gana.
+        """
+        tombstone = self.directory / f".{name}.lease.{self.owner.replace(':', '_')}"
+        try:
+            os.rename(self._path(name), tombstone)
+        except OSError:
+            return False
+        lease = _read_json(tombstone)
+        os.remove(tombstone)
+        if lease is not None and lease["expires_at"] >= time.time():
+            # Se renovó justo antes del rename: devolverlo
+            _write_json(self._path(name), lease)
+            return False
+        return True
+
+
+class RetryQueue:
+    def __init__(self, directory, dead_letter_dir, max_attempts, base_delay, max_delay):
+        self.directory = directory
+        self.dead_letter_dir = dead_letter_dir
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        directory.mkdir(parents=True, exist_ok=True)
+        dead_letter_dir.mkdir(parents=True, exist_ok=True)
+
+    def _state_path(self, name):
+        return self.directory / f"{name}.retry.json"
+
+    def attempts(self, name):
+        state = _read_json(self._state_path(name))
+        return state["attempts"] if state else 0
+
+    def fail(self, path, error):
+        """
+        Registra un fallo del archivo `path` (en /data/processing). Retorna
+        "retry" si queda en cola o "dead_letter" si agotó los intentos.
+        """
+        name = path.name
+        attempts = self.attempts(name) + 1
+        if attempts >= self.max_attempts:
+            move_with_index(path, self.dead_letter_dir / name)
+            _write_json(self.dead_letter_dir / f"{name}.error.json", {"attempts": attempts, "error": str(error)})
+            self.forget(name)
+            return "dead_letter"
+
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        move_with_index(path, self.directory / name)
+        _write_json(self._state_path(name), {
+            "attempts": attempts, "next_attempt_at": time.time() + delay, "error": str(error),
+        })
+        return "retry"
+
+    def forget(self, name):
+        try:
+            os.remove(self._state_path(name))
+        except FileNotFoundError:
+            pass
+
+    def pending(self):
+        """Nombres en cola de reintento (con el archivo presente)."""
+        return [p.name[:-len(".retry.json")] for p in self.directory.glob("*.retry.json")
+                if (self.directory / p.name[:-len(".retry.json")]).exists()]
+
+    def requeue_due(self, raw_dir):
+        """Devuelve a /data/raw los archivos cuyo backoff ya venció. Retorna cuántos."""
+        now = time.time()
+        moved = 0
+        for name in self.pending():
+            state = _read_json(self._state_path(name))
+            if state is None or state["next_attempt_at"] > now:
+                continue
+            # El estado se conserva para contar los intentos si vuelve a fallar
+            if move_with_index(self.directory / name, raw_dir / name):
+                logging.info(f"Reintentando {name} (intento {state['attempts'] + 1}/{self.max_attempts})")
+                moved += 1
+        return moved
@@ -1,11 +1,21 @@
+import json
 import os
 import shutil
 import time
 import logging
 import signal
 import sys
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
 from pathlib import Path
-from worker import process_wet_file
+from dedup import DEDUP_MODE
+from leases import LeaseManager, RetryQueue, move_with_index
+from parquet_output import PARQUET_DATASET_DIR, PartitionRoller, recover_compactions
+from profiling import STAGES, empty_totals, merge_stages
+from watcher import create_watcher
+from worker import bundle_index_path, commit_output, discard_staged, process_wet_file, staging_path
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -13,8 +23,46 @@ DATA_RAW = Path("/data/raw")
 DATA_PROCESSING = Path("/data/processing")
 DATA_PROCESSED = Path("/data/processed")
 
+# Modo streaming: consumir segmentos en cuanto la ingesta los publica (escritura
+# atómica temp+rename) en lugar de esperar a .ingestion_complete.
+# Con STREAMING_HANDOFF=0 se recupera la barrera original.
+STREAMING_HANDOFF = os.environ.get("STREAMING_HANDOFF", "1") == "1"
+
+# Procesos de trabajo dentro del pod: "auto" usa todas las CPUs disponibles
+# para el contenedor (afinidad y cuota de cgroup); 1 procesa en el propio proceso.
+PROCESSING_WORKERS = os.environ.get("PROCESSING_WORKERS", "1")
+
+# Leases sobre los archivos reservados: el heartbeat los renueva cada TTL/3 y,
+# si un pod muere, otro devuelve sus archivos a /data/raw cuando vencen
+LEASE_TTL_SECONDS = int(os.environ.get("LEASE_TTL_SECONDS", "120"))
+DATA_LEASES = DATA_PROCESSING / ".leases"
+# Archivos fallidos: reintentos con backoff y luego dead-letter
+DATA_RETRY = DATA_PROCESSING / ".retry"
+DATA_DEAD_LETTER = DATA_PROCESSING / "dead-letter"
+MAX_ATTEMPTS = int(os.environ.get("PROCESSING_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY_S = int(os.environ.get("RETRY_BASE_DELAY_S", "30"))
+RETRY_MAX_DELAY_S = int(os.environ.get("RETRY_MAX_DELAY_S", "600"))
+# Si un proceso del pool muere, todos los archivos en curso fallan igual y no se
+# sabe cuál lo causó: vuelven a /data/raw sin gastar un intento, salvo el que
+# estuvo en curso en este número de caídas (probablemente el culpable)
+MAX_POOL_CRASHES = int(os.environ.get("PROCESSING_MAX_POOL_CRASHES", "3"))
+# Salida sin publicar de pods que ya no existen: se borra tras este tiempo sin cambios
+STAGING_MAX_AGE_S = int(os.environ.get("STAGING_MAX_AGE_S", "21600"))
+
+# Detección de archivos nuevos: "auto" usa inotify si está disponible, "poll" lista
+# /data/raw cada POLL_INTERVAL_S. Con inotify igual se vuelve a listar cada
+# WATCH_RESCAN_S, porque en volúmenes de red no llegan eventos de otros pods.
+WATCH_MODE = os.environ.get("WATCH_MODE", "auto")
+POLL_INTERVAL_S = float(os.environ.get("POLL_INTERVAL_S", "5"))
+WATCH_RESCAN_S = float(os.environ.get("WATCH_RESCAN_S", "10"))
+
+# JSON con el tiempo por etapa (por crawl y por proceso) al terminar; vacío = no se escribe
+PROFILE_SUMMARY_PATH = os.environ.get("PROFILE_SUMMARY_PATH", "")
+
 # Global flag for graceful shutdown
 shutdown_requested = False
+# Caídas del pool durante las que cada archivo estaba en curso
+pool_crashes = defaultdict(int)
 
 def signal_handler(signum, frame):
     """Handle termination signals gracefully."""
@@ -24,138 +72,502 @@ def signal_handler(signum, frame):
     shutdown_requested = True
 
 
+def reset_signal_handlers():
+    """
+    Initializer del pool: los hijos heredan signal_handler del padre y se
+    quedarían procesando tras el terminate del executor. El apagado ordenado lo
+    coordina solo el proceso principal.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+
+def available_cpus():
+    """CPUs utilizables por el contenedor: afinidad del proceso limitada por la cuota de cgroup."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    
+    # cgroup v2 (cpu.max = "<quota> <period>") y v1 (cfs_quota_us / cfs_period_us)
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        try:
+            quota = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+            period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+            if quota > 0:
+                cpus = min(cpus, max(1, quota // period))
+        except (OSError, ValueError):
+            pass
+    return cpus
+
+
+def resolve_worker_count():
+    if PROCESSING_WORKERS == "auto":
+        return available_cpus()
+    return max(1, int(PROCESSING_WORKERS))
+
+
+def list_raw_files():
+    """Listar archivos disponibles en RAW (soporta WET y WARC)."""
+    return [f for f in os.listdir(DATA_RAW)
+            if f.endswith(".wet.gz") or f.endswith(".warc.gz")]
+
+
+def claim_file(name, leases):
+    """
+    Intentar "reservar" un archivo moviéndolo a /data/processing.
+    Debido a la concurrencia, varios workers pueden ver el mismo archivo,
+    pero solo el rename atómico tendrá éxito. El ganador registra un lease
+    a su nombre. Retorna la nueva ruta o None.
+    """
+    src = DATA_RAW / name
+    dst = DATA_PROCESSING / name
+    try:
+        # Rename es atómico en POSIX (si está en el mismo volumen)
+        os.rename(src, dst)
+    except OSError:
+        # Otro worker ya lo movió
+        return None
+    
+    # Los bundles llevan su índice de offsets; se mueve junto con el bundle
+    try:
+        os.rename(bundle_index_path(src), bundle_index_path(dst))
+    except FileNotFoundError:
+        pass
+    leases.acquire(name)
+    logging.info(f"Reservado archivo: {name}")
+    return dst
+
+
+def release_claim(target_file, leases):
+    """Deshace claim_file: devuelve el archivo a /data/raw y libera su lease."""
+    name = target_file.name
+    if move_with_index(target_file, DATA_RAW / name):
+        logging.info(f"{name} devuelto a /data/raw sin procesar")
+    leases.release(name)
+
+
+def recover_work(leases, retry_queue):
+    """
+    Devuelve a /data/raw el trabajo abandonado y el que ya puede reintentarse:
+    - archivos con lease vencido (su worker murió);
+    - archivos en /data/processing sin lease (murió entre el rename y el lease);
+    - archivos .err de versiones anteriores, que pasan a la cola de reintentos;
+    - reintentos cuyo backoff ya venció.
+    Retorna cuántos leases activos de otros workers quedan.
+    """
+    expired, foreign = leases.scan()
+    for name in expired:
+        if not leases.steal(name):
+            continue
+        if move_with_index(DATA_PROCESSING / name, DATA_RAW / name):
+            logging.warning(f"Lease vencido: {name} devuelto a /data/raw")
+    
+    now = time.time()
+    leased = set(foreign) | set(expired)
+    for entry in os.scandir(DATA_PROCESSING):
+        name = entry.name
+        if not entry.is_file() or name.startswith("."):
+            continue
+        # Con varias réplicas arrancando a la vez, otra puede mover la entrada
+        # entre el listado y el rename/stat: se omite, como en claim_file
+        if name.endswith(".err"):
+            original = DATA_PROCESSING / name[:-len(".err")]
+            try:
+                os.rename(entry.path, original)
+            except OSError:
+                continue
+            retry_queue.fail(original, "error en una ejecución anterior (.err)")
+            continue
+        if not (name.endswith(".warc.gz") or name.endswith(".wet.gz")) or name in leased:
+            continue
+        if (DATA_LEASES / f"{name}.lease").exists():
+            continue
+        try:
+            changed_at = entry.stat().st_ctime
+        except OSError:
+            continue
+        if now - changed_at > LEASE_TTL_SECONDS:
+            if move_with_index(DATA_PROCESSING / name, DATA_RAW / name):
+                logging.warning(f"Archivo sin lease: {name} devuelto a /data/raw")
+    
+    retry_queue.requeue_due(DATA_RAW)
+    discard_staged(DATA_PROCESSED, max_age=STAGING_MAX_AGE_S)
+    recover_compactions(DATA_PROCESSED / PARQUET_DATASET_DIR, max_age=STAGING_MAX_AGE_S)
+    return len(foreign)
+
+
+def _run_inline(target_file):
+    """Procesa en el propio proceso y entrega el resultado como un Future ya resuelto."""
+    future = Future()
+    try:
+        future.set_result(process_wet_file(str(target_file), str(DATA_PROCESSED)))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def roll_partitions(roller, parts=None):
+    """Compacta las partes Parquet publicadas; si falla, solo quedan archivos pequeños."""
+    try:
+        if parts is None:
+            roller.flush()
+        else:
+            roller.add(parts)
+    except Exception as e:
+        logging.warning(f"No se pudieron compactar partes Parquet: {e}")
+
+
+def handle_result(target_file, future, stats_by_crawl, stats_by_worker, totals, leases, retry_queue, roller):
+    """
+    Publica la salida de un archivo si el lease sigue siendo nuestro, acumula
+    sus estadísticas y libera /data/processing y el lease.
+    """
+    name = target_file.name
+    try:
+        result = future.result()
+        if isinstance(result, dict) and result.get("error"):
+            raise RuntimeError("el worker reportó un error procesando el archivo")
+        # Se decide una sola vez: si se publicó, el archivo se da por procesado
+        owned = leases.holds(name)
+        if owned:
+            commit_output(result, str(DATA_PROCESSED))
+    except Exception as e:
+        # Lo que el intento dejó sin publicar (p. ej. un hijo que murió) no se usa
+        discard_staged(str(DATA_PROCESSED), name)
+        if isinstance(e, BrokenProcessPool) and leases.holds(name):
+            pool_crashes[name] += 1
+            if pool_crashes[name] < MAX_POOL_CRASHES:
+                logging.warning(f"{name}: en curso cuando murió un proceso de trabajo "
+                                f"({pool_crashes[name]}/{MAX_POOL_CRASHES}); se reencola sin gastar un intento")
+                release_claim(target_file, leases)
+                return
+            del pool_crashes[name]
+        logging.error(f"Error procesando {name}: {e}")
+        totals["errors"] += 1
+        if leases.holds(name):
+            # Cola de reintentos con backoff; al agotar los intentos, dead-letter
+            outcome = retry_queue.fail(target_file, e)
+            totals[outcome] += 1
+            logging.info(f"{name}: {'en cola de reintento' if outcome == 'retry' else 'movido a dead-letter'}")
+        leases.release(name)
+        return
+    
+    if not owned:
+        # El lease venció (p. ej. el pod estuvo colgado) y otro worker lo reclamó:
+        # ese worker es ahora el dueño del archivo y de sus estadísticas
+        logging.warning(f"{name} terminó sin lease vigente; se deja al worker que lo reclamó")
+        discard_staged(str(DATA_PROCESSED), name)
+        return
+    
+    # Acumular estadísticas
+    if isinstance(result, dict):
+        crawl = result.get("crawl", "unknown")
+        stats_by_crawl[crawl]["files"] += 1
+        stats_by_crawl[crawl]["records_processed"] += result.get("processed", 0)
+        stats_by_crawl[crawl]["records_saved"] += result.get("saved", 0)
+        stats_by_crawl[crawl]["duplicates"] += result.get("duplicates", 0)
+        if "stages" in result:
+            # Tiempos por etapa medidos dentro de process_warc_file
+            worker = stats_by_worker[result["worker"]]
+            worker["files"] += 1
+            worker["records_processed"] += result.get("processed", 0)
+            for data in (stats_by_crawl[crawl], worker):
+                data["seconds"] += result["seconds"]
+                data["bytes"] += result["bytes"]
+                merge_stages(data["stages"], result["stages"])
+    
+    logging.info(f"Procesado: {name}")
+    totals["files"] += 1
+    
+    # Eliminar el archivo temporal procesado (para no ocupar espacio). La
+    # recuperación de leases u otro worker pudo haberlo movido ya: se omite
+    for path in (target_file, bundle_index_path(target_file)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    retry_queue.forget(name)
+    pool_crashes.pop(name, None)
+    leases.release(name)
+    
+    # Las partes Parquet del archivo ya son visibles; se juntan por partición al llegar al umbral
+    output = result.get("output") if isinstance(result, dict) else None
+    if output is not None and output["format"] == "parquet":
+        roll_partitions(roller, output["parts"])
+
+
+def dedup_ratio(data):
+    """Fracción de noticias candidatas (pasaron los filtros) que eran casi duplicados."""
+    if DEDUP_MODE == "drop":
+        candidates = data["records_saved"] + data["duplicates"]
+    else:
+        candidates = data["records_saved"]
+    return data["duplicates"] / candidates if candidates else 0.0
+
+
+def new_profile_stats():
+    return {"files": 0, "records_processed": 0, "records_saved": 0, "duplicates": 0,
+            "seconds": 0.0, "bytes": 0, "stages": empty_totals()}
+
+
+def stage_shares(data):
+    """'inflate 12% · parse 3% · ...' sobre el tiempo total de los archivos."""
+    if not data["seconds"]:
+        return "sin datos"
+    return " · ".join(f"{stage} {data['stages'][stage]['seconds'] / data['seconds']:.0%}" for stage in STAGES)
+
+
+def log_stages(data):
+    """Tabla de etapas: segundos, fracción del tiempo y MB/s sobre los bytes de cada etapa."""
+    measured = 0.0
+    for stage in STAGES:
+        seconds = data["stages"][stage]["seconds"]
+        nbytes = data["stages"][stage]["bytes"]
+        measured += seconds
+        rate = nbytes / (1024 * 1024) / seconds if seconds else 0.0
+        logging.info(f"  {stage:<9} {seconds:9.2f}s {seconds / data['seconds']:6.1%} {rate:9.1f} MB/s")
+    other = max(0.0, data["seconds"] - measured)
+    logging.info(f"  {'otros':<9} {other:9.2f}s {other / data['seconds']:6.1%}")
+
+
+def write_profile_summary(path, elapsed, workers, stats_by_crawl, stats_by_worker):
+    """Vuelca las estadísticas por etapa como JSON (temp+rename)."""
+    payload = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "elapsed_seconds": round(elapsed, 3),
+        "workers": workers,
+        "by_crawl": dict(stats_by_crawl),
+        "by_worker": dict(stats_by_worker),
+    }
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+        os.replace(tmp_path, path)
+        logging.info(f"Estadísticas por etapa guardadas en {path}")
+    except OSError as e:
+        logging.warning(f"No se pudieron guardar las estadísticas por etapa en {path}: {e}")
+
+
+def log_summary(start_time, stats_by_crawl, stats_by_worker, totals, workers):
+    elapsed = (datetime.now() - start_time).total_seconds()
+    logging.info("=" * 60)
+    logging.info("RESUMEN DE PROCESAMIENTO")
+    logging.info("=" * 60)
+    logging.info(f"Tiempo total: {elapsed:.1f} segundos")
+    logging.info(f"Procesos de trabajo: {workers}")
+    logging.info(f"Archivos procesados: {totals['files']}")
+    logging.info(f"Errores: {totals['errors']} (en reintento: {totals['retry']}, dead-letter: {totals['dead_letter']})")
+    logging.info("-" * 40)
+    logging.info("Distribución por crawl:")
+    total_saved = 0
+    total_processed = 0
+    total_duplicates = 0
+    for crawl_id, data in sorted(stats_by_crawl.items()):
+        logging.info(f"  {crawl_id}:")
+        logging.info(f"    Archivos: {data['files']}")
+        logging.info(f"    Registros: {data['records_saved']}/{data['records_processed']} guardados")
+        logging.info(f"    Duplicados: {data['duplicates']} ({dedup_ratio(data):.1%})")
+        logging.info(f"    Etapas: {stage_shares(data)}")
+        total_saved += data['records_saved']
+        total_processed += data['records_processed']
+        total_duplicates += data['duplicates']
+    logging.info("-" * 40)
+    logging.info(f"TOTAL: {total_saved} noticias guardadas de {total_processed} registros")
+    logging.info(f"Deduplicación ({DEDUP_MODE}): {total_duplicates} casi duplicados")
+    if elapsed > 0:
+        logging.info(f"Throughput: {total_processed / elapsed:.1f} registros/s")
+    
+    # Dónde se va el tiempo: suma de todos los procesos, sin contar la espera de archivos
+    overall = new_profile_stats()
+    for data in stats_by_worker.values():
+        overall["seconds"] += data["seconds"]
+        overall["bytes"] += data["bytes"]
+        merge_stages(overall["stages"], data["stages"])
+    if overall["seconds"] > 0:
+        logging.info("-" * 40)
+        logging.info(f"Tiempo por etapa ({overall['seconds']:.1f}s de proceso, "
+                     f"{overall['bytes'] / (1024 * 1024):.1f} MB comprimidos):")
+        log_stages(overall)
+        logging.info("Por proceso:")
+        for worker_id, data in sorted(stats_by_worker.items()):
+            rate = data["records_processed"] / data["seconds"] if data["seconds"] else 0.0
+            logging.info(f"  {worker_id}: {data['files']} archivos, {data['seconds']:.1f}s, "
+                         f"{rate:.1f} registros/s")
+    logging.info("=" * 60)
+    
+    if PROFILE_SUMMARY_PATH:
+        write_profile_summary(PROFILE_SUMMARY_PATH, elapsed, workers, stats_by_crawl, stats_by_worker)
+
+
 def main():
     # Register signal handlers
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
     
     # Asegurar directorios
+    DATA_RAW.mkdir(parents=True, exist_ok=True)
     DATA_PROCESSING.mkdir(parents=True, exist_ok=True)
     DATA_PROCESSED.mkdir(parents=True, exist_ok=True)
+    # Salida sin publicar y compactaciones a medias de una ejecución anterior de este pod
+    discard_staged(str(DATA_PROCESSED))
+    recover_compactions(DATA_PROCESSED / PARQUET_DATASET_DIR)
     
-    # Esperar a que la ingesta termine (buscar archivo de señal)
+    # Señal explícita de fin del productor: la ingesta la escribe al terminar
     flag_file = DATA_RAW / ".ingestion_complete"
-    logging.info("Worker iniciado. Esperando señal de ingesta completada...")
+    watcher = create_watcher(DATA_RAW, WATCH_MODE, POLL_INTERVAL_S)
     
-    wait_count = 0
-    while not flag_file.exists() and not shutdown_requested:
-        wait_count += 1
-        if wait_count % 6 == 0:  # Log cada 30 segundos
-            logging.info("Aún esperando señal de ingesta...")
-        time.sleep(5)
+    if STREAMING_HANDOFF:
+        # Los segmentos se publican de forma atómica, se pueden consumir de inmediato
+        logging.info("Worker iniciado en modo streaming. Procesando segmentos a medida que llegan...")
+    else:
+        # Esperar a que la ingesta termine (buscar archivo de señal)
+        logging.info("Worker iniciado. Esperando señal de ingesta completada...")
+        
+        last_log = time.monotonic()
+        while not flag_file.exists() and not shutdown_requested:
+            if time.monotonic() - last_log >= 30:
+                logging.info("Aún esperando señal de ingesta...")
+                last_log = time.monotonic()
+            # La señal se crea en /data/raw: inotify despierta en cuanto aparece
+            watcher.wait(WATCH_RESCAN_S)
+        
+        if shutdown_requested:
+            watcher.close()
+            logging.info("Worker terminado antes de iniciar procesamiento")
+            return
+        
+        logging.info("Señal de ingesta detectada. Iniciando procesamiento...")
     
-    if shutdown_requested:
-        logging.info("Worker terminado antes de iniciar procesamiento")
-        return
+    # Un único productor (este proceso) escanea /data/raw y reserva archivos;
+    # con más de un proceso de trabajo, el parseo (CPU) se reparte en un pool.
+    workers = resolve_worker_count()
     
-    logging.info("Señal de ingesta detectada. Iniciando procesamiento...")
+    def new_pool():
+        return ProcessPoolExecutor(max_workers=workers, initializer=reset_signal_handlers)
     
-    # Counter for empty wait cycles (to detect when processing is complete)
-    empty_wait_cycles = 0
-    MAX_EMPTY_CYCLES = 6  # Exit after 30 seconds of no files (6 * 5 sec)
-    files_processed_total = 0
+    pool = new_pool() if workers > 1 else None
+    # Cola de trabajo acotada: cada proceso tiene uno en curso y uno esperando
+    max_in_flight = workers * 2 if pool is not None else 1
+    in_flight = {}  # future -> archivo reservado
+    logging.info(f"Procesos de trabajo: {workers}")
+    
+    def submit(target_file):
+        nonlocal pool
+        if pool is None:
+            return _run_inline(target_file)
+        try:
+            future = pool.submit(process_wet_file, str(target_file), str(DATA_PROCESSED))
+        except BrokenProcessPool:
+            # Un hijo murió (OOM, SIGKILL...): sus archivos en curso fallan con
+            # BrokenProcessPool y vuelven a /data/raw (ver handle_result); se arma un pool nuevo
+            logging.error("Un proceso de trabajo terminó abruptamente; se recrea el pool")
+            pool.shutdown(wait=False)
+            pool = new_pool()
+            future = pool.submit(process_wet_file, str(target_file), str(DATA_PROCESSED))
+        # Un archivo terminado libera un lugar en la cola: despertar al productor
+        future.add_done_callback(lambda _: watcher.wake())
+        return future
     
-    # Statistics collection
-    from collections import defaultdict
-    from datetime import datetime
+    # Statistics collection (agregadas aquí para todos los procesos hijos)
     start_time = datetime.now()
-    stats_by_crawl = defaultdict(lambda: {"files": 0, "records_processed": 0, "records_saved": 0})
-    total_errors = 0
+    stats_by_crawl = defaultdict(new_profile_stats)
+    stats_by_worker = defaultdict(new_profile_stats)
+    totals = {"files": 0, "errors": 0, "retry": 0, "dead_letter": 0}
+    
+    leases = LeaseManager(DATA_LEASES, LEASE_TTL_SECONDS)
+    leases.start_heartbeat()
+    retry_queue = RetryQueue(DATA_RETRY, DATA_DEAD_LETTER, MAX_ATTEMPTS, RETRY_BASE_DELAY_S, RETRY_MAX_DELAY_S)
+    roller = PartitionRoller(staging_path(str(DATA_PROCESSED), "rolled", "{seq}.parquet"))
+    # La primera recuperación la hace el ciclo, dentro del manejo de errores
+    foreign_leases = 0
+    last_recovery = float("-inf")
 
-    while not shutdown_requested:
-        try:
-            # 1. Listar archivos disponibles en RAW (soporta WET y WARC)
-            files = [f for f in os.listdir(DATA_RAW) 
-                     if f.endswith(".wet.gz") or f.endswith(".warc.gz")]
-            
-            if not files:
-                empty_wait_cycles += 1
-                if empty_wait_cycles >= MAX_EMPTY_CYCLES:
-                    # Print summary
-                    elapsed = (datetime.now() - start_time).total_seconds()
-                    logging.info("=" * 60)
-                    logging.info("RESUMEN DE PROCESAMIENTO")
-                    logging.info("=" * 60)
-                    logging.info(f"Tiempo total: {elapsed:.1f} segundos")
-                    logging.info(f"Archivos procesados: {files_processed_total}")
-                    logging.info(f"Errores: {total_errors}")
-                    logging.info("-" * 40)
-                    logging.info("Distribución por crawl:")
-                    total_saved = 0
-                    total_processed = 0
-                    for crawl_id, data in sorted(stats_by_crawl.items()):
-                        logging.info(f"  {crawl_id}:")
-                        logging.info(f"    Archivos: {data['files']}")
-                        logging.info(f"    Registros: {data['records_saved']}/{data['records_processed']} guardados")
-                        total_saved += data['records_saved']
-                        total_processed += data['records_processed']
-                    logging.info("-" * 40)
-                    logging.info(f"TOTAL: {total_saved} noticias guardadas de {total_processed} registros")
-                    logging.info("=" * 60)
-                    break
-                # Check for shutdown before sleeping
-                if shutdown_requested:
-                    break
-                # Esperar un poco antes de volver a verificar
-                time.sleep(5)
-                continue
-            
-            # Reset counter when files are found
-            empty_wait_cycles = 0
-
-            # 2. Intentar "reservar" un archivo moviéndolo
-            # Debido a la concurrencia, varios workers pueden ver el mismo archivo,
-            # pero solo el rename atómico tendrá éxito.
-            target_file = None
-            for f in files:
+    try:
+        while True:
+            try:
+                # Recoger archivos terminados; si la cola está llena, bloquear hasta que se libere uno
+                if in_flight:
+                    timeout = None if len(in_flight) >= max_in_flight or shutdown_requested else 0
+                    done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        handle_result(in_flight.pop(future), future, stats_by_crawl, stats_by_worker, totals,
+                                      leases, retry_queue, roller)
+                
                 if shutdown_requested:
+                    # Terminar lo ya reservado, sin reservar nada nuevo
+                    if in_flight:
+                        continue
                     break
-                src = DATA_RAW / f
-                dst = DATA_PROCESSING / f
-                try:
-                    # Rename es atómico en POSIX (si está en el mismo volumen)
-                    os.rename(src, dst)
-                    target_file = dst
-                    logging.info(f"Reservado archivo: {f}")
-                    break
-                except OSError:
-                    # Si falla (ej. otro worker ya lo movió), intentar con el siguiente
+                
+                if len(in_flight) >= max_in_flight:
                     continue
-            
-            if not target_file:
-                time.sleep(1)
-                continue
-
-            # 3. Procesar el archivo reservado
-            try:
-                result = process_wet_file(str(target_file), str(DATA_PROCESSED))
                 
-                # Acumular estadísticas
-                if isinstance(result, dict):
-                    crawl = result.get("crawl", "unknown")
-                    stats_by_crawl[crawl]["files"] += 1
-                    stats_by_crawl[crawl]["records_processed"] += result.get("processed", 0)
-                    stats_by_crawl[crawl]["records_saved"] += result.get("saved", 0)
-                    if result.get("error"):
-                        total_errors += 1
+                if time.monotonic() - last_recovery >= LEASE_TTL_SECONDS / 3:
+                    foreign_leases = recover_work(leases, retry_queue)
+                    last_recovery = time.monotonic()
                 
-                logging.info(f"Procesado: {target_file.name}")
-                files_processed_total += 1
+                # La señal se lee ANTES de listar: si la ingesta ya terminó y el
+                # listado sale vacío, no puede quedar ningún segmento por publicar.
+                producer_done = flag_file.exists()
                 
-                # 4. Eliminar el archivo temporal procesado (para no ocupar espacio)
-                os.remove(target_file)
+                files = list_raw_files()
+                
+                if not files:
+                    if in_flight:
+                        # Aún hay trabajo en curso; despertar cuando termine algo o llegue un archivo
+                        watcher.wait(WATCH_RESCAN_S)
+                        continue
+                    # Con reintentos pendientes o archivos de otros workers sin terminar
+                    # (que podrían volver a raw si su pod muere) todavía no se sale
+                    foreign_leases = recover_work(leases, retry_queue)
+                    last_recovery = time.monotonic()
+                    if retry_queue.pending() or foreign_leases or list_raw_files():
+                        watcher.wait(min(WATCH_RESCAN_S, 5))
+                        continue
+                    # Terminar solo cuando la ingesta acabó y el backlog está vacío
+                    # (sin STREAMING_HANDOFF la señal ya existía al empezar)
+                    if producer_done:
+                        log_summary(start_time, stats_by_crawl, stats_by_worker, totals, workers)
+                        break
+                    # Dormir hasta que llegue un archivo o la señal de fin
+                    watcher.wait(WATCH_RESCAN_S)
+                    continue
+                
+                # Reservar tantos archivos del listado como quepan en la cola
+                claimed = 0
+                for f in files:
+                    if shutdown_requested or len(in_flight) >= max_in_flight:
+                        break
+                    target_file = claim_file(f, leases)
+                    if target_file:
+                        try:
+                            in_flight[submit(target_file)] = target_file
+                        except Exception:
+                            # Sin esto quedaría en /data/processing con un lease que
+                            # el heartbeat renueva y ningún worker lo recuperaría
+                            release_claim(target_file, leases)
+                            raise
+                        claimed += 1
+                
+                if not claimed:
+                    # Otro worker se llevó los archivos listados: volver a listar enseguida
+                    watcher.wait(0.1)
                 
             except Exception as e:
-                logging.error(f"Error procesando {target_file.name}: {e}")
-                total_errors += 1
-                # Opcional: Mover a una carpeta 'failed' o devolver a 'raw'
-                # Por ahora, simplemente lo renombramos con .err para análisis
-                error_path = target_file.with_suffix(target_file.suffix + ".err")
-                os.rename(target_file, error_path)
-
-        except Exception as e:
-            logging.error(f"Error en el ciclo principal: {e}")
-            time.sleep(5)
+                logging.error(f"Error en el ciclo principal: {e}")
+                time.sleep(5)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True)
+        roll_partitions(roller)
+        leases.stop()
+        watcher.close()
     
     logging.info("Worker terminado gracefully")
 
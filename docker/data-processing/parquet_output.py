@@ -0,0 +1,208 @@
+"""
+Salida columnar de noticias: Parquet particionado estilo Hive.
+
+    /data/processed/news/crawl=<crawl>/day=<YYYY-MM-DD>/part-<origen>.parquet
+
+crawl y day van solo en la ruta (el lector los reconstruye), así que un filtro
+por crawl o rango de fechas descarta directorios completos sin abrirlos. El
+texto es una columna más: quien solo necesita date/crawl no lo lee.
+
+Con segmentos del Index API cada archivo de origen aporta pocas filas por día,
+así que cada proceso junta sus partes de una partición en un solo archivo
+(part-<host>_<pid>_<corrida>_<n>.parquet) al llegar a ROLL_ROWS filas y al
+terminar (ver PartitionRoller).
+"""
+import os
+import socket
+import time
+from collections import defaultdict
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: sin él se mantiene la salida CSV
+    pa = None
+    pq = None
+
+PARQUET_DATASET_DIR = "news"
+ROW_GROUP_SIZE = int(os.environ.get("PARQUET_ROW_GROUP_SIZE", "10000"))
+# Filas a partir de las cuales las partes de una partición se juntan en un archivo
+ROLL_ROWS = int(os.environ.get("PARQUET_ROLL_ROWS", "100000"))
+# Partes ya copiadas a un archivo compactado que todavía no se publicó:
+#   .part-<origen>.parquet.compacting-<etiqueta del archivo compactado>
+COMPACTING_MARK = ".compacting-"
+
+if pa is not None:
+    NEWS_SCHEMA = pa.schema([
+        ("date", pa.timestamp("s")),
+        ("url", pa.string()),
+        ("domain", pa.string()),
+        ("section", pa.string()),
+        ("length", pa.int32()),
+        ("relevance", pa.int16()),
+        ("kw_mercados", pa.int16()),
+        ("kw_divisas", pa.int16()),
+        ("kw_fiscal", pa.int16()),
+        ("kw_energia", pa.int16()),
+        # Registro original (crawl|url|fecha) si es un casi duplicado (DEDUP_MODE=flag)
+        ("duplicate_of", pa.string()),
+        ("text", pa.string()),
+    ])
+
+
+def parquet_available():
+    return pa is not None
+
+
+def parse_warc_date(value):
+    """WARC-Date (ISO 8601, UTC) -> datetime sin zona horaria."""
+    try:
+        return datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S")
+    except (TypeError, ValueError):
+        return None
+
+
+def write_partitions(rows, output_dir, crawl_id, source_name, staged_template):
+    """
+    Escribe las filas de un archivo de entrada, una parte por día, en
+    `staged_template` (con {day}). No quedan visibles hasta commit_partitions:
+    cada parte se nombra según el archivo de origen, de modo que reprocesar un
+    archivo reemplaza su salida en lugar de duplicarla.
+    Retorna [(parte en staging, ruta final, filas), ...].
+    """
+    by_day = defaultdict(list)
+    for row in rows:
+        if row["date"] is None:
+            continue
+        by_day[row["date"].strftime("%Y-%m-%d")].append(row)
+
+    stem = source_name.split(".", 1)[0]
+    parts = []
+    for day, day_rows in by_day.items():
+        partition = os.path.join(output_dir, PARQUET_DATASET_DIR, f"crawl={crawl_id}", f"day={day}")
+        staged_path = staged_template.format(day=day)
+        table = pa.Table.from_pylist(day_rows, schema=NEWS_SCHEMA)
+        pq.write_table(table, staged_path, row_group_size=ROW_GROUP_SIZE, compression="zstd")
+        parts.append((staged_path, os.path.join(partition, f"part-{stem}.parquet"), len(day_rows)))
+    return parts
+
+
+def commit_partitions(parts):
+    """Publica las partes de write_partitions (rename atómico a su partición)."""
+    for staged_path, final_path, _ in parts:
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(staged_path, final_path)
+
+
+def compact_files(paths, output_path):
+    """Copia varias partes a un solo archivo, en row groups de hasta ROW_GROUP_SIZE filas."""
+    buffered = []
+    buffered_rows = 0
+    with pq.ParquetWriter(output_path, NEWS_SCHEMA, compression="zstd") as writer:
+        for path in paths:
+            # partitioning=None: crawl y day siguen solo en la ruta
+            table = pq.read_table(path, schema=NEWS_SCHEMA, partitioning=None)
+            buffered.append(table)
+            buffered_rows += table.num_rows
+            if buffered_rows >= ROW_GROUP_SIZE:
+                writer.write_table(pa.concat_tables(buffered), row_group_size=ROW_GROUP_SIZE)
+                buffered = []
+                buffered_rows = 0
+        if buffered:
+            writer.write_table(pa.concat_tables(buffered), row_group_size=ROW_GROUP_SIZE)
+
+
+class PartitionRoller:
+    """
+    Junta las partes por archivo de origen que publicó este proceso en un
+    archivo por partición (crawl × día). Las partes ya están publicadas: si el
+    proceso muere antes de compactar no se pierde nada, solo quedan pequeñas.
+
+    Al compactar, las partes se ocultan (.part-...compacting-<etiqueta>) antes
+    de publicar el archivo nuevo y se borran después; recover_compactions
+    termina o deshace una compactación interrumpida.
+    """
+
+    def __init__(self, staged_template, roll_rows=ROLL_ROWS):
+        self.staged_template = staged_template  # con {seq}
+        self.roll_rows = roll_rows
+        self.run_id = f"{socket.gethostname()}_{os.getpid()}_{int(time.time())}"
+        self.seq = 0
+        self.pending = defaultdict(list)  # partición -> [parte publicada]
+        self.rows = defaultdict(int)
+
+    def add(self, parts):
+        """Registra las partes publicadas de un archivo y compacta las particiones que llegan al umbral."""
+        for _, final_path, rows in parts:
+            partition = os.path.dirname(final_path)
+            if final_path in self.pending[partition]:
+                continue
+            self.pending[partition].append(final_path)
+            self.rows[partition] += rows
+            if self.rows[partition] >= self.roll_rows:
+                self.roll(partition)
+
+    def flush(self):
+        """Compacta lo pendiente de todas las particiones (al terminar)."""
+        for partition in list(self.pending):
+            self.roll(partition)
+
+    def roll(self, partition):
+        paths = self.pending.pop(partition)
+        self.rows.pop(partition)
+        if len(paths) < 2:
+            return
+        self.seq += 1
+        tag = f"{self.run_id}_{self.seq}"
+        staged_path = self.staged_template.format(seq=self.seq)
+        try:
+            compact_files(paths, staged_path)
+            hidden = []
+            try:
+                for path in paths:
+                    hidden_path = os.path.join(partition, f".{os.path.basename(path)}{COMPACTING_MARK}{tag}")
+                    os.rename(path, hidden_path)
+                    hidden.append((hidden_path, path))
+            except OSError:
+                for hidden_path, path in hidden:
+                    os.rename(hidden_path, path)
+                raise
+            os.replace(staged_path, os.path.join(partition, f"part-{tag}.parquet"))
+        except BaseException:
+            if os.path.exists(staged_path):
+                os.remove(staged_path)
+            raise
+        for hidden_path, _ in hidden:
+            os.remove(hidden_path)
+
+
+def recover_compactions(dataset_dir, max_age=None):
+    """
+    Termina las compactaciones interrumpidas: si el archivo compactado llegó a
+    publicarse se borran sus partes ocultas y, si no, vuelven a su nombre.
+    Sin `max_age` solo revisa las de este host (restos de una ejecución
+    anterior del pod); con `max_age`, las de cualquier host ocultas hace más
+    de `max_age` segundos.
+    """
+    host = socket.gethostname()
+    now = time.time()
+    for directory, _, names in os.walk(dataset_dir):
+        for name in names:
+            if not name.startswith(".") or COMPACTING_MARK not in name:
+                continue
+            original, tag = name[1:].split(COMPACTING_MARK, 1)
+            path = os.path.join(directory, name)
+            try:
+                if max_age is not None:
+                    # El rename que la ocultó actualiza ctime
+                    if now - os.stat(path).st_ctime <= max_age:
+                        continue
+                elif tag.split("_", 1)[0] != host:
+                    continue
+                if os.path.exists(os.path.join(directory, f"part-{tag}.parquet")):
+                    os.remove(path)
+                else:
+                    os.rename(path, os.path.join(directory, original))
+            except FileNotFoundError:
+                pass
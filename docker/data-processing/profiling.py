@@ -0,0 +1,151 @@
+"""
+Instrumentación del camino caliente de process_warc_file.
+
+StageStats acumula, por archivo, segundos y bytes de cada etapa:
+- inflate:  descompresión gzip (lecturas del stream descomprimido);
+- parse:    ArchiveIterator (cabeceras WARC/HTTP);
+- extract:  lectura del cuerpo + HTML -> texto (o texto WET);
+- keywords: conteo de palabras clave;
+- dedup:    SimHash + consultas al índice;
+- write:    escritura de filas CSV / archivos Parquet.
+La descompresión ocurre en medio de las otras etapas (el cuerpo se lee en
+streaming), así que cada etapa descuenta el tiempo de inflate que ocurrió
+dentro de ella: las etapas no se solapan y suman casi todo el tiempo del archivo.
+
+Perfilado opcional por proceso con PROFILER:
+- "cprofile": cProfile determinista, acumulado en profile_<host>_<pid>.pstats;
+- "sampling": muestreo estadístico con SIGPROF cada PROFILER_INTERVAL_MS ms de
+  CPU, en formato "collapsed stacks" (profile_<host>_<pid>.folded), listo para
+  flamegraph.pl o speedscope.
+Ambos se vuelcan en PROFILER_OUTPUT_DIR tras cada archivo. Pensado para
+activarse en una sola réplica: cProfile puede duplicar el tiempo de proceso.
+"""
+import cProfile
+import os
+import signal
+import socket
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+STAGES = ["inflate", "parse", "extract", "keywords", "dedup", "write"]
+
+PROFILER = os.environ.get("PROFILER", "")
+PROFILER_OUTPUT_DIR = Path(os.environ.get("PROFILER_OUTPUT_DIR", "/data/processed/profiles"))
+PROFILER_INTERVAL_MS = float(os.environ.get("PROFILER_INTERVAL_MS", "10"))
+
+
+class StageStats:
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.bytes = dict.fromkeys(STAGES, 0)
+
+    def add(self, stage, seconds, nbytes=0):
+        self.seconds[stage] += seconds
+        self.bytes[stage] += nbytes
+
+    def start(self):
+        """Marca de inicio para stop(); guarda el inflate acumulado hasta ahora."""
+        return time.perf_counter(), self.seconds["inflate"]
+
+    def stop(self, stage, mark, nbytes=0):
+        """Suma a `stage` el tiempo desde `mark` sin el inflate ocurrido en el medio."""
+        start, inflate_seconds = mark
+        self.seconds[stage] += time.perf_counter() - start - (self.seconds["inflate"] - inflate_seconds)
+        self.bytes[stage] += nbytes
+
+    def to_dict(self):
+        return {stage: {"seconds": round(self.seconds[stage], 6), "bytes": self.bytes[stage]} for stage in STAGES}
+
+
+def empty_totals():
+    return {stage: {"seconds": 0.0, "bytes": 0} for stage in STAGES}
+
+
+def merge_stages(totals, stages):
+    """Acumula un StageStats.to_dict() (p. ej. el resultado de un archivo) en totals."""
+    for stage, values in stages.items():
+        totals[stage]["seconds"] += values["seconds"]
+        totals[stage]["bytes"] += values["bytes"]
+
+
+class TimedReader:
+    """Envuelve el stream descomprimido y cuenta tiempo y bytes de cada read() como inflate."""
+
+    def __init__(self, raw, stats):
+        self._raw = raw
+        self._stats = stats
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self._raw.read(size)
+        self._stats.add("inflate", time.perf_counter() - start, len(data))
+        return data
+
+
+class SamplingProfiler:
+    """Muestras de la pila del hilo principal en cada SIGPROF (tiempo de CPU del proceso)."""
+
+    def __init__(self, interval_ms):
+        self.interval = interval_ms / 1000
+        self.samples = Counter()
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        self.samples[";".join(reversed(stack))] += 1
+
+    def enable(self):
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def disable(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+
+    def dump_stats(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        os.replace(tmp_path, path)
+
+
+_profiler = None
+_profiler_pid = None
+
+
+def _get_profiler():
+    """Perfilador del proceso actual; acumula entre archivos."""
+    global _profiler, _profiler_pid
+    if _profiler is None or _profiler_pid != os.getpid():
+        if PROFILER == "cprofile":
+            _profiler = cProfile.Profile()
+        elif PROFILER == "sampling":
+            _profiler = SamplingProfiler(PROFILER_INTERVAL_MS)
+        else:
+            print(f"PROFILER desconocido: {PROFILER} (usar cprofile o sampling)")
+            return None
+        _profiler_pid = os.getpid()
+    return _profiler
+
+
+@contextmanager
+def profiled():
+    """Perfila el bloque si PROFILER está definido y vuelca lo acumulado al salir."""
+    profiler = _get_profiler() if PROFILER else None
+    if profiler is None:
+        yield
+        return
+
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        PROFILER_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+        extension = "pstats" if PROFILER == "cprofile" else "folded"
+        profiler.dump_stats(str(PROFILER_OUTPUT_DIR / f"profile_{socket.gethostname()}_{os.getpid()}.{extension}"))
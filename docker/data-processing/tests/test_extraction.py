@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction import available_backends, extract_text  # noqa: E402
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_form_content_is_kept(backend):
+    # Páginas ASP.NET: todo el cuerpo va dentro de <form>
+    assert extract_text("<p>a</p><form><p>ARTICLE BODY</p></form>", backend=backend) == "a ARTICLE BODY"
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_form_controls_are_dropped(backend):
+    html_content = ("<form><input name=q value=buscar><p>cuerpo</p>"
+                    "<select><option>Bogotá</option></select><textarea>comentario</textarea>"
+                    "<button>Enviar</button></form>")
+    assert extract_text(html_content, backend=backend) == "cuerpo"
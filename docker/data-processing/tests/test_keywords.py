@@ -0,0 +1,49 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import keywords  # noqa: E402
+from keywords import KeywordMatcher, fold  # noqa: E402
+
+pytest.importorskip("ahocorasick")
+
+CASES = [
+    "La reforma tributarias del gobierno",
+    "Reforma tributaria, reforma y reformas: la DIAN y el IVA.",
+    "El dólar y los dólares; la TRM subió. Petróleo Brent y WTI.",
+    "bolsa de valoresx bolsa de valores bolsa_de valores",
+    "déficit fiscal_ deficit fiscal deficitfiscal",
+    "tasa de cambio del peso colombiano frente al euro",
+    "",
+]
+
+
+def _random_texts(count, seed=0):
+    rng = random.Random(seed)
+    words = list(keywords._KEYWORDS) + ["reformas", "tributarias", "colcapx", "de", "la", "valores", "fiscal"]
+    separators = [" ", "  ", ", ", ". ", "-", "_", "/", "\n", "x", "1"]
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(1, 40)):
+            parts.append(rng.choice(words))
+            parts.append(rng.choice(separators))
+        yield "".join(parts)
+
+
+@pytest.mark.parametrize("text", CASES + list(_random_texts(500)))
+def test_backends_match_identically(text):
+    folded = fold(text)
+    automaton = KeywordMatcher(keywords._KEYWORDS, backend="ahocorasick")
+    regex = KeywordMatcher(keywords._KEYWORDS, backend="regex")
+    assert list(automaton.iter_matches(folded)) == list(regex.iter_matches(folded))
+
+
+def test_longest_keyword_falls_back_to_shorter():
+    matcher = KeywordMatcher(keywords._KEYWORDS, backend="ahocorasick")
+    # "reforma tributaria" no cierra palabra: cuenta "reforma" (término general)
+    assert list(matcher.iter_matches(fold("reforma tributarias"))) == [None]
+    assert list(matcher.iter_matches(fold("reforma tributaria"))) == ["fiscal"]
@@ -0,0 +1,113 @@
+"""
+Espera de eventos en /data/raw: inotify (vía ctypes, sin dependencias) con
+respaldo por polling.
+
+`wait(timeout)` retorna en cuanto ocurre algo relevante:
+- un archivo llega al directorio (IN_MOVED_TO, que es como publica la ingesta
+  con temp+rename, o IN_CLOSE_WRITE);
+- alguien llama a `wake()` (p. ej. al terminar un archivo en el pool);
+- vence el timeout.
+
+inotify solo ve los cambios hechos desde el mismo nodo. En volúmenes de red
+(NFS/EFS) los archivos que publica otro pod no generan eventos, así que el
+llamador debe volver a listar el directorio cada tanto igualmente; ahí
+conviene WATCH_MODE=poll.
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class InotifyWatcher:
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falló")
+        wd = libc.inotify_add_watch(self._fd, os.fsencode(str(directory)), IN_MOVED_TO | IN_CLOSE_WRITE)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"inotify_add_watch falló para {directory}")
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+
+    def wake(self):
+        try:
+            os.write(self._wake_w, b"x")
+        except OSError:
+            pass
+
+    def wait(self, timeout):
+        """Retorna la lista de nombres que llegaron (vacía si fue wake() o timeout)."""
+        readable, _, _ = select.select([self._fd, self._wake_r], [], [], timeout)
+        if self._wake_r in readable:
+            try:
+                while os.read(self._wake_r, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+        if self._fd not in readable:
+            return []
+
+        names = []
+        try:
+            while True:
+                data = os.read(self._fd, 64 * 1024)
+                offset = 0
+                while offset < len(data):
+                    _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                    offset += _EVENT_HEADER.size
+                    names.append(os.fsdecode(data[offset:offset + length].rstrip(b"\0")))
+                    offset += length
+        except BlockingIOError:
+            pass
+        return names
+
+    def close(self):
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            os.close(fd)
+
+
+class PollingWatcher:
+    """Sin eventos del sistema de archivos: el llamador vuelve a listar tras cada espera."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._event = threading.Event()
+
+    def wake(self):
+        self._event.set()
+
+    def wait(self, timeout):
+        self._event.wait(min(timeout, self.interval))
+        self._event.clear()
+        return []
+
+    def close(self):
+        pass
+
+
+def create_watcher(directory, mode, poll_interval):
+    """mode: auto (inotify si está disponible), inotify o poll."""
+    if mode in ("auto", "inotify"):
+        try:
+            watcher = InotifyWatcher(directory)
+            logging.info(f"Detectando archivos nuevos en {directory} con inotify")
+            return watcher
+        except (OSError, AttributeError) as e:
+            if mode == "inotify":
+                raise
+            logging.warning(f"inotify no disponible ({e}); usando polling cada {poll_interval}s")
+    return PollingWatcher(poll_interval)
@@ -1,18 +1,37 @@
 import gzip
+import json
 import re
 from warcio.archiveiterator import ArchiveIterator
 import csv
 import os
-from io import BytesIO
-
-# Palabras clave para filtrar contenido económico/noticioso relevante
-KEYWORDS_ECONOMIA = [
-    "economía", "economia", "bolsa", "mercado", "inflación", "inflacion",
-    "dólar", "dolar", "precio", "inversión", "inversion", "banco",
-    "finanzas", "pib", "crecimiento", "exportación", "importación",
-    "colcap", "empleo", "desempleo", "petróleo", "petroleo",
-    "gobierno", "ministerio", "reforma", "impuesto", "tributaria"
+import shutil
+import socket
+import time
+from urllib.parse import urlsplit
+
+from aggregates import FileAggregate, publish as publish_aggregate
+from dedup import DEDUP_MODE, mark_duplicates
+from extraction import MAX_RECORD_BYTES, extract_from_stream, extract_text, is_html_content_type
+from keywords import CATEGORY_COLUMNS, RELEVANCE_FILTER, keyword_counts
+from parquet_output import commit_partitions, parquet_available, parse_warc_date, write_partitions
+from profiling import StageStats, TimedReader, profiled
+
+# Secciones de noticias (las mismas SECCIONES_RELEVANTES por las que filtra la
+# ingesta); la sección de un registro es la primera que aparece en su URL
+NEWS_SECTIONS = [
+    "economia", "negocios", "finanzas", "mercados", "empresas", "politica", "business", "money",
+    "inversion", "mis-finanzas", "ahorro", "internacional", "mundo", "globoeconomia",
+    "opinion", "analisis", "editorial", "energia", "petroleo", "minas", "infraestructura", "vivienda",
+    "agro", "campo", "tecnologia", "emprendimiento", "legal", "juridica",
 ]
+_SECTION_PATTERN = re.compile("/(%s)/" % "|".join(re.escape(s) for s in NEWS_SECTIONS), re.IGNORECASE)
+
+# Formato de salida: "csv" (news_worker_<host>_<pid>.csv) o "parquet" (dataset
+# particionado por crawl y día, requiere pyarrow)
+OUTPUT_FORMAT = os.environ.get("OUTPUT_FORMAT", "csv")
+
+# Salida de cada intento, antes de publicarse: <host>_<pid>_<archivo>.<ext>
+STAGING_DIR = ".staging"
 
 def extract_crawl_id(filename):
     """Extrae el crawl ID del nombre del archivo."""
@@ -24,101 +43,360 @@ def extract_crawl_id(filename):
         return match.group(1)
     return "unknown"
 
-def is_relevant_content(text):
+def is_relevant_content(text, min_matches=1):
     """Verifica si el contenido es relevante (contiene palabras clave económicas)."""
-    text_lower = text.lower()
-    return any(keyword in text_lower for keyword in KEYWORDS_ECONOMIA)
+    relevance, _ = keyword_counts(text)
+    return relevance >= min_matches
+
+def url_domain(url):
+    """Dominio de una URL sin el prefijo www."""
+    host = urlsplit(url or "").hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+def url_section(url):
+    """Sección de la URL (p. ej. "economia"); si no es una conocida, el primer tramo de la ruta."""
+    path = urlsplit(url or "").path
+    match = _SECTION_PATTERN.search(path)
+    if match:
+        return match.group(1).lower()
+    return next((part.lower() for part in path.split("/")[:-1] if part), "")
 
 def extract_text_from_html(html_content):
-    """Extrae texto limpio de contenido HTML."""
-    # Remover scripts y estilos
-    import re
-    text = re.sub(r'<script[^>]*>.*?</script>', '', html_content, flags=re.DOTALL | re.IGNORECASE)
-    text = re.sub(r'<style[^>]*>.*?</style>', '', text, flags=re.DOTALL | re.IGNORECASE)
-    # Remover tags HTML
-    text = re.sub(r'<[^>]+>', ' ', text)
-    # Limpiar espacios múltiples
-    text = re.sub(r'\s+', ' ', text).strip()
-    # Decodificar entidades HTML básicas
-    text = text.replace('&nbsp;', ' ').replace('&amp;', '&')
-    text = text.replace('&lt;', '<').replace('&gt;', '>')
-    return text
+    """Extrae texto limpio de contenido HTML (backend según EXTRACTION_BACKEND)."""
+    return extract_text(html_content)
 
-def process_warc_file(warc_path, output_dir):
+def bundle_index_path(warc_path):
+    """Ruta del índice de offsets que acompaña a un bundle multi-registro."""
+    return f"{warc_path}.idx"
+
+
+class _GzipMember(gzip.GzipFile):
     """
-    Procesa un archivo WARC (segmento individual o archivo completo).
-    Compatible tanto con segmentos del Index API como con archivos WET completos.
+    Miembro gzip de un bundle. warcio toma EOFError como fin del archivo, así
+    que un miembro truncado se reporta como BadGzipFile para no perderlo en silencio.
     """
-    filename = os.path.basename(warc_path)
-    crawl_id = extract_crawl_id(filename)
-    
-    # Create worker-specific CSV file to avoid race conditions
-    worker_id = os.getpid()
-    output_file = os.path.join(output_dir, f"news_worker_{worker_id}.csv")
-    write_header = not os.path.exists(output_file)
 
-    records_processed = 0
-    records_saved = 0
+    def read(self, size=-1):
+        try:
+            return super().read(size)
+        except EOFError as e:
+            raise gzip.BadGzipFile(f"miembro truncado: {e}") from e
 
-    try:
-        with gzip.open(warc_path, "rb") as stream, \
-             open(output_file, "a", newline="", encoding="utf-8") as csvfile:
 
-            writer = csv.writer(csvfile)
+class _MemberReader:
+    """Vista de solo lectura sobre [offset, offset+length) de un archivo abierto."""
+
+    def __init__(self, f, offset, length):
+        self._f = f
+        self._pos = offset
+        self._end = offset + length
 
-            if write_header:
-                writer.writerow(["date", "crawl", "text"])
+    def read(self, size=-1):
+        remaining = self._end - self._pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return b""
+        self._f.seek(self._pos)
+        data = self._f.read(size)
+        self._pos += len(data)
+        return data
 
-            for record in ArchiveIterator(stream):
-                records_processed += 1
+
+def iter_warc_records(warc_path, stats=None):
+    """
+    Itera los registros de un archivo WARC en cualquiera de los dos formatos:
+    - segmento individual (o WET completo): se lee de corrido;
+    - bundle multi-miembro con índice `.idx`: cada miembro gzip se lee por su
+      offset, de modo que un miembro dañado solo descarta ese registro.
+    En ambos casos el contenido se lee en streaming, sin cargar el miembro
+    completo en memoria. Con `stats` (StageStats), el tiempo de descompresión
+    se cuenta como etapa inflate.
+    """
+    def timed(stream):
+        return stream if stats is None else TimedReader(stream, stats)
+
+    index_path = bundle_index_path(warc_path)
+    if not os.path.exists(index_path):
+        with gzip.open(warc_path, "rb") as stream:
+            for record in ArchiveIterator(timed(stream)):
+                yield record
+        return
+
+    with open(warc_path, "rb") as bundle, open(index_path, "r", encoding="utf-8") as index:
+        for line in index:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            # Se descomprime aquí (y no dentro de warcio) para poder medir el inflate
+            member = _GzipMember(fileobj=_MemberReader(bundle, entry["offset"], entry["length"]))
+            try:
+                for record in ArchiveIterator(timed(member)):
+                    yield record
+            except Exception as e:
+                print(f"Miembro dañado {entry.get('segment')} en {os.path.basename(warc_path)}: {e}")
+
+
+def iter_news(warc_path, stats=None):
+    """
+    Genera (date, url, text, relevance, kw_counts) de cada registro con texto
+    suficiente y, si RELEVANCE_FILTER > 0, con al menos esa cantidad de
+    palabras clave. Los registros descartados se entregan como None. Acumula
+    los tiempos de parse, extract y keywords en `stats`.
+    """
+    stats = stats if stats is not None else StageStats()
+    records = iter_warc_records(warc_path, stats)
+    while True:
+        mark = stats.start()
+        record = next(records, None)
+        if record is None:
+            break
+        stats.stop("parse", mark, record.length or 0)
+
+        # Manejar tanto response (WARC) como conversion (WET)
+        if record.rec_type == "response":
+            # Es un registro WARC con HTML
+            date = record.rec_headers.get_header("WARC-Date")
+            content_type = record.http_headers.get_header("Content-Type") if record.http_headers else None
+
+            # Descartar PDFs, imágenes, JSON... sin leer el cuerpo
+            if not is_html_content_type(content_type):
+                yield None
+                continue
+
+            # Extraer texto del HTML leyendo por bloques, con el charset de la
+            # página y como máximo MAX_RECORD_BYTES
+            mark = stats.start()
+            try:
+                text, _ = extract_from_stream(record.content_stream(), content_type)
+            except Exception:
+                text = None
+            stats.stop("extract", mark, record.payload_length if record.payload_length > 0 else 0)
+            if text is None:
+                yield None
+                continue
                 
-                # Manejar tanto response (WARC) como conversion (WET)
-                if record.rec_type == "response":
-                    # Es un registro WARC con HTML
-                    date = record.rec_headers.get_header("WARC-Date")
-                    content = record.content_stream().read()
-                    
-                    if not content:
-                        continue
-                    
-                    # Extraer texto del HTML
-                    try:
-                        html = content.decode("utf-8", errors="ignore")
-                        text = extract_text_from_html(html)
-                    except:
-                        continue
-                        
-                elif record.rec_type == "conversion":
-                    # Es un registro WET (texto plano)
-                    date = record.rec_headers.get_header("WARC-Date")
-                    content = record.content_stream().read()
-                    
-                    if not content:
-                        continue
-                    
-                    text = content.decode("utf-8", errors="ignore").strip()
-                else:
-                    continue
+        elif record.rec_type == "conversion":
+            # Es un registro WET (texto plano)
+            date = record.rec_headers.get_header("WARC-Date")
+            mark = stats.start()
+            content = record.content_stream().read(MAX_RECORD_BYTES)
+            text = content.decode("utf-8", errors="ignore").strip()
+            stats.stop("extract", mark, len(content))
+            
+            if not content:
+                yield None
+                continue
+        else:
+            yield None
+            continue
+
+        # Filtro por longitud mínima
+        if len(text) < 200:
+            yield None
+            continue
+        
+        # Conteo de palabras clave en una sola pasada. El filtro por relevancia
+        # es opcional: la ingesta via CC Index API ya filtra por secciones
+        # económicas (/economia/, etc.)
+        mark = stats.start()
+        relevance, kw_counts = keyword_counts(text)
+        stats.stop("keywords", mark, len(text))
+        if relevance < RELEVANCE_FILTER:
+            yield None
+            continue
+
+        yield date, record.rec_headers.get_header("WARC-Target-URI"), text, relevance, kw_counts
+
+
+def csv_output_path(output_dir, header):
+    """
+    CSV del proceso actual. Si ya existe uno con otras columnas (p. ej. tras
+    cambiar DEDUP_MODE), se rota a news_worker_<host>_<pid>_<n>.csv para no
+    mezclar esquemas dentro de un mismo archivo. El host va en el nombre porque
+    en cada pod el proceso principal suele tener el mismo pid.
+    """
+    worker_id = f"{socket.gethostname()}_{os.getpid()}"
+    expected = ",".join(header)
+    candidate = 0
+    while True:
+        suffix = f"_{candidate}" if candidate else ""
+        path = os.path.join(output_dir, f"news_worker_{worker_id}{suffix}.csv")
+        if not os.path.exists(path):
+            return path, True
+        with open(path, "r", encoding="utf-8") as f:
+            if f.readline().rstrip("\r\n") == expected:
+                return path, False
+        candidate += 1
+
+
+def staging_path(output_dir, source_name, suffix):
+    return os.path.join(output_dir, STAGING_DIR, f"{socket.gethostname()}_{os.getpid()}_{source_name}.{suffix}")
 
-                # Filtro por longitud mínima
-                if len(text) < 200:
+
+def discard_staged(output_dir, source_name=None, max_age=None):
+    """
+    Borra salida de intentos no publicados: la de `source_name` en este host
+    (intento fallido o con el lease perdido), toda la de este host si no se da
+    `source_name` (restos de una ejecución anterior del pod) o, con `max_age`,
+    la de cualquier host sin modificar hace más de `max_age` segundos.
+    """
+    directory = os.path.join(output_dir, STAGING_DIR)
+    host = socket.gethostname()
+    now = time.time()
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        parts = entry.name.split("_", 2)
+        if len(parts) < 3:
+            continue
+        try:
+            if max_age is not None:
+                if now - entry.stat().st_mtime <= max_age:
                     continue
-                
-                # NOTA: El filtro de keywords está desactivado porque la ingesta
-                # via CC Index API ya filtra por secciones económicas (/economia/, etc.)
-                # Si deseas filtrado adicional, descomenta las siguientes líneas:
-                # if not is_relevant_content(text):
-                #     continue
+            elif parts[0] != host or (source_name and not parts[2].startswith(f"{source_name}.")):
+                continue
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def commit_output(result, output_dir):
+    """
+    Publica la salida de un intento exitoso. La llama main.py con el lease
+    vigente, así que cada archivo de origen queda en la salida una sola vez:
+    - CSV: las filas del intento se agregan al CSV de este proceso;
+    - Parquet: cada parte pasa a su nombre final (y reemplaza la de un intento anterior);
+    - el agregado diario del archivo va a su sidecar (ver aggregates.py).
+    """
+    output = result.get("output")
+    if output is None:
+        return
+    if output["format"] == "parquet":
+        commit_partitions(output["parts"])
+    else:
+        _commit_csv(output, output_dir)
+    publish_aggregate(output_dir, output["source"], output["aggregate"])
+
+
+def _commit_csv(output, output_dir):
+    target, write_header = csv_output_path(output_dir, output["header"])
+    with open(target, "a", newline="", encoding="utf-8") as csvfile:
+        if write_header:
+            csv.writer(csvfile).writerow(output["header"])
+        with open(output["path"], "r", newline="", encoding="utf-8") as staged:
+            shutil.copyfileobj(staged, csvfile)
+    os.remove(output["path"])
 
-                writer.writerow([date, crawl_id, text])
-                records_saved += 1
 
+def _write_csv(items, staged_path, header, crawl_id, counts, aggregate, stats):
+    with open(staged_path, "w", newline="", encoding="utf-8") as csvfile:
+
+        writer = csv.writer(csvfile)
+
+        for item in items:
+            counts["processed"] += 1
+            if item is None:
+                continue
+            date, url, text, relevance, kw_counts, duplicate_of = item
+            if duplicate_of is not None and DEDUP_MODE == "drop":
+                continue
+            domain, section = url_domain(url), url_section(url)
+            row = [date, crawl_id, domain, section, text, relevance] + [kw_counts[column] for column in CATEGORY_COLUMNS]
+            if DEDUP_MODE == "flag":
+                row.append(int(duplicate_of is not None))
+            start = time.perf_counter()
+            writer.writerow(row)
+            stats.add("write", time.perf_counter() - start, len(text))
+            counts["saved"] += 1
+            if duplicate_of is None and date:
+                aggregate.add(date[:10], crawl_id, domain, section, relevance, kw_counts)
+
+
+def _write_parquet(items, output_dir, crawl_id, counts, aggregate, stats):
+    rows = []
+    for item in items:
+        counts["processed"] += 1
+        if item is None:
+            continue
+        date, url, text, relevance, kw_counts, duplicate_of = item
+        if duplicate_of is not None and DEDUP_MODE == "drop":
+            continue
+        rows.append({
+            "date": parse_warc_date(date),
+            "url": url,
+            "domain": url_domain(url),
+            "section": url_section(url),
+            "length": len(text),
+            "relevance": relevance,
+            **kw_counts,
+            "duplicate_of": duplicate_of,
+            "text": text,
+        })
+        counts["saved"] += 1
+        if duplicate_of is None and date:
+            aggregate.add(date[:10], crawl_id, rows[-1]["domain"], rows[-1]["section"], relevance, kw_counts)
+    start = time.perf_counter()
+    parts = write_partitions(rows, output_dir, crawl_id, aggregate.source_name,
+                             staging_path(output_dir, aggregate.source_name, "{day}.parquet"))
+    stats.add("write", time.perf_counter() - start, sum(row["length"] for row in rows))
+    return parts
+
+
+def process_warc_file(warc_path, output_dir):
+    """
+    Procesa un archivo WARC (segmento individual, bundle o archivo completo).
+    Compatible con segmentos y bundles del Index API y con archivos WET completos.
+    La salida es CSV por proceso o Parquet particionado según OUTPUT_FORMAT;
+    los casi duplicados se descartan o marcan según DEDUP_MODE. La salida queda
+    en STAGING_DIR hasta que commit_output la publica: un intento que falla a
+    mitad de archivo (o que perdió el lease) no deja filas que luego se repitan.
+    El resultado incluye lo que hay que publicar ("output"), el tiempo por
+    etapa (ver profiling.py) y el proceso que lo hizo.
+    """
+    filename = os.path.basename(warc_path)
+    crawl_id = extract_crawl_id(filename)
+    counts = {"processed": 0, "saved": 0, "duplicates": 0}
+
+    use_parquet = OUTPUT_FORMAT == "parquet"
+    if use_parquet and not parquet_available():
+        print("OUTPUT_FORMAT=parquet pero pyarrow no está instalado; usando CSV")
+        use_parquet = False
+
+    # Conteos diarios del archivo; se publican con la salida solo si todo salió bien
+    aggregate = FileAggregate(filename)
+    stats = StageStats()
+    start = time.perf_counter()
+
+    os.makedirs(os.path.join(output_dir, STAGING_DIR), exist_ok=True)
+    try:
+        with profiled():
+            # Los casi duplicados (otra copia del mismo artículo) se resuelven antes de escribir
+            items = mark_duplicates(iter_news(warc_path, stats), crawl_id, counts, stats)
+            if use_parquet:
+                output = {"format": "parquet",
+                          "parts": _write_parquet(items, output_dir, crawl_id, counts, aggregate, stats)}
+            else:
+                header = ["date", "crawl", "domain", "section", "text", "relevance"] + CATEGORY_COLUMNS
+                if DEDUP_MODE == "flag":
+                    header.append("duplicate")
+                output = {"format": "csv", "header": header, "path": staging_path(output_dir, filename, "csv")}
+                _write_csv(items, output["path"], header, crawl_id, counts, aggregate, stats)
+            output.update(source=filename, aggregate=aggregate.rows())
     except Exception as e:
         print(f"Error procesando {filename}: {e}")
-        return {"saved": 0, "processed": 0, "crawl": crawl_id, "error": True}
+        discard_staged(output_dir, filename)
+        return {"saved": 0, "processed": 0, "duplicates": 0, "crawl": crawl_id, "error": True}
 
-    print(f"[{crawl_id}] {records_saved}/{records_processed} registros guardados")
-    return {"saved": records_saved, "processed": records_processed, "crawl": crawl_id, "error": False}
+    seconds = time.perf_counter() - start
+    print(f"[{crawl_id}] {counts['saved']}/{counts['processed']} registros guardados "
+          f"({counts['duplicates']} duplicados) en {seconds:.2f}s")
+    return {"saved": counts["saved"], "processed": counts["processed"], "duplicates": counts["duplicates"],
+            "crawl": crawl_id, "error": False, "output": output,
+            "worker": f"{socket.gethostname()}:{os.getpid()}", "seconds": seconds,
+            "bytes": os.path.getsize(warc_path), "stages": stats.to_dict()}
 
 
 def process_wet_file(wet_path, output_dir):
@@ -130,6 +408,6 @@ if __name__ == "__main__":
     # Test con archivo de ejemplo
     import sys
     if len(sys.argv) > 1:
-        process_warc_file(sys.argv[1], "/data/processed")
+        commit_output(process_warc_file(sys.argv[1], "/data/processed"), "/data/processed")
     else:
         print("Uso: python worker.py <archivo.warc.gz>")